@@ -0,0 +1,328 @@
+"""
+Alert engine benchmark (offline, synthetic data).
+
+    python -m benchmarks.alerts_benchmark --sizes 10 50 100 300 --windows 3
+
+Builds synthetic findByPrescription rows of any size and reports
+latency percentiles of alert_service.find_alerts (total and per rule) and
+alert_interaction_service.find_relations (total and per stage), with and
+without CPOE. Allergies and active relations are stubbed (no database).
+"""
+
+import argparse
+import json
+import random
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from models.prescription import Frequency, PrescriptionDrug, DrugAttributes, Drug
+from services import alert_service, alert_interaction_service
+
+# same columns as PrescriptionDrug.findByPrescription rows
+DrugRow = namedtuple(
+    "DrugRow",
+    "prescription_drug drug measure_unit frequency not_used score drug_attributes notes prevnotes status expire substance period_cpoe prescription_date measure_unit_convert_factor substance_handling_types",
+)
+
+RELATION_STAGES = [
+    "_get_relation_item",
+    "_get_candidate_pairs",
+    "_get_active_relations",
+    "_add_relation_alerts",
+]
+
+
+def synthetic_drug_list(size: int, windows: int = 3, seed: int = 0):
+    """
+    Drug rows (findByPrescription) spread over overlapping validity windows
+    """
+    rnd = random.Random(seed)
+    base_date = datetime(2024, 1, 10)
+
+    fasting = Frequency()
+    fasting.id = 1
+    fasting.fasting = False
+
+    def sometimes(value, ratio=0.1):
+        return value if rnd.random() < ratio else None
+
+    drug_list = []
+    for i in range(1, size + 1):
+        window = rnd.randrange(windows)
+        # same drug prescribed in more than one window / more than once
+        sctid = str(rnd.randrange(max(size // 2, 1)) + 1) + "11111"
+        tube = sometimes(True)
+
+        drug = Drug()
+        drug.id = i
+        drug.name = f"Drug {i}" if rnd.random() < 0.95 else f"Vancomicina {i}"
+        drug.sctid = sctid
+
+        prescription_drug = PrescriptionDrug()
+        prescription_drug.id = i
+        prescription_drug.source = "Medicamentos"
+        prescription_drug.idDrug = int(sctid)
+        prescription_drug.frequency = rnd.choice([1, 2, 3, 4, 66])
+        prescription_drug.doseconv = rnd.choice([0.5, 1, 10, 100, 500])
+        prescription_drug.tube = tube
+        prescription_drug.allergy = sometimes("S", 0.02)
+        prescription_drug.interval = rnd.choice(["8", "8 20", "24"])
+        prescription_drug.intravenous = rnd.random() < 0.3
+        prescription_drug.group = str(rnd.randrange(5)) if rnd.random() < 0.2 else None
+        prescription_drug.solutionGroup = False
+        prescription_drug.period = rnd.choice([None, 1, 5, 15])
+
+        drug_attributes = DrugAttributes()
+        drug_attributes.idDrug = i
+        drug_attributes.idSegment = 1
+        drug_attributes.maxDose = sometimes(rnd.choice([10, 100, 1000]), 0.3)
+        drug_attributes.kidney = sometimes(rnd.choice([30, 60]))
+        drug_attributes.liver = sometimes(rnd.choice([40, 80]))
+        drug_attributes.platelets = sometimes(100000)
+        drug_attributes.elderly = sometimes(True)
+        drug_attributes.tube = tube
+        drug_attributes.pregnant = sometimes(rnd.choice(["D", "X"]))
+        drug_attributes.lactating = sometimes("3")
+        drug_attributes.fasting = sometimes(True)
+        drug_attributes.maxTime = sometimes(7)
+        drug_attributes.useWeight = rnd.random() < 0.2
+
+        drug_list.append(
+            DrugRow(
+                prescription_drug=prescription_drug,
+                drug=drug,
+                measure_unit=None,
+                frequency=sometimes(fasting, 0.5),
+                not_used=None,
+                score=None,
+                drug_attributes=drug_attributes,
+                notes=None,
+                prevnotes=None,
+                status=None,
+                expire=base_date + timedelta(days=window),
+                substance=None,
+                period_cpoe=0,
+                # cpoe: validity from prescription date to expire date
+                prescription_date=base_date + timedelta(days=window - rnd.randrange(2)),
+                measure_unit_convert_factor=1,
+                substance_handling_types=rnd.choice([[], [], ["maxDose"]]),
+            )
+        )
+
+    return drug_list
+
+
+def synthetic_exams():
+    return {
+        "age": 70,
+        "weight": 80,
+        "ckd": {"value": 45},
+        "swrtz2": {"value": None},
+        "swrtz1": {"value": None},
+        "tgp": {"value": 60},
+        "tgo": {"value": 30},
+        "plqt": {"value": 90000},
+    }
+
+
+def _stub_allergies(id_patient: int):
+    # same format as _get_allergies (sctid of a prescribed drug)
+    return [
+        {
+            "id": None,
+            "drug": "Allergy",
+            "sctid": 111111,
+            "intravenous": False,
+            "group": None,
+            "frequency": None,
+            "rx": True,
+        }
+    ]
+
+
+def _stub_active_relations(pairs: list):
+    # synthetic relation table: deterministic ~2% of the candidate pairs
+    active_relations = {}
+    for sctida, sctidb in pairs:
+        for kind in alert_interaction_service.RELATION_KINDS:
+            if zlib.crc32(f"{sctida}-{sctidb}-{kind}".encode()) % 50 != 0:
+                continue
+
+            active_relations[f"{sctida}-{sctidb}-{kind}"] = {
+                "sctida": int(sctida),
+                "sctidb": int(sctidb),
+                "kind": kind,
+                "text": "Synthetic relation",
+                "level": "high" if kind in ["it", "iy"] else None,
+            }
+
+    return active_relations
+
+
+def _timed(func, name: str, timings: dict):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+    return wrapper
+
+
+@contextmanager
+def _patched(module, attrs: dict):
+    original = {name: getattr(module, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(module, name, value)
+
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(module, name, value)
+
+
+def _timed_rules(timings: dict):
+    return [
+        rule._replace(alert=_timed(rule.alert, rule.alert_type.value, timings))
+        for rule in alert_service.ALERT_RULES
+    ]
+
+
+def percentiles(values: list, points=(50, 95, 99)):
+    values = sorted(values)
+    result = {}
+    for p in points:
+        # nearest rank
+        index = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+        result[f"p{p}"] = values[min(index, len(values) - 1)]
+
+    return result
+
+
+def _summary(samples: list):
+    names = []
+    for sample in samples:
+        for name in sample:
+            if name not in names:
+                names.append(name)
+
+    return {
+        name: percentiles([sample.get(name, 0) for sample in samples]) for name in names
+    }
+
+
+def run_alerts(drug_list: list, repeat: int):
+    exams = synthetic_exams()
+    samples = []
+
+    for _ in range(repeat):
+        timings = {}
+        with _patched(alert_service, {"ALERT_RULES": _timed_rules(timings)}):
+            start = time.perf_counter()
+            alert_service.find_alerts(
+                drug_list=drug_list,
+                exams=exams,
+                dialisys=None,
+                pregnant=True,
+                lactating=True,
+                schedules_fasting=["8"],
+            )
+            timings["total"] = time.perf_counter() - start
+
+        samples.append(timings)
+
+    return _summary(samples)
+
+
+def run_relations(drug_list: list, is_cpoe: bool, repeat: int):
+    samples = []
+
+    for _ in range(repeat):
+        timings = {}
+        stubs = {
+            "_get_allergies": _stub_allergies,
+            "_get_active_relations": _stub_active_relations,
+        }
+        for name in RELATION_STAGES:
+            func = stubs.get(name, getattr(alert_interaction_service, name))
+            stubs[name] = _timed(func, name, timings)
+
+        with _patched(alert_interaction_service, stubs):
+            start = time.perf_counter()
+            alert_interaction_service.find_relations(
+                drug_list=drug_list, id_patient=1, is_cpoe=is_cpoe
+            )
+            timings["total"] = time.perf_counter() - start
+
+        samples.append(timings)
+
+    return _summary(samples)
+
+
+def run(sizes: list, windows: int = 3, repeat: int = 20, seed: int = 0):
+    results = []
+
+    for size in sizes:
+        drug_list = synthetic_drug_list(size=size, windows=windows, seed=seed)
+
+        results.append(
+            {
+                "drugs": size,
+                # find_alerts doesn't depend on cpoe
+                "alerts": run_alerts(drug_list=drug_list, repeat=repeat),
+                "relations": {
+                    "default": run_relations(
+                        drug_list=drug_list, is_cpoe=False, repeat=repeat
+                    ),
+                    "cpoe": run_relations(
+                        drug_list=drug_list, is_cpoe=True, repeat=repeat
+                    ),
+                },
+            }
+        )
+
+    return results
+
+
+def _print_results(results: list):
+    header = f"{'drugs':>6}  {'engine':<24}{'stage':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for r in results:
+        engines = [("find_alerts", r["alerts"])]
+        for mode, stages in r["relations"].items():
+            engines.append((f"find_relations:{mode}", stages))
+
+        for engine, stages in engines:
+            for stage, p in stages.items():
+                print(
+                    f"{r['drugs']:>6}  {engine:<24}{stage:<24}"
+                    f"{p['p50'] * 1000:>9.3f}{p['p95'] * 1000:>9.3f}{p['p99'] * 1000:>9.3f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alert engine benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 300])
+    parser.add_argument(
+        "--windows", type=int, default=3, help="distinct validity windows"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = run(
+        sizes=args.sizes, windows=args.windows, repeat=args.repeat, seed=args.seed
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_results(results)
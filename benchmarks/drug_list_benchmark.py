@@ -0,0 +1,126 @@
+"""
+Drug list query benchmark (requires a database, POTGRESQL_CONNECTION_STRING).
+
+    python -m benchmarks.drug_list_benchmark --schema demo --prescriptions 20 2020091800000001
+
+Times PrescriptionDrug.findByPrescription with correlated subqueries (legacy)
+and with previous notes / handling types merged after the query (decorrelated).
+Aggregate prescriptions are loaded the same way as the prescription view.
+"""
+
+import argparse
+import json
+import time
+
+from mobile import app
+from models.main import db, dbSession
+from models.prescription import Prescription, PrescriptionDrug
+
+
+def _find(prescription: Prescription, is_cpoe: bool, decorrelated: bool):
+    return PrescriptionDrug.findByPrescription(
+        idPrescription=prescription.id,
+        admissionNumber=prescription.admissionNumber,
+        aggDate=prescription.date if prescription.agg else None,
+        idSegment=prescription.idSegment,
+        is_cpoe=is_cpoe,
+        decorrelated=decorrelated,
+    )
+
+
+def _measure(func, repeat: int):
+    elapsed = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start)
+
+    return result, min(elapsed)
+
+
+def _compare(legacy: list, decorrelated: list):
+    if len(legacy) != len(decorrelated):
+        return False
+
+    for l, d in zip(legacy, decorrelated):
+        if l[0].id != d[0].id or l.prevNotes != d.prevNotes:
+            return False
+
+        if sorted(l.substance_handling_types or []) != sorted(
+            d.substance_handling_types or []
+        ):
+            return False
+
+    return True
+
+
+def run(schema: str, prescriptions: list, is_cpoe: bool = False, repeat: int = 3):
+    results = []
+
+    with app.app_context():
+        dbSession.setSchema(schema)
+
+        for id_prescription in prescriptions:
+            prescription = db.session.get(Prescription, id_prescription)
+            if prescription is None:
+                continue
+
+            legacy, legacy_time = _measure(
+                lambda: _find(prescription, is_cpoe, decorrelated=False), repeat
+            )
+            decorrelated, decorrelated_time = _measure(
+                lambda: _find(prescription, is_cpoe, decorrelated=True), repeat
+            )
+
+            results.append(
+                {
+                    "idPrescription": id_prescription,
+                    "agg": bool(prescription.agg),
+                    "items": len(legacy),
+                    "seconds": {
+                        "legacy": legacy_time,
+                        "decorrelated": decorrelated_time,
+                    },
+                    "equal": _compare(legacy, decorrelated),
+                }
+            )
+
+        db.session.rollback()
+
+    return results
+
+
+def _print_results(results: list):
+    header = f"{'prescription':>20}{'agg':>6}{'items':>7}{'legacy':>10}{'decorr.':>10}{'equal':>7}"
+    print(header)
+    print("-" * len(header))
+
+    for r in results:
+        s = r["seconds"]
+        print(
+            f"{r['idPrescription']:>20}{str(r['agg']):>6}{r['items']:>7}"
+            f"{s['legacy']:>10.3f}{s['decorrelated']:>10.3f}{str(r['equal']):>7}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drug list query benchmark")
+    parser.add_argument("--schema", required=True)
+    parser.add_argument("--prescriptions", type=int, nargs="+", required=True)
+    parser.add_argument("--cpoe", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = run(
+        schema=args.schema,
+        prescriptions=args.prescriptions,
+        is_cpoe=args.cpoe,
+        repeat=args.repeat,
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_results(results)
@@ -0,0 +1,171 @@
+"""
+Aggregate prescription headers benchmark (offline, synthetic data).
+
+    python -m benchmarks.headers_benchmark --prescriptions 10 100 500 --items 20
+
+Compares the header features of prescription_view_service (items grouped by
+prescription once) with the previous implementation (full scan per header).
+"""
+
+import argparse
+import json
+import time
+
+from services import prescription_view_service
+from utils import prescriptionutils
+
+
+def synthetic_items(prescriptions: int, items: int, id_offset: int = 0):
+    """
+    Items of an aggregate with the attributes used by prescriptionutils.getFeatures
+    """
+    result = []
+    for pid in range(1, prescriptions + 1):
+        for i in range(items):
+            result.append(
+                {
+                    "idPrescription": str(pid),
+                    "idDrug": id_offset + i,
+                    "idDepartment": 1,
+                    "idSubstance": i,
+                    "idSubstanceClass": None,
+                    "drugAttributes": None,
+                    "whiteList": False,
+                    "suspended": i % 7 == 0,
+                    "allergy": False,
+                    "alertsComplete": [],
+                    "score": str(i % 4),
+                    "am": i % 3 == 0,
+                    "av": False,
+                    "np": None,
+                    "c": False,
+                    "checked": i % 2 == 0,
+                    "tubeAlert": False,
+                    "interval": "08:00 20:00",
+                    "frequency": {"value": "12/12"},
+                    "prescriptionDate": None,
+                    "prevIntervention": {"status": "s"} if i % 5 == 0 else {},
+                }
+            )
+
+    return result
+
+
+def legacy_header_features(
+    headers: dict, pDrugs: list, pSolution: list, pProcedures: list
+):
+    for pid in headers.keys():
+        drugs = [d for d in pDrugs if int(d["idPrescription"]) == pid]
+        drugsInterv = [
+            d["prevIntervention"] for d in drugs if d["prevIntervention"] != {}
+        ]
+
+        solutions = [s for s in pSolution if int(s["idPrescription"]) == pid]
+        solutionsInterv = [
+            s["prevIntervention"] for s in solutions if s["prevIntervention"] != {}
+        ]
+
+        procedures = [p for p in pProcedures if int(p["idPrescription"]) == pid]
+        proceduresInterv = [
+            p["prevIntervention"] for p in procedures if p["prevIntervention"] != {}
+        ]
+
+        for key, items, interventions in [
+            ("drugs", drugs, drugsInterv),
+            ("solutions", solutions, solutionsInterv),
+            ("procedures", procedures, proceduresInterv),
+        ]:
+            headers[pid][key] = prescriptionutils.getFeatures(
+                {
+                    "prescription": items,
+                    "solution": [],
+                    "procedures": [],
+                    "interventions": interventions,
+                    "alertExams": 0,
+                    "complication": 0,
+                }
+            )
+
+    return headers
+
+
+def _measure(func, repeat: int):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+
+    return min(elapsed)
+
+
+def run(prescriptions: list, items: int = 20, repeat: int = 3):
+    results = []
+
+    for size in prescriptions:
+        p_drugs = synthetic_items(size, items)
+        p_solution = synthetic_items(size, max(items // 4, 1), id_offset=1000)
+        p_procedures = synthetic_items(size, max(items // 4, 1), id_offset=2000)
+
+        def _headers():
+            return {pid: {} for pid in range(1, size + 1)}
+
+        legacy = _measure(
+            lambda: legacy_header_features(
+                _headers(), p_drugs, p_solution, p_procedures
+            ),
+            repeat,
+        )
+        grouped = _measure(
+            lambda: prescription_view_service._add_header_features(
+                headers=_headers(),
+                pDrugs=p_drugs,
+                pSolution=p_solution,
+                pProcedures=p_procedures,
+            ),
+            repeat,
+        )
+
+        results.append(
+            {
+                "prescriptions": size,
+                "items": len(p_drugs) + len(p_solution) + len(p_procedures),
+                "seconds": {"legacy": legacy, "grouped": grouped},
+                "speedup": legacy / grouped if grouped > 0 else None,
+            }
+        )
+
+    return results
+
+
+def _print_results(results: list):
+    header = f"{'headers':>9}{'items':>9}{'legacy':>10}{'grouped':>10}{'speedup':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for r in results:
+        s = r["seconds"]
+        print(
+            f"{r['prescriptions']:>9}{r['items']:>9}{s['legacy']:>10.3f}"
+            f"{s['grouped']:>10.3f}{r['speedup']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate headers benchmark")
+    parser.add_argument("--prescriptions", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument(
+        "--items", type=int, default=20, help="drugs per source prescription"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = run(
+        prescriptions=args.prescriptions, items=args.items, repeat=args.repeat
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_results(results)
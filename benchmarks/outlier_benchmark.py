@@ -0,0 +1,210 @@
+"""
+Outlier scoring benchmark (offline, synthetic data).
+
+    python -m benchmarks.outlier_benchmark --sizes 50 500 2000 --engine networkx sparse
+
+For each drug size class (distinct dose/frequency pairs per drug) it times
+ddc_outlier.fit, ddc_outlier.predict, build_model and the scoring of a full fold
+in the process pool (same path used by outlier_service.generate).
+"""
+
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils import outlier_lib
+from utils.process_pool import ProcessPool
+
+FREQUENCIES = np.array([0.5, 1, 2, 3, 4, 6, 8, 12, 24])
+
+
+def synthetic_drug(size: int, skew: float = 1.5, seed: int = 0, id_drug: int = 1):
+    """
+    Distinct (dose, frequency) pairs with counts following a zipf-like distribution.
+    Higher skew concentrates the prescriptions in fewer doses and frequencies.
+    """
+    rng = np.random.default_rng(seed)
+
+    frequency_weights = 1 / np.arange(1, len(FREQUENCIES) + 1) ** skew
+    frequency_weights = frequency_weights / frequency_weights.sum()
+
+    pairs = {}
+    sigma = 0.5
+    while len(pairs) < size:
+        missing = size - len(pairs)
+        doses = np.round(rng.lognormal(mean=3, sigma=sigma, size=missing * 2), 2)
+        frequencies = rng.choice(FREQUENCIES, size=missing * 2, p=frequency_weights)
+        for dose, frequency in zip(doses, frequencies):
+            if dose > 0 and len(pairs) < size:
+                pairs[(float(dose), float(frequency))] = True
+
+        # widen the distribution when there are not enough distinct pairs
+        sigma *= 1.2
+
+    keys = np.array(list(pairs.keys()))
+    counts = np.ceil(1000 / np.arange(1, size + 1) ** skew).astype(int)
+    rng.shuffle(counts)
+
+    return pd.DataFrame(
+        {
+            "medication": np.repeat(id_drug, size),
+            "dose": keys[:, 0],
+            "frequency": keys[:, 1],
+            "count": counts,
+        }
+    )
+
+
+def synthetic_fold(drugs: int, size: int, skew: float = 1.5, seed: int = 0):
+    return pd.concat(
+        [
+            synthetic_drug(size=size, skew=skew, seed=seed + i, id_drug=i + 1)
+            for i in range(drugs)
+        ],
+        ignore_index=True,
+    )
+
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def _score_drug(drugs_item, engine, n_neighbors):
+    return outlier_lib.score_columns(
+        outlier_lib.add_score(drugs_item, engine=engine, n_neighbors=n_neighbors)
+    )
+
+
+def run(
+    sizes: list,
+    engines: list,
+    drugs: int = 10,
+    skew: float = 1.5,
+    n_neighbors: int = 50,
+    workers: int = None,
+    seed: int = 0,
+):
+    results = []
+    pool = ProcessPool(workers=workers)
+
+    try:
+        # start the workers before timing
+        pool.map(_score_drug, [(synthetic_drug(size=5), engines[0], n_neighbors)])
+
+        for engine in engines:
+            for size in sizes:
+                drug = synthetic_drug(size=size, skew=skew, seed=seed)
+                X = drug[["dose", "frequency", "count"]].reset_index()
+                model = outlier_lib.ddc_outlier(
+                    alpha=1, metric="jaccard", engine=engine, n_neighbors=n_neighbors
+                )
+
+                stages = {}
+                _, stages["fit"], fit_peak = _measure(lambda: model.fit(X))
+                _, stages["predict"], predict_peak = _measure(
+                    lambda: model.predict(X.copy())
+                )
+                _, stages["build_model"], build_peak = _measure(
+                    lambda: outlier_lib.build_model(
+                        drug.copy(), engine=engine, n_neighbors=n_neighbors
+                    )
+                )
+
+                fold = synthetic_fold(drugs=drugs, size=size, skew=skew, seed=seed)
+                _, stages["fold"], fold_peak = _measure(
+                    lambda: outlier_lib.concat_scores(
+                        pool.map(
+                            _score_drug,
+                            [
+                                (drugs_item, engine, n_neighbors)
+                                for _, drugs_item in fold.groupby(
+                                    "medication", sort=False
+                                )
+                            ],
+                        )
+                    )
+                )
+
+                results.append(
+                    {
+                        "engine": engine,
+                        "size": size,
+                        "drugs": drugs,
+                        "skew": skew,
+                        "seconds": stages,
+                        "scores_per_second": {
+                            "build_model": size / stages["build_model"],
+                            "fold": len(fold) / stages["fold"],
+                        },
+                        "peak_traced_mb": max(fit_peak, predict_peak, build_peak)
+                        / 2**20,
+                        "fold_peak_traced_mb": fold_peak / 2**20,
+                        "peak_rss_mb": resource.getrusage(
+                            resource.RUSAGE_SELF
+                        ).ru_maxrss
+                        / 2**10,
+                    }
+                )
+    finally:
+        pool.terminate()
+
+    return results
+
+
+def _print_results(results: list):
+    header = f"{'engine':<10}{'size':>7}{'fit':>10}{'predict':>10}{'build':>10}{'fold':>10}{'scores/s':>12}{'traced MB':>11}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for r in results:
+        s = r["seconds"]
+        print(
+            f"{r['engine']:<10}{r['size']:>7}{s['fit']:>10.3f}{s['predict']:>10.3f}"
+            f"{s['build_model']:>10.3f}{s['fold']:>10.3f}"
+            f"{r['scores_per_second']['build_model']:>12.1f}"
+            f"{r['peak_traced_mb']:>11.1f}{r['peak_rss_mb']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Outlier scoring benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument(
+        "--engine",
+        nargs="+",
+        default=[outlier_lib.ENGINE_NETWORKX, outlier_lib.ENGINE_SPARSE],
+    )
+    parser.add_argument("--drugs", type=int, default=10, help="drugs per fold")
+    parser.add_argument("--skew", type=float, default=1.5)
+    parser.add_argument("--neighbors", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    results = run(
+        sizes=args.sizes,
+        engines=args.engine,
+        drugs=args.drugs,
+        skew=args.skew,
+        n_neighbors=args.neighbors,
+        workers=args.workers,
+        seed=args.seed,
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_results(results)
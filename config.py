@@ -51,5 +51,17 @@ class Config:
 
     MARITACA_API_KEY = getenv("MARITACA_API_KEY") or ""
 
+    OUTLIER_ENGINE = getenv("OUTLIER_ENGINE") or "networkx"
+    OUTLIER_NEIGHBORS = int(getenv("OUTLIER_NEIGHBORS", 50))
+    OUTLIER_WORKERS = int(getenv("OUTLIER_WORKERS") or 0)
+    OUTLIER_CHUNK_SIZE = (
+        int(getenv("OUTLIER_CHUNK_SIZE")) if getenv("OUTLIER_CHUNK_SIZE") else None
+    )
+    OUTLIER_JOB_FOLDS = int(getenv("OUTLIER_JOB_FOLDS") or 2)
+    PRESCRIPTION_SECTION_WORKERS = int(getenv("PRESCRIPTION_SECTION_WORKERS") or 0)
+    RELATION_INDEX_TTL = int(getenv("RELATION_INDEX_TTL") or 300)
+    SERVER_TIMING = (getenv("SERVER_TIMING") or "false").lower() == "true"
+    PRESCALC_BATCH_CHUNK_SIZE = int(getenv("PRESCALC_BATCH_CHUNK_SIZE") or 100)
+
     REDIS_HOST = getenv("REDIS_HOST") or ""
     REDIS_PORT = getenv("REDIS_PORT") or ""
@@ -1,28 +1,45 @@
 import os
 import logging
 import inspect
-from flask import g
+import hashlib
+from flask import g, request
+from werkzeug.http import quote_etag
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request, get_jwt
 from flask_jwt_extended.exceptions import JWTExtendedException
 from jwt.exceptions import PyJWTError
 from functools import wraps
 from pydantic import ValidationError as PydanticValidationError
 
+from config import Config
 from models.main import db, dbSession, User
-from utils import status
+from security.role import Role
+from security.permission import Permission
+from utils import status, profilerutils
 from exception.validation_error import ValidationError
 from exception.authorization_error import AuthorizationError
 
 
-def api_endpoint():
+def api_endpoint(etag=None):
+    """
+    etag: optional function (same args as the route) that returns the data version.
+    Requests with a matching If-None-Match receive 304 without running the route.
+
+    Stages (@timed) and sql statements are sent in the Server-Timing header
+    (SERVER_TIMING config) and in the response body for maintainers (?profile=true).
+    """
 
     def wrapper(f):
         @wraps(f)
         def decorator_f(*args, **kwargs):
+            profiler = None
+            if Config.SERVER_TIMING or request.args.get("profile", None) == "true":
+                profiler = profilerutils.start()
+
             try:
                 verify_jwt_in_request()
 
                 user_context = User.find(get_jwt_identity())
+                etag_kwargs = dict(kwargs)
                 if "user_context" in inspect.signature(f).parameters:
                     kwargs["user_context"] = user_context
 
@@ -31,17 +48,56 @@ def api_endpoint():
 
                 g.is_cpoe = _is_cpoe()
 
+                headers = {}
+                if etag != None:
+                    response_etag = _get_etag(
+                        version=etag(*args, **etag_kwargs), user_context=user_context
+                    )
+
+                    if response_etag != None:
+                        headers["ETag"] = quote_etag(response_etag)
+
+                        if request.if_none_match.contains(response_etag):
+                            # etag function should check permission
+                            if g.get("permission_test_count", 0) == 0:
+                                raise AuthorizationError()
+
+                            db.session.commit()
+                            db.session.close()
+                            db.session.remove()
+
+                            _add_server_timing(headers=headers, profiler=profiler)
+
+                            return "", status.HTTP_304_NOT_MODIFIED, headers
+
                 result = f(*args, **kwargs)
 
                 # should check for permission at least once
                 if g.get("permission_test_count", 0) == 0:
                     raise AuthorizationError()
 
+                show_profile = (
+                    profiler != None
+                    and request.args.get("profile", None) == "true"
+                    and Permission.MAINTAINER
+                    in Role.get_permissions_from_user(user=user_context)
+                )
+
                 db.session.commit()
                 db.session.close()
                 db.session.remove()
 
-                return {"status": "success", "data": result}, status.HTTP_200_OK
+                response = {"status": "success", "data": result}
+                if show_profile:
+                    response["profile"] = profiler.to_dict()
+
+                _add_server_timing(headers=headers, profiler=profiler)
+
+                return (
+                    response,
+                    status.HTTP_200_OK,
+                    headers,
+                )
 
             except (JWTExtendedException, PyJWTError):
                 db.session.rollback()
@@ -107,6 +163,25 @@ def api_endpoint():
     return wrapper
 
 
+def _add_server_timing(headers: dict, profiler: profilerutils.RequestProfiler):
+    if profiler == None or not Config.SERVER_TIMING:
+        return
+
+    headers["Server-Timing"] = profiler.server_timing()
+    # allow browser devtools (frontend domain) to read the timings
+    headers["Timing-Allow-Origin"] = "*"
+
+
+def _get_etag(version, user_context: User):
+    if version == None:
+        return None
+
+    # same data can have different representations (user, route and query params)
+    return hashlib.md5(
+        f"{user_context.id}:{g.is_cpoe}:{request.full_path}:{version}".encode()
+    ).hexdigest()
+
+
 def _is_cpoe():
     claims = get_jwt()
     is_cpoe = claims.get("cpoe", None)
@@ -2,6 +2,8 @@ import time
 import logging
 from functools import wraps
 
+from utils import profilerutils
+
 logging.basicConfig()
 logger = logging.getLogger("noharm.performance")
 
@@ -16,6 +18,10 @@ def timed(warn=True):
             result = func(*args, **kwargs)
             end = time.time()
 
+            profiler = profilerutils.get_profiler()
+            if profiler != None:
+                profiler.add_stage(func.__name__, end - start)
+
             duration = round(end - start, 2)
 
             logger.debug("PERF: {} ran in {}s".format(func.__name__, duration))
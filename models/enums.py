@@ -23,6 +23,9 @@ class MemoryEnum(Enum):
     MAP_SCHEDULES_FASTING = "map-schedules-fasting"
     MAP_SCHEDULES = "map-schedules"
     CUSTOM_FORMS = "custom-forms"
+    OUTLIER_WATERMARK = "outlier-watermark"
+    OUTLIER_JOB = "outlier-job"
+    PRESCRIPTION_AGG_WATERMARK = "prescricaoagg-watermark"
 
 
 class GlobalMemoryEnum(Enum):
@@ -36,6 +39,13 @@ class NoHarmENV(Enum):
     PRODUCTION = "production"
 
 
+class OutlierJobStatusEnum(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 class IntegrationStatusEnum(Enum):
     INTEGRATION = 0
     PRODUCTION = 1
@@ -175,6 +185,10 @@ class PatientConciliationStatusEnum(Enum):
 class AppFeatureFlagEnum(Enum):
     REDIS_CACHE = "redisCache"
     REDIS_CACHE_EXAMS = "redisCacheExams"
+    REDIS_CACHE_PRESCRIPTION = "redisCachePrescription"
+    LEGACY_DRUG_LIST_QUERY = "legacyDrugListQuery"
+    PRIORITIZATION_INDEX = "prioritizationIndex"
+    PRIORITIZATION_INDEX_WRITE = "prioritizationIndexWrite"
 
 
 class FrequencyEnum(Enum):
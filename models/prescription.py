@@ -1,3 +1,4 @@
+from collections import namedtuple
 from sqlalchemy.orm import deferred
 from sqlalchemy import case, cast, literal, and_, func, desc, asc, or_
 from sqlalchemy.sql.expression import literal_column, case
@@ -109,6 +110,51 @@ class Prescription(db.Model):
         return headers
 
 
+class PrescriptionIndex(db.Model):
+    """
+    Typed projection of prescricao.indicadores used by the prioritization list
+    (written with the features, prescription_index_service)
+    """
+
+    __tablename__ = "prescricao_indice"
+    __table_args__ = (
+        db.Index("prescricao_indice_escore_idx", "escore_global"),
+        db.Index("prescricao_indice_alertas_idx", "alertas", postgresql_using="gin"),
+        db.Index(
+            "prescricao_indice_atributos_idx", "atributos", postgresql_using="gin"
+        ),
+        db.Index(
+            "prescricao_indice_substancias_idx",
+            "substancias",
+            postgresql_using="gin",
+        ),
+        db.Index("prescricao_indice_classes_idx", "classes", postgresql_using="gin"),
+        db.Index(
+            "prescricao_indice_frequencias_idx",
+            "frequencias",
+            postgresql_using="gin",
+        ),
+        db.Index("prescricao_indice_horarios_idx", "horarios", postgresql_using="gin"),
+    )
+
+    id = db.Column("fkprescricao", db.BigInteger, primary_key=True)
+    globalScore = db.Column("escore_global", db.Integer, nullable=True)
+    # alertStats keys (and interaction kinds) with count > 0
+    alerts = db.Column("alertas", postgresql.ARRAY(db.String), nullable=False)
+    # drugAttributes with count > 0
+    drugAttributes = db.Column("atributos", postgresql.ARRAY(db.String), nullable=False)
+    substances = db.Column(
+        "substancias", postgresql.ARRAY(db.BigInteger), nullable=False
+    )
+    substanceClasses = db.Column("classes", postgresql.ARRAY(db.String), nullable=False)
+    frequencies = db.Column("frequencias", postgresql.ARRAY(db.String), nullable=False)
+    intervals = db.Column("horarios", postgresql.ARRAY(db.String), nullable=False)
+    diff = db.Column("diff", db.Integer, nullable=True)
+    interventions = db.Column("intervencoes", db.Integer, nullable=True)
+    alertLevel = db.Column("nivel_alerta", db.String, nullable=True)
+    update = db.Column("update_at", db.DateTime, nullable=False)
+
+
 class PrescriptionAudit(db.Model):
     __tablename__ = "prescricao_audit"
 
@@ -257,8 +303,13 @@ class PrescriptionDrug(db.Model):
         idSegment=None,
         is_cpoe=False,
         is_pmc=False,
+        decorrelated=True,
     ):
-        prevNotes = getPrevNotes(admissionNumber)
+        if decorrelated:
+            # previous notes and handling types are merged after the query
+            prevNotes = literal_column("NULL")
+        else:
+            prevNotes = getPrevNotes(admissionNumber)
 
         if aggDate != None and is_cpoe:
             agg_date_with_time = cast(
@@ -279,13 +330,16 @@ class PrescriptionDrug(db.Model):
         else:
             period_cpoe = literal_column("0")
 
-        substance_handling = (
-            db.session.query(("*"))
-            .select_from(func.jsonb_object_keys(Substance.handling))
-            .filter(Substance.handling != None)
-            .filter(Substance.handling != "null")
-            .as_scalar()
-        )
+        if decorrelated:
+            substance_handling = literal_column("NULL")
+        else:
+            substance_handling = func.array(
+                db.session.query(("*"))
+                .select_from(func.jsonb_object_keys(Substance.handling))
+                .filter(Substance.handling != None)
+                .filter(Substance.handling != "null")
+                .as_scalar()
+            )
 
         q = (
             db.session.query(
@@ -307,7 +361,7 @@ class PrescriptionDrug(db.Model):
                 period_cpoe.label("period_cpoe"),
                 Prescription.date.label("prescription_date"),
                 MeasureUnitConvert.factor.label("measure_unit_convert_factor"),
-                func.array(substance_handling).label("substance_handling_types"),
+                substance_handling.label("substance_handling_types"),
                 Prescription.idDepartment.label("idDepartment"),
             )
             .outerjoin(Outlier, Outlier.id == PrescriptionDrug.idOutlier)
@@ -370,7 +424,104 @@ class PrescriptionDrug(db.Model):
                 if idSegment != None:
                     q = q.filter(Prescription.idSegment == idSegment)
 
-        return q.order_by(asc(Drug.name)).all()
+        results = q.order_by(asc(Drug.name)).all()
+
+        if decorrelated:
+            return _merge_drug_list_data(results, admissionNumber)
+
+        return results
+
+
+def _merge_drug_list_data(results, admissionNumber):
+    """
+    Add previous notes and substance handling types to findByPrescription rows
+    (one grouped query each, instead of correlated subqueries per row)
+    """
+    if len(results) == 0:
+        return results
+
+    prevNotes = _get_prev_notes_by_drug(
+        admissionNumber, list(set([r[0].idDrug for r in results]))
+    )
+    handling = _get_handling_types_by_substance(
+        list(set([r[11].id for r in results if r[11] != None]))
+    )
+
+    DrugListRow = namedtuple("DrugListRow", results[0]._fields, rename=True)
+    merged = []
+    for r in results:
+        values = list(r)
+        values[8] = next(
+            (
+                n.notes
+                for n in prevNotes.get(r[0].idDrug, [])
+                if n.idPrescriptionDrug < r[0].id
+            ),
+            None,
+        )
+        values[15] = handling.get(r[11].id, []) if r[11] != None else []
+
+        merged.append(DrugListRow(*values))
+
+    return merged
+
+
+def _get_prev_notes_by_drug(admissionNumber, idDrugs):
+    prevUser = db.aliased(User)
+
+    notes = (
+        db.session.query(
+            Notes.idDrug,
+            Notes.idPrescriptionDrug,
+            case(
+                (
+                    and_(Notes.notes != None, Notes.notes != ""),
+                    func.concat(
+                        Notes.notes,
+                        " ##@",
+                        prevUser.name,
+                        " em ",
+                        func.to_char(Notes.update, "DD/MM/YYYY HH24:MI"),
+                        "@##",
+                    ),
+                ),
+                else_=None,
+            ).label("notes"),
+        )
+        .outerjoin(prevUser, Notes.user == prevUser.id)
+        .filter(Notes.admissionNumber == admissionNumber)
+        .filter(Notes.idDrug.in_(idDrugs))
+        .order_by(Notes.idDrug, desc(Notes.update))
+        .all()
+    )
+
+    # most recent first (same order as getPrevNotes)
+    results = {}
+    for n in notes:
+        results.setdefault(n.idDrug, []).append(n)
+
+    return results
+
+
+def _get_handling_types_by_substance(idSubstances):
+    if len(idSubstances) == 0:
+        return {}
+
+    handling = (
+        db.session.query(
+            Substance.id, func.jsonb_object_keys(Substance.handling).label("key")
+        )
+        .filter(Substance.id.in_(idSubstances))
+        .filter(Substance.handling != None)
+        .filter(Substance.handling != "null")
+        .all()
+    )
+
+    results = {}
+    for h in handling:
+        results.setdefault(h.id, []).append(h.key)
+
+    return results
 
 
 class PrescriptionDrugAudit(db.Model):
@@ -27,6 +27,20 @@ def refresh_prescriptions():
     return result.rowcount
 
 
+@app_admin_integration.route(
+    "/admin/integration/refresh-prioritization-index", methods=["POST"]
+)
+@api_endpoint()
+def refresh_prioritization_index():
+    request_data = request.get_json()
+
+    return admin_integration_service.refresh_prioritization_index(
+        start_date=request_data.get("startDate", None),
+        end_date=request_data.get("endDate", None),
+        cursor=request_data.get("cursor", None),
+    )
+
+
 @app_admin_integration.route(
     "/admin/integration/init-intervention-reason", methods=["POST"]
 )
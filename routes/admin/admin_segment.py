@@ -3,7 +3,7 @@ from markupsafe import escape as escape_html
 
 from decorators.api_endpoint_decorator import api_endpoint
 from services.admin import admin_segment_service
-from services import outlier_service
+from services import outlier_service, outlier_job_service
 
 app_admin_segment = Blueprint("app_admin_segment", __name__)
 
@@ -52,3 +52,34 @@ def get_outliers_process_list():
     return outlier_service.get_outliers_process_list(
         id_segment=data.get("idSegment", None),
     )
+
+
+@app_admin_segment.route(
+    "/admin/segments/outliers/process-list/incremental", methods=["POST"]
+)
+@api_endpoint()
+def get_outliers_incremental_process_list():
+    data = request.get_json()
+
+    return outlier_service.get_outliers_incremental_process_list(
+        id_segment=data.get("idSegment", None),
+    )
+
+
+@app_admin_segment.route("/admin/segments/outliers/job", methods=["POST"])
+@api_endpoint()
+def start_outliers_job():
+    data = request.get_json()
+
+    return outlier_job_service.start_job(
+        id_segment=data.get("idSegment", None),
+        incremental=data.get("incremental", False),
+    )
+
+
+@app_admin_segment.route(
+    "/admin/segments/outliers/job/<int:id_segment>", methods=["GET"]
+)
+@api_endpoint()
+def get_outliers_job(id_segment):
+    return outlier_job_service.get_job(id_segment=id_segment)
@@ -19,6 +19,12 @@ def add_history(id_segment, id_drug):
     )
 
 
+@app_gen.route("/outliers/generate/refresh-history/<int:id_segment>", methods=["POST"])
+@api_endpoint()
+def refresh_history(id_segment):
+    return outlier_service.refresh_prescription_history(id_segment=id_segment)
+
+
 @app_gen.route(
     "/outliers/generate/config/<int:id_segment>/<int:id_drug>", methods=["POST"]
 )
@@ -53,7 +59,14 @@ def prepare(id_segment, id_drug):
 @app_gen.route("/outliers/generate/fold/<int:id_segment>/<int:fold>", methods=["POST"])
 @api_endpoint()
 def generate(id_segment, id_drug=None, fold=None):
-    outlier_service.generate(id_drug=id_drug, id_segment=id_segment, fold=fold)
+    data = request.get_json(silent=True) or {}
+
+    outlier_service.generate(
+        id_drug=id_drug,
+        id_segment=id_segment,
+        fold=fold,
+        id_drug_list=data.get("idDrugList", None),
+    )
 
     return True
 
@@ -14,9 +14,23 @@ from decorators.api_endpoint_decorator import api_endpoint
 app_pres = Blueprint("app_pres", __name__)
 
 
-@app_pres.route("/prescriptions", methods=["GET"])
-@api_endpoint()
-def getPrescriptions():
+def _prioritization_version():
+    return prioritization_service.get_prioritization_version(
+        startDate=request.args.get("startDate", str(date.today())),
+        endDate=request.args.get("endDate", None),
+        idSegment=request.args.get("idSegment", None),
+        idSegmentList=request.args.getlist("idSegment[]"),
+        idDept=request.args.getlist("idDept[]"),
+    )
+
+
+def _prescription_version(idPrescription):
+    return prescription_view_service.get_prescription_version(
+        id_prescription=idPrescription
+    )
+
+
+def _prioritization_filters():
     idSegment = request.args.get("idSegment", None)
     idSegmentList = request.args.getlist("idSegment[]")
     idDept = request.args.getlist("idDept[]")
@@ -44,7 +58,7 @@ def getPrescriptions():
     global_score_min = request.args.get("globalScoreMin", None)
     global_score_max = request.args.get("globalScoreMax", None)
 
-    return prioritization_service.get_prioritization_list(
+    return dict(
         idSegment=idSegment,
         idSegmentList=idSegmentList,
         idDept=idDept,
@@ -76,8 +90,20 @@ def getPrescriptions():
     )
 
 
+@app_pres.route("/prescriptions", methods=["GET"])
+@api_endpoint(etag=_prioritization_version)
+def getPrescriptions():
+    # pageSize/cursor: keyset pagination (count: exact, estimate)
+    return prioritization_service.get_prioritization_list(
+        page_size=request.args.get("pageSize", None),
+        cursor=request.args.get("cursor", None),
+        count_mode=request.args.get("count", None),
+        **_prioritization_filters(),
+    )
+
+
 @app_pres.route("/prescriptions/<int:idPrescription>", methods=["GET"])
-@api_endpoint()
+@api_endpoint(etag=_prescription_version)
 def getPrescriptionAuth(idPrescription):
     return prescription_view_service.route_get_prescription(
         id_prescription=idPrescription
@@ -52,6 +52,40 @@ def create_aggregated_by_prescription(schema, id_prescription):
     return sessionutils.tryCommit(db, escape_html(str(id_prescription)))
 
 
+@app_stc.route("/static/<string:schema>/prescriptions", methods=["POST"])
+def create_aggregated_by_prescription_list(schema):
+    data = request.get_json()
+    is_cpoe = request.args.get("cpoe", False)
+
+    user_context = User()
+    user_context.id = 0
+    user_context.schema = schema
+    user_context.config = {"roles": ["STATIC_USER"]}
+    g.user_context = user_context
+    g.is_cpoe = bool(is_cpoe)
+
+    try:
+        results = prescription_agg_service.create_agg_prescription_by_prescription_list(
+            schema=schema,
+            id_prescription_list=data.get("idPrescriptionList", []),
+            out_patient=data.get("outpatient", None),
+            force=data.get("force", False),
+            user_context=user_context,
+        )
+    except ValidationError as e:
+        db.session.rollback()
+        return {"status": "error", "message": str(e), "code": e.code}, e.httpStatus
+    except AuthorizationError as e:
+        db.session.rollback()
+        return {
+            "status": "error",
+            "message": "Usuário inválido",
+            "code": "errors.unauthorized",
+        }, status.HTTP_401_UNAUTHORIZED
+
+    return sessionutils.tryCommit(db, results)
+
+
 @app_stc.route(
     "/static/<string:schema>/aggregate/<int:admission_number>", methods=["GET"]
 )
@@ -6,6 +6,7 @@ from datetime import datetime
 from models.main import db, User
 from models.appendix import SchemaConfig, InterventionReason
 from decorators.has_permission_decorator import has_permission, Permission
+from services import prescription_index_service, prioritization_service
 
 from exception.validation_error import ValidationError
 
@@ -84,6 +85,26 @@ def refresh_prescriptions(user_context: User):
     return db.session.execute(queryPresmed)
 
 
+@has_permission(Permission.INTEGRATION_UTILS)
+def refresh_prioritization_index(
+    start_date: str, end_date: str, cursor: int, user_context: User
+):
+    start, end = prioritization_service.get_date_range(
+        startDate=start_date, endDate=end_date
+    )
+
+    if cursor != None and not isinstance(cursor, int):
+        raise ValidationError(
+            "Parâmetro inválido: cursor",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    return prescription_index_service.rebuild_index(
+        start_date=start, end_date=end, cursor=cursor
+    )
+
+
 @has_permission(Permission.ADMIN_INTERVENTION_REASON)
 def init_intervention_reason(user_context: User):
     schema = user_context.schema
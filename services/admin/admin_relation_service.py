@@ -3,6 +3,7 @@ from datetime import datetime
 
 from models.main import db, Substance, User, Relation
 from decorators.has_permission_decorator import has_permission, Permission
+from services import relation_index_service
 
 
 @has_permission(Permission.ADMIN_SUBSTANCE_RELATIONS)
@@ -105,6 +106,8 @@ def upsert_relation(data: dict, user_context: User):
 
     db.session.flush()
 
+    relation_index_service.invalidate()
+
     SubstA = db.aliased(Substance)
     SubstB = db.aliased(Substance)
 
@@ -3,220 +3,258 @@ from sqlalchemy import text
 from typing import List
 
 from models.prescription import PrescriptionDrug, DrugAttributes
-from models.main import db, Drug, Substance, Allergy
+from models.main import db, Drug
 from models.enums import DrugTypeEnum, DrugAlertLevelEnum, FrequencyEnum
+from services import relation_index_service, allergy_cache_service
 from utils import examutils, stringutils
 
+RELATION_KINDS = ["it", "dt", "dm", "iy", "sl", "rx"]
+
 
 # analyze interactions between drugs.
 # drug_list (PrescriptionDrug.findByPrescription)
 def find_relations(drug_list, id_patient: int, is_cpoe: bool):
-    filtered_list = _filter_drug_list(drug_list=drug_list)
+    items = [
+        _get_relation_item(item=item, is_cpoe=is_cpoe)
+        for item in _filter_drug_list(drug_list=drug_list)
+    ]
     allergies = _get_allergies(id_patient=id_patient)
-    overlap_drugs = []
 
-    for item in filtered_list:
-        prescription_drug: PrescriptionDrug = item[0]
-        drug: Drug = item[1]
-        prescription_date = item[13]
-        prescription_expire_date = item[10] if item[10] != None else datetime.today()
-
-        for compare_item in filtered_list:
-            cp_prescription_drug: PrescriptionDrug = compare_item[0]
-            cp_drug: Drug = compare_item[1]
-            cp_prescription_date = compare_item[13]
-            cp_prescription_expire_date = (
-                compare_item[10] if compare_item[10] != None else datetime.today()
-            )
+    # distinct sctid pairs that can match (instead of every drug pair)
+    candidate_pairs = _get_candidate_pairs(items=items, is_cpoe=is_cpoe)
+    for item in items:
+        for a in allergies:
+            candidate_pairs.add((item["data"]["sctid"], a["sctid"]))
+
+    if len(candidate_pairs) == 0:
+        return {"alerts": {}, "list": {}, "stats": {}}
+
+    active_relations = _get_active_relations(list(candidate_pairs))
+
+    related = set()
+    for r in active_relations.values():
+        related.add((str(r["sctida"]), str(r["sctidb"])))
+
+    items_by_sctid = {}
+    for index, item in enumerate(items):
+        items_by_sctid.setdefault(str(item["data"]["sctid"]), []).append(index)
+
+    alerts = {}
+    stats = {kind: 0 for kind in RELATION_KINDS}
+    unique_relations = {}
 
-            if prescription_drug.id == cp_prescription_drug.id:
+    # same order as the full pair scan: drugs in list order, then allergies
+    for item in items:
+        sctid = str(item["data"]["sctid"])
+        partners = sorted(
+            [
+                index
+                for cp_sctid, indexes in items_by_sctid.items()
+                if (sctid, cp_sctid) in related
+                for index in indexes
+            ]
+        )
+
+        for index in partners:
+            cp_item = items[index]
+
+            if item["data"]["id"] == cp_item["data"]["id"]:
                 continue
 
-            if is_cpoe:
-                # period overlap
-                if not (
-                    (prescription_date.date() <= cp_prescription_expire_date.date())
-                    and (cp_prescription_date.date() <= prescription_expire_date.date())
-                ):
-                    continue
-            else:
-                # same expire date
-                if not (
-                    prescription_expire_date.date()
-                    == cp_prescription_expire_date.date()
-                ):
-                    continue
-
-            overlap_drugs.append(
-                {
-                    "from": {
-                        "id": str(prescription_drug.id),
-                        "drug": drug.name,
-                        "sctid": drug.sctid,
-                        "intravenous": (
-                            prescription_drug.intravenous
-                            if prescription_drug.intravenous != None
-                            else False
-                        ),
-                        "group": _get_solution_group_key(
-                            pd=prescription_drug, is_cpoe=is_cpoe
-                        ),
-                        "expireDate": prescription_expire_date.isoformat(),
-                        "frequency": prescription_drug.frequency,
-                        "rx": False,
-                    },
-                    "to": {
-                        "id": str(cp_prescription_drug.id),
-                        "drug": cp_drug.name,
-                        "sctid": cp_drug.sctid,
-                        "intravenous": (
-                            cp_prescription_drug.intravenous
-                            if cp_prescription_drug.intravenous != None
-                            else False
-                        ),
-                        "group": _get_solution_group_key(
-                            pd=cp_prescription_drug, is_cpoe=is_cpoe
-                        ),
-                        "expireDate": cp_prescription_expire_date.isoformat(),
-                        "frequency": cp_prescription_drug.frequency,
-                        "rx": False,
-                    },
-                }
+            if not _is_overlap(item=item, cp_item=cp_item, is_cpoe=is_cpoe):
+                continue
+
+            _add_relation_alerts(
+                drug_from=item["data"],
+                drug_to=cp_item["data"],
+                active_relations=active_relations,
+                is_cpoe=is_cpoe,
+                alerts=alerts,
+                stats=stats,
+                unique_relations=unique_relations,
             )
 
         for a in allergies:
-            overlap_drugs.append(
-                {
-                    "from": {
-                        "id": str(prescription_drug.id),
-                        "drug": drug.name,
-                        "sctid": drug.sctid,
-                        "intravenous": (
-                            prescription_drug.intravenous
-                            if prescription_drug.intravenous != None
-                            else False
-                        ),
-                        "group": _get_solution_group_key(
-                            pd=prescription_drug, is_cpoe=is_cpoe
-                        ),
-                        "expireDate": prescription_expire_date.isoformat(),
-                        "frequency": prescription_drug.frequency,
-                        "rx": True,
-                    },
-                    "to": a,
-                }
+            if (sctid, str(a["sctid"])) not in related:
+                continue
+
+            _add_relation_alerts(
+                drug_from=dict(item["data"], rx=True),
+                drug_to=a,
+                active_relations=active_relations,
+                is_cpoe=is_cpoe,
+                alerts=alerts,
+                stats=stats,
+                unique_relations=unique_relations,
             )
 
-    if len(overlap_drugs) == 0:
-        return {"alerts": {}, "list": {}, "stats": {}}
+    return {"alerts": alerts, "stats": stats}
 
-    uniq_overlap_keys = []
-    for d in overlap_drugs:
-        key = f"""({d["from"]["sctid"]},{d["to"]["sctid"]})"""
-        if key not in uniq_overlap_keys:
-            uniq_overlap_keys.append(key)
 
-    active_relations = _get_active_relations(uniq_overlap_keys)
+def _get_relation_item(item, is_cpoe: bool):
+    prescription_drug: PrescriptionDrug = item[0]
+    drug: Drug = item[1]
+    prescription_date = item[13]
+    prescription_expire_date = item[10] if item[10] != None else datetime.today()
+
+    return {
+        "start": prescription_date.date() if is_cpoe else None,
+        "end": prescription_expire_date.date(),
+        "data": {
+            "id": str(prescription_drug.id),
+            "drug": drug.name,
+            "sctid": drug.sctid,
+            "intravenous": (
+                prescription_drug.intravenous
+                if prescription_drug.intravenous != None
+                else False
+            ),
+            "group": _get_solution_group_key(pd=prescription_drug, is_cpoe=is_cpoe),
+            "expireDate": prescription_expire_date.isoformat(),
+            "frequency": prescription_drug.frequency,
+            "rx": False,
+        },
+    }
+
+
+def _is_overlap(item: dict, cp_item: dict, is_cpoe: bool):
+    if is_cpoe:
+        # period overlap
+        return item["start"] <= cp_item["end"] and cp_item["start"] <= item["end"]
 
-    alerts = {}
-    stats = {}
-    unique_relations = {}
-    kinds = ["it", "dt", "dm", "iy", "sl", "rx"]
+    # same expire date
+    return item["end"] == cp_item["end"]
 
-    for kind in kinds:
-        stats[kind] = 0
 
-    for drug in overlap_drugs:
-        drug_from = drug["from"]
-        drug_to = drug["to"]
+def _get_candidate_pairs(items: List[dict], is_cpoe: bool):
+    pairs = set()
 
-        for kind in kinds:
-            key = f"""{drug_from["sctid"]}-{drug_to["sctid"]}-{kind}"""
-            invert_key = f"""{drug_to["sctid"]}-{drug_from["sctid"]}-{kind}"""
+    if is_cpoe:
+        windows = {}
+        for item in items:
+            windows.setdefault(item["data"]["sctid"], []).append(item)
+
+        for sctid, sctid_items in windows.items():
+            for cp_sctid, cp_sctid_items in windows.items():
+                if any(
+                    item["data"]["id"] != cp_item["data"]["id"]
+                    and _is_overlap(item=item, cp_item=cp_item, is_cpoe=is_cpoe)
+                    for item in sctid_items
+                    for cp_item in cp_sctid_items
+                ):
+                    pairs.add((sctid, cp_sctid))
+
+        return pairs
+
+    expire_groups = {}
+    for item in items:
+        sctids = expire_groups.setdefault(item["end"], {})
+        sctids.setdefault(item["data"]["sctid"], set()).add(item["data"]["id"])
+
+    for sctids in expire_groups.values():
+        for sctid, ids in sctids.items():
+            for cp_sctid in sctids.keys():
+                # same sctid only when prescribed more than once
+                if sctid != cp_sctid or len(ids) > 1:
+                    pairs.add((sctid, cp_sctid))
+
+    return pairs
+
+
+def _add_relation_alerts(
+    drug_from: dict,
+    drug_to: dict,
+    active_relations: dict,
+    is_cpoe: bool,
+    alerts: dict,
+    stats: dict,
+    unique_relations: dict,
+):
+    for kind in RELATION_KINDS:
+        key = f"""{drug_from["sctid"]}-{drug_to["sctid"]}-{kind}"""
+
+        if key not in active_relations:
+            continue
 
-            # iy must have intravenous route
-            if kind == "iy" and (
-                not drug_from["intravenous"] or not drug_to["intravenous"]
-            ):
-                continue
+        invert_key = f"""{drug_to["sctid"]}-{drug_from["sctid"]}-{kind}"""
 
-            # sl must be in the same group
-            if kind == "sl" and (
-                drug_from["group"] != drug_to["group"] or drug_from["group"] == None
-            ):
-                continue
+        # iy must have intravenous route
+        if kind == "iy" and (
+            not drug_from["intravenous"] or not drug_to["intravenous"]
+        ):
+            continue
+
+        # sl must be in the same group
+        if kind == "sl" and (
+            drug_from["group"] != drug_to["group"] or drug_from["group"] == None
+        ):
+            continue
+
+        # dm cant have frequency 66
+        if kind == "dm" and (
+            drug_from["frequency"] == FrequencyEnum.NOW.value
+            or drug_to["frequency"] == FrequencyEnum.NOW.value
+        ):
+            continue
 
-            # dm cant have frequency 66
-            if kind == "dm" and (
-                drug_from["frequency"] == FrequencyEnum.NOW.value
-                or drug_to["frequency"] == FrequencyEnum.NOW.value
-            ):
+        # rx rules
+        if kind == "rx":
+            if not drug_from["rx"]:
+                continue
+        else:
+            if drug_from["rx"]:
                 continue
 
-            # rx rules
-            if kind == "rx":
-                if not drug_from["rx"]:
-                    continue
-            else:
-                if drug_from["rx"]:
-                    continue
-
-            if key in active_relations:
-                if is_cpoe:
-                    uniq_key = key
-                    uniq_invert_key = invert_key
-                else:
-                    uniq_key = f"""{key}-{drug_from["expireDate"]}"""
-                    uniq_invert_key = f"""{invert_key}-{drug_from["expireDate"]}"""
-
-                if (
-                    not uniq_key in unique_relations
-                    and not uniq_invert_key in unique_relations
-                ):
-                    stats[kind] += 1
-                    unique_relations[uniq_key] = 1
-                    unique_relations[uniq_invert_key] = 1
-
-                alert_text = examutils.typeRelations[kind] + ": "
-                alert_text += (
-                    stringutils.strNone(active_relations[key]["text"])
-                    + " ("
-                    + stringutils.strNone(drug_from["drug"])
-                    + " e "
-                    + stringutils.strNone(drug_to["drug"])
-                    + ")"
-                )
-
-                if kind == "dm":
-                    # one way
-                    ids = [drug_from["id"]]
-                else:
-                    # both ways
-                    ids = [drug_from["id"], drug_to["id"]]
-
-                for id in ids:
-                    alert_obj = {
-                        "idPrescriptionDrug": id,
-                        "key": key,
-                        "type": kind,
-                        "level": (
-                            active_relations[key]["level"]
-                            if active_relations[key]["level"] != None
-                            else DrugAlertLevelEnum.LOW.value
-                        ),
-                        "relation": drug_to["id"],
-                        "text": alert_text,
-                    }
-
-                    if id in alerts:
-                        # avoid alert repetition
-                        text_array = [a["text"] for a in alerts[id]]
-                        if alert_text not in text_array:
-                            alerts[id].append(alert_obj)
-                    else:
-                        alerts[id] = [alert_obj]
+        if is_cpoe:
+            uniq_key = key
+            uniq_invert_key = invert_key
+        else:
+            uniq_key = f"""{key}-{drug_from["expireDate"]}"""
+            uniq_invert_key = f"""{invert_key}-{drug_from["expireDate"]}"""
+
+        if not uniq_key in unique_relations and not uniq_invert_key in unique_relations:
+            stats[kind] += 1
+            unique_relations[uniq_key] = 1
+            unique_relations[uniq_invert_key] = 1
+
+        alert_text = examutils.typeRelations[kind] + ": "
+        alert_text += (
+            stringutils.strNone(active_relations[key]["text"])
+            + " ("
+            + stringutils.strNone(drug_from["drug"])
+            + " e "
+            + stringutils.strNone(drug_to["drug"])
+            + ")"
+        )
 
-    return {"alerts": alerts, "stats": stats}
+        if kind == "dm":
+            # one way
+            ids = [drug_from["id"]]
+        else:
+            # both ways
+            ids = [drug_from["id"], drug_to["id"]]
+
+        for id in ids:
+            alert_obj = {
+                "idPrescriptionDrug": id,
+                "key": key,
+                "type": kind,
+                "level": (
+                    active_relations[key]["level"]
+                    if active_relations[key]["level"] != None
+                    else DrugAlertLevelEnum.LOW.value
+                ),
+                "relation": drug_to["id"],
+                "text": alert_text,
+            }
+
+            if id in alerts:
+                # avoid alert repetition
+                text_array = [a["text"] for a in alerts[id]]
+                if alert_text not in text_array:
+                    alerts[id].append(alert_obj)
+            else:
+                alerts[id] = [alert_obj]
 
 
 def _filter_drug_list(drug_list):
@@ -265,36 +303,33 @@ def _get_solution_group_key(pd: PrescriptionDrug, is_cpoe: bool):
 
 
 def _get_allergies(id_patient: int):
-    allergies = (
-        db.session.query(Substance.id, Substance.name)
-        .select_from(Allergy)
-        .join(Drug, Allergy.idDrug == Drug.id)
-        .join(Substance, Substance.id == Drug.sctid)
-        .filter(Allergy.idPatient == id_patient)
-        .filter(Allergy.active == True)
-        .group_by(Substance.id, Substance.name)
-        .all()
-    )
-
     results = []
-    for a in allergies:
-        if a.id != None:
-            results.append(
-                {
-                    "id": None,
-                    "drug": a.name,
-                    "sctid": a.id,
-                    "intravenous": False,
-                    "group": None,
-                    "frequency": None,
-                    "rx": True,
-                }
-            )
+    substances = set()
+    for a in allergy_cache_service.get_patient_allergies(id_patient=id_patient):
+        if a["sctid"] == None or a["sctid"] in substances:
+            continue
+
+        substances.add(a["sctid"])
+        results.append(
+            {
+                "id": None,
+                "drug": a["substance"],
+                "sctid": a["sctid"],
+                "intravenous": False,
+                "group": None,
+                "frequency": None,
+                "rx": True,
+            }
+        )
 
     return results
 
 
-def _get_active_relations(uniq_overlap_keys: List[str]):
+def _get_active_relations(pairs: List[tuple]):
+    if relation_index_service.is_enabled():
+        return relation_index_service.get_relations(pairs=pairs, kinds=RELATION_KINDS)
+
+    uniq_overlap_keys = [f"({sctida},{sctidb})" for sctida, sctidb in pairs]
     query = text(
         f"""
         with cruzamento as (
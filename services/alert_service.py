@@ -1,11 +1,218 @@
 import re
-from typing import List
+from typing import Callable, List, NamedTuple
 
 from models.enums import DrugTypeEnum, DrugAlertTypeEnum, DrugAlertLevelEnum
 from models.prescription import PrescriptionDrug, Drug, DrugAttributes, Frequency
 from utils import numberutils, stringutils
 
 
+# alert text is built with indented multiline f-strings
+TEXT_CLEANUP = re.compile(" {2,}|\n")
+
+# drug attributes used to skip rules that can't apply to a drug
+RULE_ATTRIBUTES = [
+    "kidney",
+    "liver",
+    "platelets",
+    "elderly",
+    "tube",
+    "maxTime",
+    "maxDose",
+    "pregnant",
+    "lactating",
+    "fasting",
+]
+
+
+class AlertItem:
+    """
+    Drug row (findByPrescription) projected once for the alert rules
+    """
+
+    __slots__ = (
+        "prescription_drug",
+        "drug",
+        "drug_attributes",
+        "frequency",
+        "expire_date",
+        "dose_conv",
+        "handling_types",
+        "inputs",
+    )
+
+    def __init__(self, item, attributes: List[str]):
+        self.prescription_drug: PrescriptionDrug = item[0]
+        self.drug: Drug = item[1]
+        self.drug_attributes: DrugAttributes = item[6]
+        self.frequency: Frequency = item[3]
+        self.expire_date = item[10]
+        self.dose_conv = _get_dose_conv(
+            prescription_drug=self.prescription_drug,
+            drug_attributes=self.drug_attributes,
+            measure_unit_convert_factor=(
+                item.measure_unit_convert_factor
+                if item.measure_unit_convert_factor != None
+                else 1
+            ),
+        )
+        self.handling_types = item.substance_handling_types or []
+
+        inputs = set()
+        if self.drug_attributes != None:
+            for attr in attributes:
+                if getattr(self.drug_attributes, attr):
+                    inputs.add(attr)
+        if self.prescription_drug.allergy == "S":
+            inputs.add("allergy")
+        if self.frequency:
+            inputs.add("frequency")
+        if self.drug and self.drug.name and "vanco" in self.drug.name.lower():
+            inputs.add("vancomycin")
+
+        self.inputs = frozenset(inputs)
+
+
+class AlertRule(NamedTuple):
+    alert_type: DrugAlertTypeEnum
+    alert: Callable
+    # drug inputs (AlertItem.inputs) required by the rule
+    requires: frozenset
+    # find_alerts argument that must be present
+    context: str = None
+
+
+# evaluation order defines the alert order of each drug
+ALERT_RULES = [
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.KIDNEY,
+        alert=lambda item, ctx: _alert_kidney(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+            dialysis=ctx["dialysis"],
+        ),
+        requires=frozenset(["kidney"]),
+        context="exams",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.LIVER,
+        alert=lambda item, ctx: _alert_liver(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+        ),
+        requires=frozenset(["liver"]),
+        context="exams",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.PLATELETS,
+        alert=lambda item, ctx: _alert_platelets(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+        ),
+        requires=frozenset(["platelets"]),
+        context="exams",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.ELDERLY,
+        alert=lambda item, ctx: _alert_elderly(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+        ),
+        requires=frozenset(["elderly"]),
+        context="exams",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.TUBE,
+        alert=lambda item, ctx: _alert_tube(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+        ),
+        requires=frozenset(["tube"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.ALLERGY,
+        alert=lambda item, ctx: _alert_allergy(
+            prescription_drug=item.prescription_drug
+        ),
+        requires=frozenset(["allergy"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.MAX_TIME,
+        alert=lambda item, ctx: _alert_max_time(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+        ),
+        requires=frozenset(["maxTime"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.MAX_DOSE,
+        alert=lambda item, ctx: _alert_max_dose(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+            dose_conv=item.dose_conv,
+        ),
+        requires=frozenset(["maxDose"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.MAX_DOSE_PLUS,
+        alert=lambda item, ctx: _alert_max_dose_total(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            exams=ctx["exams"],
+            prescription_expire_date=item.expire_date,
+            dose_total=ctx["dose_total"],
+        ),
+        requires=frozenset(["maxDose"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.IRA,
+        alert=lambda item, ctx: _alert_ira(
+            prescription_drug=item.prescription_drug,
+            drug=item.drug,
+            exams=ctx["exams"],
+            prescription_expire_date=item.expire_date,
+            dose_total=ctx["dose_total"],
+            dialysis=ctx["dialysis"],
+        ),
+        requires=frozenset(["vancomycin"]),
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.PREGNANT,
+        alert=lambda item, ctx: _alert_pregnant(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            pregnant=ctx["pregnant"],
+        ),
+        requires=frozenset(["pregnant"]),
+        context="pregnant",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.LACTATING,
+        alert=lambda item, ctx: _alert_lactating(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            lactating=ctx["lactating"],
+        ),
+        requires=frozenset(["lactating"]),
+        context="lactating",
+    ),
+    AlertRule(
+        alert_type=DrugAlertTypeEnum.FASTING,
+        alert=lambda item, ctx: _alert_fasting(
+            prescription_drug=item.prescription_drug,
+            drug_attributes=item.drug_attributes,
+            frequency=item.frequency,
+            schedules_fasting=ctx["schedules_fasting"],
+        ),
+        requires=frozenset(["fasting", "frequency"]),
+    ),
+]
+
+
 # analyze alerts
 # drug_list (PrescriptionDrug.findByPrescription)
 def find_alerts(
@@ -16,169 +223,53 @@ def find_alerts(
     lactating: bool,
     schedules_fasting: List[str],
 ):
-    filtered_list = _filter_drug_list(drug_list=drug_list)
-    dose_total = _get_dose_total(drug_list=filtered_list, exams=exams)
+    context = {
+        "exams": exams,
+        "dialysis": dialisys,
+        "pregnant": pregnant,
+        "lactating": lactating,
+        "schedules_fasting": schedules_fasting,
+    }
+    rules, attributes = _compile_rules(context=context)
+
+    items = [
+        AlertItem(item, attributes=attributes)
+        for item in _filter_drug_list(drug_list=drug_list)
+    ]
+    context["dose_total"] = _get_dose_total(items=items, exams=exams)
     alerts = {}
     stats = _get_empty_stats()
 
-    def add_alert(a, handling_types=[]):
-        if a != None:
-            key = a["idPrescriptionDrug"]
-            stats[a["type"]] += 1
-            a["text"] = re.sub(" {2,}", "", a["text"])
-            a["text"] = re.sub("\n", "", a["text"])
-
-            a["handling"] = a["type"] in handling_types
-
-            if key not in alerts:
-                alerts[key] = [a]
-            else:
-                alerts[key].append(a)
-
-    for item in filtered_list:
-        prescription_drug: PrescriptionDrug = item[0]
-        drug: Drug = item[1]
-        measure_unit_convert_factor = (
-            item.measure_unit_convert_factor
-            if item.measure_unit_convert_factor != None
-            else 1
-        )
-        drug_attributes: DrugAttributes = item[6]
-        prescription_expire_date = item[10]
-        frequency = item[3]
-        handling_types = item.substance_handling_types
-
-        # kidney alert
-        add_alert(
-            _alert_kidney(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-                dialysis=dialisys,
-            ),
-            handling_types=handling_types,
-        )
-
-        # liver alert
-        add_alert(
-            _alert_liver(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-            ),
-            handling_types=handling_types,
-        )
-
-        # platelets
-        add_alert(
-            _alert_platelets(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-            ),
-            handling_types=handling_types,
-        )
-
-        # elderly
-        add_alert(
-            _alert_elderly(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-            ),
-            handling_types=handling_types,
-        )
-
-        # tube
-        add_alert(
-            _alert_tube(
-                prescription_drug=prescription_drug, drug_attributes=drug_attributes
-            ),
-            handling_types=handling_types,
-        )
-
-        # allergy
-        add_alert(
-            _alert_allergy(prescription_drug=prescription_drug),
-            handling_types=handling_types,
-        )
+    for item in items:
+        for rule in rules:
+            if not rule.requires <= item.inputs:
+                continue
 
-        # maximum treatment period
-        add_alert(
-            _alert_max_time(
-                prescription_drug=prescription_drug, drug_attributes=drug_attributes
-            ),
-            handling_types=handling_types,
-        )
+            a = rule.alert(item, context)
+            if a == None:
+                continue
 
-        # max dose
-        add_alert(
-            _alert_max_dose(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-                measure_unit_convert_factor=measure_unit_convert_factor,
-            ),
-            handling_types=handling_types,
-        )
+            stats[a["type"]] += 1
+            a["text"] = TEXT_CLEANUP.sub("", a["text"])
+            a["handling"] = a["type"] in item.handling_types
 
-        # max dose total
-        add_alert(
-            _alert_max_dose_total(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                exams=exams,
-                prescription_expire_date=prescription_expire_date,
-                dose_total=dose_total,
-            ),
-            handling_types=handling_types,
-        )
+            alerts.setdefault(a["idPrescriptionDrug"], []).append(a)
 
-        # IRA
-        add_alert(
-            _alert_ira(
-                prescription_drug=prescription_drug,
-                drug=drug,
-                exams=exams,
-                prescription_expire_date=prescription_expire_date,
-                dose_total=dose_total,
-                dialysis=dialisys,
-            ),
-            handling_types=handling_types,
-        )
+    return {"alerts": alerts, "stats": stats}
 
-        # pregnant
-        add_alert(
-            _alert_pregnant(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                pregnant=pregnant,
-            ),
-            handling_types=handling_types,
-        )
 
-        # lactating
-        add_alert(
-            _alert_lactating(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                lactating=lactating,
-            ),
-            handling_types=handling_types,
-        )
+def _compile_rules(context: dict):
+    # rules that depend on a missing argument are skipped for the whole list
+    rules = [
+        rule for rule in ALERT_RULES if rule.context == None or context[rule.context]
+    ]
 
-        # fasting
-        add_alert(
-            _alert_fasting(
-                prescription_drug=prescription_drug,
-                drug_attributes=drug_attributes,
-                frequency=frequency,
-                schedules_fasting=schedules_fasting,
-            ),
-            handling_types=handling_types,
-        )
+    # only attributes used by the remaining rules are projected
+    attributes = [
+        attr for attr in RULE_ATTRIBUTES if any(attr in r.requires for r in rules)
+    ]
 
-    return {"alerts": alerts, "stats": stats}
+    return rules, attributes
 
 
 def _get_empty_stats():
@@ -232,23 +323,12 @@ def _get_dose_conv(
     )
 
 
-def _get_dose_total(drug_list, exams: dict):
+def _get_dose_total(items: List[AlertItem], exams: dict):
     dose_total = {}
-    for item in drug_list:
-        prescription_drug: PrescriptionDrug = item[0]
-        drug_attributes: DrugAttributes = item[6]
-        prescription_expire_date = item[10]
-        expireDay = prescription_expire_date.day if prescription_expire_date else 0
-        measure_unit_convert_factor = (
-            item.measure_unit_convert_factor
-            if item.measure_unit_convert_factor != None
-            else 1
-        )
-        pd_dose_conv = _get_dose_conv(
-            prescription_drug=prescription_drug,
-            drug_attributes=drug_attributes,
-            measure_unit_convert_factor=measure_unit_convert_factor,
-        )
+    for item in items:
+        prescription_drug = item.prescription_drug
+        expireDay = item.expire_date.day if item.expire_date else 0
+        pd_dose_conv = item.dose_conv
 
         if prescription_drug.frequency in [66]:
             # do not sum some types of frequency
@@ -331,15 +411,11 @@ def _alert_max_dose(
     prescription_drug: PrescriptionDrug,
     drug_attributes: DrugAttributes,
     exams: dict,
-    measure_unit_convert_factor: float,
+    dose_conv: float,
 ):
     if not drug_attributes:
         return None
-    pd_dose_conv = _get_dose_conv(
-        prescription_drug=prescription_drug,
-        drug_attributes=drug_attributes,
-        measure_unit_convert_factor=measure_unit_convert_factor,
-    )
+    pd_dose_conv = dose_conv
     alert = _create_alert(
         id_prescription_drug=str(prescription_drug.id),
         key="",
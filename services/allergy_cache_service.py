@@ -0,0 +1,70 @@
+from flask import g, has_app_context
+from sqlalchemy import func
+
+from models.main import db, Allergy, Drug, Substance
+from utils import dateutils
+
+REQUEST_CACHE_KEY = "patient_allergies"
+
+
+def get_patient_allergies(id_patient: int) -> list:
+    """
+    Active allergies of the patient (alergia table), ordered by substance (or drug)
+    name: [{"date", "sctid", "substance", "drug"}]
+    Loaded once per request: interaction allergies, notes allergies and every
+    aggregate of a prescalc batch. The integration writes the table directly, so
+    nothing is kept between requests.
+    """
+    if not has_app_context():
+        return _load_allergies(id_patient=id_patient)
+
+    allergies = g.get(REQUEST_CACHE_KEY, None)
+    if allergies == None:
+        allergies = {}
+        setattr(g, REQUEST_CACHE_KEY, allergies)
+
+    if id_patient not in allergies:
+        allergies[id_patient] = _load_allergies(id_patient=id_patient)
+
+    return allergies[id_patient]
+
+
+def get_names(allergies: list, limit: int = 100) -> list:
+    """
+    Distinct substance (or drug) names, in the query order (database collation)
+    """
+    names = {}
+    for a in allergies:
+        name = a["substance"] if a["substance"] != None else a["drug"]
+        if name and name.strip() and name not in names:
+            names[name] = a["date"]
+
+            if len(names) == limit:
+                break
+
+    return [{"date": date, "text": name} for name, date in names.items()]
+
+
+def _load_allergies(id_patient: int):
+    allergies = (
+        db.session.query(
+            Allergy.createdAt, Substance.id, Substance.name, Allergy.drugName
+        )
+        .select_from(Allergy)
+        .outerjoin(Drug, Allergy.idDrug == Drug.id)
+        .outerjoin(Substance, Substance.id == Drug.sctid)
+        .filter(Allergy.idPatient == id_patient)
+        .filter(Allergy.active == True)
+        .order_by(func.coalesce(Substance.name, Allergy.drugName))
+        .all()
+    )
+
+    return [
+        {
+            "date": dateutils.to_iso(a[0]),
+            "sctid": a[1],
+            "substance": a[2],
+            "drug": a[3],
+        }
+        for a in allergies
+    ]
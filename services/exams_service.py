@@ -11,7 +11,7 @@ from repository import exams_repository
 from services import memory_service, cache_service
 from decorators.has_permission_decorator import has_permission, Permission
 from exception.validation_error import ValidationError
-from utils import status, examutils, stringutils, dateutils
+from utils import status, examutils, stringutils, dateutils, cacheutils
 
 
 def create_exam(
@@ -389,7 +389,9 @@ def find_latest_exams(
         schema=schema,
     )
 
-    segExam = SegmentExam.refDict(idSegment)
+    segExam = cacheutils.get_reference(
+        f"segment_exams:{idSegment}", lambda: SegmentExam.refDict(idSegment)
+    )
     age = dateutils.data2age(
         patient.birthdate.isoformat() if patient.birthdate else date.today().isoformat()
     )
@@ -20,6 +20,7 @@ from services import (
     memory_service,
     data_authorization_service,
     feature_service,
+    prescription_cache_service,
 )
 from decorators.has_permission_decorator import has_permission, Permission
 from exception.validation_error import ValidationError
@@ -362,6 +363,10 @@ def add_multiple_interventions(
         id_intervention_list.append(i.idIntervention)
 
     if len(id_intervention_list) > 0:
+        prescription_cache_service.invalidate(
+            schema=user_context.schema, admission_number=admission_number
+        )
+
         return get_interventions(
             admissionNumber=admission_number, idInterventionList=id_intervention_list
         )
@@ -534,6 +539,10 @@ def save_intervention(
         db.session.add(i)
         db.session.flush()
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=i.admissionNumber
+    )
+
     return get_interventions(
         admissionNumber=i.admissionNumber, idIntervention=i.idIntervention
     )
@@ -0,0 +1,336 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from zappa.asynchronous import task
+
+from config import Config
+from models.main import db, dbSession, User
+from models.appendix import Memory
+from models.enums import MemoryEnum, OutlierJobStatusEnum
+from services import outlier_service, memory_service, data_authorization_service
+from decorators.has_permission_decorator import has_permission, Permission
+from exception.validation_error import ValidationError
+from utils import status
+
+# running jobs without a heartbeat after this period are considered dead (ex: instance
+# restart). The heartbeat is refreshed when a fold starts or ends (fold < lambda timeout)
+JOB_STALE_MINUTES = 30
+
+# a fold worker dispatches a new invocation after this period (lambda timeout)
+WORKER_SECONDS = 10 * 60
+
+
+@has_permission(Permission.WRITE_SEGMENT_SCORE)
+def start_job(id_segment, user_context: User, incremental=False):
+    if id_segment == None:
+        raise ValidationError(
+            "Parâmetro inválido",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    if not data_authorization_service.has_segment_authorization(
+        id_segment=id_segment, user=user_context
+    ):
+        raise ValidationError(
+            "Usuário não autorizado neste segmento",
+            "errors.businessRules",
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    job = _get_job(id_segment=id_segment)
+    if job != None and _is_active(job):
+        raise ValidationError(
+            "Já existe uma geração de escores em andamento para este segmento",
+            "errors.businessRules",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    job = {
+        "idSegment": int(id_segment),
+        "incremental": bool(incremental),
+        "status": OutlierJobStatusEnum.QUEUED.value,
+        "createdAt": datetime.now().isoformat(),
+        "updatedAt": datetime.now().isoformat(),
+        "heartbeatAt": datetime.now().isoformat(),
+        "startedAt": None,
+        "finishedAt": None,
+        "error": None,
+        "folds": [],
+    }
+    _save_job(id_segment=id_segment, job=job, id_user=user_context.id)
+
+    # the job runs in another invocation, queued state must be visible to it
+    db.session.commit()
+
+    run_job(
+        int(id_segment),
+        user_context.id,
+        user_context.schema,
+        user_context.config.get("roles", []),
+    )
+
+    return job
+
+
+@has_permission(Permission.WRITE_SEGMENT_SCORE)
+def get_job(id_segment, user_context: User):
+    job = _get_job(id_segment=id_segment)
+
+    if job != None and job["status"] in [
+        OutlierJobStatusEnum.QUEUED.value,
+        OutlierJobStatusEnum.RUNNING.value,
+    ]:
+        job["stale"] = not _is_active(job)
+
+    return job
+
+
+@task
+def run_job(id_segment, id_user, schema, roles):
+    """
+    Async task (zappa): builds the process list and dispatches the fold workers.
+    Outside lambda the task runs synchronously.
+    """
+    with _app_context():
+        user = _get_task_user(id_user=id_user, schema=schema, roles=roles)
+        dbSession.setSchema(user.schema)
+
+        job = _get_job(id_segment=id_segment, lock=True)
+        job["status"] = OutlierJobStatusEnum.RUNNING.value
+        job["startedAt"] = datetime.now().isoformat()
+        job["heartbeatAt"] = datetime.now().isoformat()
+
+        try:
+            if job["incremental"]:
+                process_list = outlier_service.get_outliers_incremental_process_list(
+                    id_segment=id_segment, user_context=user
+                )["processes"]
+            else:
+                process_list = outlier_service.get_outliers_process_list(
+                    id_segment=id_segment, user_context=user
+                )
+
+            job["folds"] = [
+                {
+                    "fold": index + 1,
+                    "idDrugList": p["params"].get("idDrugList", None),
+                    "status": OutlierJobStatusEnum.QUEUED.value,
+                    "startedAt": None,
+                    "duration": None,
+                    "error": None,
+                }
+                for index, p in enumerate(process_list)
+            ]
+
+            if len(job["folds"]) == 0:
+                job["status"] = OutlierJobStatusEnum.DONE.value
+                job["finishedAt"] = datetime.now().isoformat()
+
+            _commit_job(id_segment=id_segment, job=job, user=user)
+
+        except Exception as e:
+            db.session.rollback()
+            dbSession.setSchema(user.schema)
+
+            _log_error(e)
+
+            job = _get_job(id_segment=id_segment, lock=True)
+            job["status"] = OutlierJobStatusEnum.FAILED.value
+            job["error"] = str(e)
+            job["finishedAt"] = datetime.now().isoformat()
+            _commit_job(id_segment=id_segment, job=job, user=user)
+
+        db.session.close()
+        db.session.remove()
+
+    # each worker is a separate invocation (own process pool)
+    for _ in range(min(Config.OUTLIER_JOB_FOLDS, len(job["folds"]))):
+        run_folds(id_segment, id_user, schema, roles)
+
+
+@task
+def run_folds(id_segment, id_user, schema, roles):
+    """
+    Async task (zappa): generates the queued folds of the job, one at a time
+    """
+    start = time.monotonic()
+    dispatch = False
+
+    with _app_context():
+        user = _get_task_user(id_user=id_user, schema=schema, roles=roles)
+        dbSession.setSchema(user.schema)
+
+        while True:
+            fold = _claim_fold(id_segment=id_segment, user=user)
+            if fold == None:
+                break
+
+            _run_fold(id_segment=id_segment, fold=fold, user=user)
+
+            if time.monotonic() - start > WORKER_SECONDS:
+                dispatch = True
+                break
+
+        db.session.close()
+        db.session.remove()
+
+    if dispatch:
+        run_folds(id_segment, id_user, schema, roles)
+
+
+def _app_context():
+    # async tasks run outside the request (lambda event)
+    from mobile import app
+
+    return app.app_context()
+
+
+def _get_task_user(id_user, schema, roles):
+    # no jwt in the task context: user comes from the task payload
+    user = User()
+    user.id = id_user
+    user.schema = schema
+    user.config = {"roles": roles}
+
+    return user
+
+
+def _claim_fold(id_segment, user: User):
+    job = _get_job(id_segment=id_segment, lock=True)
+
+    if job == None or job["status"] != OutlierJobStatusEnum.RUNNING.value:
+        db.session.commit()
+        dbSession.setSchema(user.schema)
+        return None
+
+    for fold in job["folds"]:
+        if fold["status"] == OutlierJobStatusEnum.QUEUED.value:
+            fold["status"] = OutlierJobStatusEnum.RUNNING.value
+            fold["startedAt"] = datetime.now().isoformat()
+            job["heartbeatAt"] = datetime.now().isoformat()
+            _commit_job(id_segment=id_segment, job=job, user=user)
+
+            return fold
+
+    db.session.commit()
+    dbSession.setSchema(user.schema)
+
+    return None
+
+
+def _run_fold(id_segment, fold: dict, user: User):
+    start_date = datetime.fromisoformat(fold["startedAt"])
+
+    try:
+        outlier_service.generate(
+            id_drug=None,
+            id_segment=id_segment,
+            fold=fold["fold"],
+            id_drug_list=fold["idDrugList"],
+            user_context=user,
+        )
+        db.session.commit()
+
+        fold_status = OutlierJobStatusEnum.DONE.value
+        error = None
+    except Exception as e:
+        db.session.rollback()
+
+        _log_error(e)
+
+        fold_status = OutlierJobStatusEnum.FAILED.value
+        error = str(e)
+
+    dbSession.setSchema(user.schema)
+
+    job = _get_job(id_segment=id_segment, lock=True)
+    for f in job["folds"]:
+        if f["fold"] == fold["fold"]:
+            f["status"] = fold_status
+            f["error"] = error
+            f["duration"] = (datetime.now() - start_date).total_seconds()
+
+    job["heartbeatAt"] = datetime.now().isoformat()
+
+    finished = [
+        f
+        for f in job["folds"]
+        if f["status"]
+        in [OutlierJobStatusEnum.DONE.value, OutlierJobStatusEnum.FAILED.value]
+    ]
+    if len(finished) == len(job["folds"]):
+        failed = [
+            f for f in job["folds"] if f["status"] == OutlierJobStatusEnum.FAILED.value
+        ]
+        if len(failed) > 0:
+            job["status"] = OutlierJobStatusEnum.FAILED.value
+            job["error"] = f"{len(failed)} fold(s) com erro"
+        else:
+            job["status"] = OutlierJobStatusEnum.DONE.value
+
+        job["finishedAt"] = datetime.now().isoformat()
+
+    _commit_job(id_segment=id_segment, job=job, user=user)
+
+
+def _log_error(e: Exception):
+    logging.basicConfig()
+    logger = logging.getLogger("noharm.backend")
+    logger.exception(str(e))
+
+
+def _commit_job(id_segment, job: dict, user: User):
+    _save_job(id_segment=id_segment, job=job, id_user=user.id)
+    db.session.commit()
+
+    # a new transaction needs the schema again
+    dbSession.setSchema(user.schema)
+
+
+def _get_job_kind(id_segment):
+    return f"{MemoryEnum.OUTLIER_JOB.value}-{int(id_segment)}"
+
+
+def _get_job(id_segment, lock=False) -> dict:
+    # lock: fold workers of the same job update it concurrently
+    query = db.session.query(Memory).filter(Memory.kind == _get_job_kind(id_segment))
+    if lock:
+        query = query.with_for_update()
+
+    memory = query.first()
+
+    if memory == None:
+        return None
+
+    return {**memory.value, "folds": [dict(f) for f in memory.value["folds"]]}
+
+
+def _save_job(id_segment, job: dict, id_user):
+    memory = memory_service.get_memory(_get_job_kind(id_segment))
+
+    if memory == None:
+        memory = Memory()
+        memory.kind = _get_job_kind(id_segment)
+        db.session.add(memory)
+
+    job["updatedAt"] = datetime.now().isoformat()
+
+    # copy: json column does not track inner changes
+    memory.value = {**job, "folds": [dict(f) for f in job["folds"]]}
+    memory.update = datetime.today()
+    memory.user = id_user
+
+    db.session.flush()
+
+
+def _is_active(job: dict):
+    if job["status"] not in [
+        OutlierJobStatusEnum.QUEUED.value,
+        OutlierJobStatusEnum.RUNNING.value,
+    ]:
+        return False
+
+    # jobs created before the heartbeat
+    heartbeat_at = datetime.fromisoformat(job.get("heartbeatAt", job["updatedAt"]))
+    return datetime.now() - heartbeat_at < timedelta(minutes=JOB_STALE_MINUTES)
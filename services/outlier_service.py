@@ -1,14 +1,16 @@
 import io
 import pandas
 import logging
-from multiprocessing import Process, Manager
 from datetime import datetime
 from math import ceil
 from sqlalchemy import text, func, distinct, and_, or_, asc
 from typing import List
 from decimal import Decimal, ROUND_HALF_UP
 
+from config import Config
 from models.main import db, User, PrescriptionAgg
+from models.appendix import Memory
+from models.enums import MemoryEnum
 from models.prescription import (
     Outlier,
     Notes,
@@ -18,14 +20,26 @@ from models.prescription import (
     MeasureUnit,
     MeasureUnitConvert,
 )
-from utils.outlier_lib import add_score
+from utils.outlier_lib import add_score, score_columns, concat_scores
+from utils.process_pool import ProcessPool
+from utils.copyutils import BinaryCopyReader
 from exception.validation_error import ValidationError
 from services.admin import admin_drug_service, admin_integration_status_service
-from services import data_authorization_service, substance_service
+from services import data_authorization_service, substance_service, memory_service
 from decorators.has_permission_decorator import has_permission, Permission
 from utils import prescriptionutils, numberutils, stringutils, examutils, status
 
 FOLD_SIZE = 10
+HISTORY_SETTLE = "1 day"
+TRAINING_COLUMNS = [
+    ("medication", "int64"),
+    ("dose", "float64"),
+    ("frequency", "float64"),
+    ("count", "int64"),
+]
+
+# workers are started on the first generate call and reused by the next ones
+SCORE_POOL = ProcessPool(workers=Config.OUTLIER_WORKERS)
 
 
 @has_permission(Permission.WRITE_DRUG_SCORE)
@@ -74,8 +88,21 @@ def prepare(id_drug, id_segment, user_context: User):
         add_history_and_validate()
 
     else:
-        # refresh history to update frequency and dose
-        _refresh_agg(id_drug=id_drug, id_segment=id_segment, schema=user_context.schema)
+        watermark = _get_history_watermark(id_segment=id_segment, lock=True)
+
+        if str(id_drug) in watermark:
+            # add new prescriptions, expire old ones and update frequency and dose
+            _update_prescription_history(
+                id_segment=id_segment,
+                id_drug_list=[id_drug],
+                watermark=watermark,
+                user_context=user_context,
+            )
+        else:
+            # refresh history to update frequency and dose
+            _refresh_agg(
+                id_drug=id_drug, id_segment=id_segment, schema=user_context.schema
+            )
 
     # refresh outliers
     return refresh_outliers(id_drug=id_drug, id_segment=id_segment, user=user_context)
@@ -83,7 +110,12 @@ def prepare(id_drug, id_segment, user_context: User):
 
 @has_permission(Permission.WRITE_DRUG_SCORE, Permission.WRITE_SEGMENT_SCORE)
 def generate(
-    id_drug, id_segment, fold, user_context: User, user_permissions: List[Permission]
+    id_drug,
+    id_segment,
+    fold,
+    user_context: User,
+    user_permissions: List[Permission],
+    id_drug_list: List[int] = None,
 ):
     # call prepare before generate score (only for wizard)
     start_date = datetime.now()
@@ -105,106 +137,114 @@ def generate(
             status.HTTP_401_UNAUTHORIZED,
         )
 
-    csv_buffer = _get_csv_buffer(
-        id_segment=id_segment, schema=user_context.schema, id_drug=id_drug, fold=fold
+    drugs = _get_training_data(
+        id_segment=id_segment,
+        schema=user_context.schema,
+        id_drug=id_drug,
+        fold=fold,
+        id_drug_list=id_drug_list,
     )
-    _log_perf(start_date, "GENERATE CSV BUFFER")
+    _log_perf(start_date, "GET TRAINING DATA")
 
     start_date = datetime.now()
 
-    manager = Manager()
-    drugs = pandas.read_csv(csv_buffer)
     drugs_list = drugs["medication"].unique().astype(float)
-    outliers = (
-        Outlier.query.filter(Outlier.idSegment == id_segment)
+    outliers = pandas.DataFrame(
+        db.session.query(Outlier.id, Outlier.idDrug, Outlier.dose, Outlier.frequency)
+        .filter(Outlier.idSegment == id_segment)
         .filter(Outlier.idDrug.in_(drugs_list))
-        .all()
+        .all(),
+        columns=["id", "medication", "dose", "frequency"],
     )
 
     _log_perf(start_date, "GET OUTLIERS LIST")
 
     start_date = datetime.now()
 
-    with Manager() as manager:
-        poolDict = manager.dict()
-
-        processes = []
-        for idDrug in drugs["medication"].unique():
-            drugsItem = drugs[drugs["medication"] == idDrug]
-            process = Process(
-                target=_compute_outlier,
-                args=(
-                    idDrug,
-                    drugsItem,
-                    poolDict,
-                    fold,
-                ),
-            )
-            processes.append(process)
+    scores = SCORE_POOL.map(
+        _compute_outlier,
+        [
+            (idDrug, drugsItem, fold)
+            for idDrug, drugsItem in drugs.groupby("medication", sort=False)
+        ],
+        chunk_size=Config.OUTLIER_CHUNK_SIZE,
+    )
 
-        for process in processes:
-            process.start()
+    new_os = concat_scores(scores)
 
-        for process in processes:
-            process.join()
+    _log_perf(start_date, "PROCESS SCORES")
 
-        new_os = pandas.DataFrame()
+    start_date = datetime.now()
 
-        for drug in poolDict:
-            new_os = new_os.append(poolDict[drug])
+    updated = _update_scores(outliers=outliers, new_os=new_os, user=user_context)
 
-    _log_perf(start_date, "PROCESS SCORES")
+    if updated > 0:
+        _log_perf(start_date, "UPDATE SCORES")
 
-    start_date = datetime.now()
+    _commit_watermark(
+        id_segment=id_segment,
+        id_drug_list=[int(d) for d in drugs_list],
+        user_context=user_context,
+    )
 
-    updates = []
-    for o in outliers:
-        no = new_os[
-            (new_os["medication"] == o.idDrug)
-            & (new_os["dose"] == o.dose)
-            & (new_os["frequency"] == o.frequency)
-        ]
-        if len(no) > 0:
-            updates.append(
-                _to_update_row(
-                    {
-                        "id": o.id,
-                        "score": no["score"].values[0],
-                        "countNum": int(no["count"].values[0]),
-                    },
-                    user_context,
-                )
-            )
 
-    if len(updates) > 0:
-        update_stmt = f"""
-            with scores as (
-                select * from (values {",".join(updates)}) AS t (idoutlier, score, countnum, update_at, update_by)
-            )
-            update {user_context.schema}.outlier o
-            set 
-                contagem = s.countnum,
-                escore = s.score,
-                update_at = s.update_at,
-                update_by = s.update_by
-            from
-                scores s
-            where 
-                s.idoutlier = o.idoutlier
-        """
+def _update_scores(outliers: pandas.DataFrame, new_os: pandas.DataFrame, user: User):
+    # match scores with outlier ids (first score found for each dose/frequency)
+    keys = ["medication", "dose", "frequency"]
 
-        db.session.execute(text(update_stmt))
+    # null dose/frequency never matched (sql equality) and drugs without score are skipped
+    outliers = outliers.dropna(subset=keys)
+    new_os = new_os.dropna(subset=keys + ["score", "count"])
 
-        _log_perf(start_date, "UPDATE SCORES")
+    scores = outliers.merge(
+        new_os.drop_duplicates(subset=keys, keep="first"), on=keys, how="inner"
+    )
+
+    if len(scores) == 0:
+        return 0
+
+    csv_buffer = io.StringIO()
+    scores[["id", "score", "count"]].astype(int).to_csv(
+        csv_buffer, index=False, header=False
+    )
+    csv_buffer.seek(0)
+
+    db.session.execute(
+        text(
+            """
+            create temp table tmp_outlier_score (
+                idoutlier bigint, escore integer, contagem integer
+            ) on commit drop
+        """
+        )
+    )
+
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.copy_expert("COPY tmp_outlier_score FROM STDIN WITH CSV", csv_buffer)
+
+    update_stmt = f"""
+        update {user.schema}.outlier o
+        set 
+            contagem = s.contagem,
+            escore = s.escore,
+            update_at = :updateAt,
+            update_by = :updateBy
+        from
+            tmp_outlier_score s
+        where 
+            s.idoutlier = o.idoutlier
+    """
 
+    db.session.execute(
+        text(update_stmt), {"updateAt": datetime.today(), "updateBy": user.id}
+    )
 
-def _to_update_row(update: dict, user: User):
-    return f"""({update["id"]}, {update["score"]}, {update["countNum"]}, '{datetime.today().isoformat()}'::timestamp, {user.id})"""
+    return len(scores)
 
 
-def refresh_outliers(id_segment, user, id_drug=None):
+def refresh_outliers(id_segment, user, id_drug=None, id_drug_list=None):
     # clean old outliers
-    _clean_outliers(id_drug=id_drug, id_segment=id_segment)
+    _clean_outliers(id_drug=id_drug, id_segment=id_segment, id_drug_list=id_drug_list)
 
     # insert new ones
     params = {
@@ -229,6 +269,10 @@ def refresh_outliers(id_segment, user, id_drug=None):
         params["idDrug"] = id_drug
         query += " and fkmedicamento = :idDrug "
 
+    if id_drug_list != None:
+        params["idDrugList"] = id_drug_list
+        query += " and fkmedicamento = any(:idDrugList) "
+
     query += f"""
         GROUP BY 
             idsegmento, fkmedicamento, ROUND(doseconv::numeric,2), frequenciadia
@@ -238,11 +282,17 @@ def refresh_outliers(id_segment, user, id_drug=None):
     return db.session.execute(text(query), params)
 
 
-def _get_csv_buffer(id_segment, schema, id_drug=None, fold=None):
+def _get_training_data(
+    id_segment, schema, id_drug=None, fold=None, id_drug_list=None
+) -> pandas.DataFrame:
     params = [id_segment]
+    # fixed size types for the binary reader (numeric cast keeps the same values as the text output)
     query = f"""
         SELECT 
-            fkmedicamento as medication, doseconv as dose, frequenciadia as frequency, contagem as count
+            fkmedicamento::int8 as medication,
+            coalesce(doseconv::numeric::float8, 'NaN') as dose,
+            coalesce(frequenciadia::numeric::float8, 'NaN') as frequency,
+            coalesce(contagem, 0)::int8 as count
         FROM
             {schema}.outlier
         WHERE 
@@ -252,6 +302,9 @@ def _get_csv_buffer(id_segment, schema, id_drug=None, fold=None):
     if id_drug != None:
         params.append(id_drug)
         query += " and fkmedicamento = %s "
+    elif id_drug_list != None:
+        params.append(id_drug_list)
+        query += " and fkmedicamento = any(%s) "
     else:
         params.append(id_segment)
         params.append(FOLD_SIZE)
@@ -269,17 +322,19 @@ def _get_csv_buffer(id_segment, schema, id_drug=None, fold=None):
             )
         """
 
-    outputquery = "COPY ({0}) TO STDOUT WITH CSV HEADER".format(query)
+    outputquery = "COPY ({0}) TO STDOUT WITH BINARY".format(query)
 
     conn = db.engine.raw_connection()
-    cursor = conn.cursor()
-    copy_query = cursor.mogrify(outputquery, tuple(params))
+    try:
+        cursor = conn.cursor()
+        copy_query = cursor.mogrify(outputquery, tuple(params))
 
-    csv_buffer = io.StringIO()
-    cursor.copy_expert(copy_query, csv_buffer)
-    csv_buffer.seek(0)
+        reader = BinaryCopyReader(TRAINING_COLUMNS)
+        cursor.copy_expert(copy_query, reader)
+    finally:
+        conn.close()
 
-    return csv_buffer
+    return pandas.DataFrame(reader.arrays())
 
 
 def _log_perf(start_date, section):
@@ -290,19 +345,26 @@ def _log_perf(start_date, section):
     logger.debug(f"PERF {section}: {(end_date-start_date).total_seconds()}")
 
 
-def _compute_outlier(idDrug, drugsItem, poolDict, fold):
+def _compute_outlier(idDrug, drugsItem, fold):
     print("Starting...", fold, idDrug)
-    poolDict[idDrug] = add_score(drugsItem)
+    scores = add_score(
+        drugsItem, engine=Config.OUTLIER_ENGINE, n_neighbors=Config.OUTLIER_NEIGHBORS
+    )
     print("End...", fold, idDrug)
 
+    return score_columns(scores)
+
 
-def _clean_outliers(id_drug, id_segment):
+def _clean_outliers(id_drug, id_segment, id_drug_list=None):
     q = db.session.query(Outlier).filter(Outlier.idSegment == id_segment)
 
     if id_drug != None:
         q = q.filter(Outlier.idDrug == id_drug)
 
-    q.delete()
+    if id_drug_list != None:
+        q = q.filter(Outlier.idDrug.in_(id_drug_list))
+
+    q.delete(synchronize_session=False)
 
 
 @has_permission(Permission.MAINTAINER)
@@ -310,12 +372,85 @@ def add_prescription_history(
     id_drug, id_segment, user_context: User, clean=False, rollback_when_empty=False
 ):
     schema = user_context.schema
+    start_date, end_date = _get_history_window()
+    watermark = _get_history_watermark(id_segment=id_segment, lock=True)
 
     if clean:
         db.session.query(PrescriptionAgg).filter(
             PrescriptionAgg.idDrug == id_drug
         ).filter(PrescriptionAgg.idSegment == id_segment).delete()
 
+    _insert_prescription_history(
+        schema=schema,
+        id_segment=id_segment,
+        id_drug_list=[id_drug],
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+    watermark[str(id_drug)] = {
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+    }
+    _save_history_watermark(
+        id_segment=id_segment, watermark=watermark, user_context=user_context
+    )
+
+    count = (
+        db.session.query(PrescriptionAgg)
+        .filter(PrescriptionAgg.idDrug == id_drug)
+        .filter(PrescriptionAgg.idSegment == id_segment)
+        .count()
+    )
+
+    if rollback_when_empty and count == 0:
+        raise ValidationError(
+            "Este medicamento não foi prescrito no último ano neste segmento",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    return count
+
+
+def _refresh_agg(id_drug, id_segment, schema):
+    query = text(
+        f"""
+        insert into {schema}.prescricaoagg
+        select * from {schema}.prescricaoagg where fkmedicamento = :idDrug and idsegmento = :idSegment
+    """
+    )
+
+    return db.session.execute(query, {"idSegment": id_segment, "idDrug": id_drug})
+
+
+@has_permission(Permission.WRITE_SEGMENT_SCORE)
+def refresh_prescription_history(id_segment, user_context: User):
+    """
+    Maintenance step: moves the one year window of every drug aggregated in
+    prescricaoagg (see add_prescription_history) up to now.
+    """
+    watermark = _get_history_watermark(id_segment=id_segment, lock=True)
+
+    windows = {}
+    for id_drug, window in watermark.items():
+        windows.setdefault((window["start"], window["end"]), []).append(int(id_drug))
+
+    drug_count = 0
+    for id_drug_list in windows.values():
+        drug_count += _update_prescription_history(
+            id_segment=id_segment,
+            id_drug_list=id_drug_list,
+            watermark=watermark,
+            user_context=user_context,
+        )
+
+    return drug_count
+
+
+def _insert_prescription_history(
+    schema, id_segment, id_drug_list: list, start_date, end_date
+):
     query = text(
         f"""
         INSERT INTO 
@@ -343,9 +478,10 @@ def add_prescription_history(
             left join {schema}.frequencia f on f.fkfrequencia = pm.fkfrequencia
             left join {schema}.pessoa ps on (p.nratendimento = ps.nratendimento and p.fkpessoa = ps.fkpessoa)
         where 
-            p.dtprescricao > now() - interval '1 year'
+            p.dtprescricao > :startDate
+            and p.dtprescricao <= :endDate
             and p.idsegmento = :idSegment
-            and pm.fkmedicamento = :idDrug
+            and pm.fkmedicamento = any(:idDrugList)
             and pm.dose is not null
             and pm.frequenciadia is not null 
         group by 
@@ -353,54 +489,285 @@ def add_prescription_history(
     """
     )
 
-    db.session.execute(query, {"idSegment": id_segment, "idDrug": id_drug})
+    return db.session.execute(
+        query,
+        {
+            "idSegment": id_segment,
+            "idDrugList": id_drug_list,
+            "startDate": start_date,
+            "endDate": end_date,
+        },
+    )
 
-    count = (
-        db.session.query(PrescriptionAgg)
-        .filter(PrescriptionAgg.idDrug == id_drug)
-        .filter(PrescriptionAgg.idSegment == id_segment)
-        .count()
+
+def _update_prescription_history(
+    id_segment, id_drug_list, watermark: dict, user_context: User
+):
+    # all drugs in id_drug_list must have the same window
+    schema = user_context.schema
+    window = watermark[str(id_drug_list[0])]
+    start_date, end_date = _get_history_window()
+
+    history_query = f"""
+        SELECT 
+            p.fkhospital, p.fksetor, p.idsegmento, pm.fkmedicamento, pm.fkunidademedida, 
+            f.fkfrequencia, pm.dose, coalesce(f.frequenciadia , pm.frequenciadia) as frequenciadia, 
+            coalesce(ps.peso, 999) as peso, count(*) as contagem
+        FROM 
+            {schema}.presmed pm
+            inner join {schema}.prescricao p on pm.fkprescricao = p.fkprescricao
+            left join {schema}.frequencia f on f.fkfrequencia = pm.fkfrequencia
+            left join {schema}.pessoa ps on (p.nratendimento = ps.nratendimento and p.fkpessoa = ps.fkpessoa)
+        where 
+            p.dtprescricao > {{from_date}}
+            and p.dtprescricao <= {{to_date}}
+            and p.idsegmento = :idSegment
+            and pm.fkmedicamento = any(:idDrugList)
+            and pm.dose is not null
+            and pm.frequenciadia is not null 
+        group by 
+            1,2,3,4,5,6,7,8,9
+    """
+    params = {
+        "idSegment": id_segment,
+        "idDrugList": id_drug_list,
+        "lastStart": datetime.fromisoformat(window["start"]),
+        "lastEnd": datetime.fromisoformat(window["end"]),
+        "startDate": start_date,
+        "endDate": end_date,
+    }
+
+    # prescriptions that left the window, grouped with the current patient data
+    db.session.execute(
+        text(
+            f"""
+            create temp table tmp_prescricaoagg_expired on commit drop as
+            {history_query.format(from_date=":lastStart", to_date=":startDate")}
+        """
+        ),
+        params,
     )
 
-    if rollback_when_empty and count == 0:
-        raise ValidationError(
-            "Este medicamento não foi prescrito no último ano neste segmento",
-            "errors.invalidParams",
-            status.HTTP_400_BAD_REQUEST,
+    # expired groups must match the rows as they were added (ex: weight or frequency
+    # changed since then): drugs that do not cancel out are aggregated again
+    rebuild_list = [
+        row.fkmedicamento
+        for row in db.session.execute(
+            text(
+                f"""
+                select distinct e.fkmedicamento
+                from 
+                    (
+                        select 
+                            fkhospital, fksetor, fkmedicamento, fkunidademedida, 
+                            fkfrequencia, dose, frequenciadia, peso, sum(contagem) as contagem
+                        from 
+                            tmp_prescricaoagg_expired
+                        group by 
+                            fkhospital, fksetor, fkmedicamento, fkunidademedida, 
+                            fkfrequencia, dose, frequenciadia, peso
+                    ) e
+                    left join (
+                        select 
+                            fkhospital, fksetor, fkmedicamento, fkunidademedida, 
+                            fkfrequencia, dose, frequenciadia, peso, sum(contagem) as contagem
+                        from 
+                            {schema}.prescricaoagg
+                        where 
+                            idsegmento = :idSegment
+                            and fkmedicamento = any(:idDrugList)
+                        group by 
+                            fkhospital, fksetor, fkmedicamento, fkunidademedida, 
+                            fkfrequencia, dose, frequenciadia, peso
+                    ) a on (
+                        a.fkhospital is not distinct from e.fkhospital
+                        and a.fksetor is not distinct from e.fksetor
+                        and a.fkmedicamento = e.fkmedicamento
+                        and a.fkunidademedida is not distinct from e.fkunidademedida
+                        and a.fkfrequencia is not distinct from e.fkfrequencia
+                        and a.dose is not distinct from e.dose
+                        and a.frequenciadia is not distinct from e.frequenciadia
+                        and a.peso is not distinct from e.peso
+                    )
+                where 
+                    a.contagem is null 
+                    or a.contagem < e.contagem
+            """
+            ),
+            params,
+        ).all()
+    ]
+    incremental_list = [d for d in id_drug_list if d not in rebuild_list]
+
+    if len(incremental_list) > 0:
+        # current rows + prescriptions after the last end - prescriptions that left the window
+        db.session.execute(
+            text(
+                f"""
+                create temp table tmp_prescricaoagg on commit drop as
+                select 
+                    fkhospital, fksetor, idsegmento, fkmedicamento, fkunidademedida, 
+                    fkfrequencia, dose, frequenciadia, peso, sum(contagem) as contagem
+                from (
+                    select 
+                        fkhospital, fksetor, idsegmento, fkmedicamento, fkunidademedida, 
+                        fkfrequencia, dose, frequenciadia, peso, contagem
+                    from 
+                        {schema}.prescricaoagg
+                    where 
+                        idsegmento = :idSegment
+                        and fkmedicamento = any(:idDrugList)
+                    union all
+                    {history_query.format(from_date=":lastEnd", to_date=":endDate")}
+                    union all
+                    select
+                        fkhospital, fksetor, idsegmento, fkmedicamento, fkunidademedida, 
+                        fkfrequencia, dose, frequenciadia, peso, -contagem
+                    from 
+                        tmp_prescricaoagg_expired
+                ) history
+                where
+                    fkmedicamento = any(:incrementalList)
+                -- same groups as _insert_prescription_history (frequenciadia included:
+                -- rows without fkfrequencia are not merged across daily frequencies)
+                group by 
+                    fkhospital, fksetor, idsegmento, fkmedicamento, fkunidademedida, 
+                    fkfrequencia, dose, frequenciadia, peso
+                having 
+                    sum(contagem) > 0
+            """
+            ),
+            {**params, "incrementalList": incremental_list},
         )
 
-    return count
+        db.session.query(PrescriptionAgg).filter(
+            PrescriptionAgg.idDrug.in_(incremental_list)
+        ).filter(PrescriptionAgg.idSegment == id_segment).delete(
+            synchronize_session=False
+        )
 
+        # insert trigger updates doseconv and frequency (same as _refresh_agg)
+        db.session.execute(
+            text(
+                f"""
+                insert into {schema}.prescricaoagg 
+                    (
+                        fkhospital, fksetor, idsegmento, fkmedicamento, 
+                        fkunidademedida, fkfrequencia, dose, doseconv, 
+                        frequenciadia, peso, contagem
+                    )
+                select 
+                    fkhospital, fksetor, idsegmento, fkmedicamento, 
+                    fkunidademedida, fkfrequencia, dose, dose, 
+                    frequenciadia, peso, contagem
+                from 
+                    tmp_prescricaoagg
+            """
+            )
+        )
+        db.session.execute(text("drop table tmp_prescricaoagg"))
 
-def _refresh_agg(id_drug, id_segment, schema):
-    query = text(
-        f"""
-        insert into {schema}.prescricaoagg
-        select * from {schema}.prescricaoagg where fkmedicamento = :idDrug and idsegmento = :idSegment
-    """
+    if len(rebuild_list) > 0:
+        print("Rebuild history:", len(rebuild_list))
+
+        db.session.query(PrescriptionAgg).filter(
+            PrescriptionAgg.idDrug.in_(rebuild_list)
+        ).filter(PrescriptionAgg.idSegment == id_segment).delete(
+            synchronize_session=False
+        )
+
+        _insert_prescription_history(
+            schema=schema,
+            id_segment=id_segment,
+            id_drug_list=rebuild_list,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+    db.session.execute(text("drop table tmp_prescricaoagg_expired"))
+
+    for id_drug in id_drug_list:
+        watermark[str(id_drug)] = {
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+        }
+    _save_history_watermark(
+        id_segment=id_segment, watermark=watermark, user_context=user_context
     )
 
-    return db.session.execute(query, {"idSegment": id_segment, "idDrug": id_drug})
+    return len(id_drug_list)
+
+
+def _get_history_window():
+    # one year window (database clock, same as the prescriptions dates). It ends
+    # HISTORY_SETTLE before now: prescriptions that arrive late from the integration
+    # are still after the end and are added by the next update
+    return db.session.execute(
+        text(
+            f"""
+            select 
+                localtimestamp - interval '{HISTORY_SETTLE}' - interval '1 year', 
+                localtimestamp - interval '{HISTORY_SETTLE}'
+        """
+        )
+    ).first()
+
+
+def _get_history_watermark_kind(id_segment):
+    return f"{MemoryEnum.PRESCRIPTION_AGG_WATERMARK.value}-{int(id_segment)}"
+
+
+def _get_history_watermark(id_segment, lock=False) -> dict:
+    # lock: concurrent updates must not restore an older window (counts would be added twice)
+    query = db.session.query(Memory).filter(
+        Memory.kind == _get_history_watermark_kind(id_segment)
+    )
+    if lock:
+        query = query.with_for_update()
+
+    memory = query.first()
+
+    return dict(memory.value) if memory != None else {}
+
+
+def _save_history_watermark(id_segment, watermark: dict, user_context: User):
+    memory = memory_service.get_memory(_get_history_watermark_kind(id_segment))
+
+    if memory == None:
+        memory = Memory()
+        memory.kind = _get_history_watermark_kind(id_segment)
+        db.session.add(memory)
+
+    memory.value = dict(watermark)
+    memory.update = datetime.today()
+    memory.user = user_context.id
+
+    db.session.flush()
 
 
 @has_permission(Permission.WRITE_SEGMENT_SCORE)
 def get_outliers_process_list(id_segment, user_context: User):
-    pending_frequencies = admin_integration_status_service._get_pending_frequencies()
-    if pending_frequencies > 0:
-        raise ValidationError(
-            "Existem frequências pendentes de conversão. Configure todas as frequências antes de gerar os escores.",
-            "errors.business",
-            status.HTTP_400_BAD_REQUEST,
-        )
+    _validate_pending_frequencies()
 
     print("Init Schema:", user_context.schema, "Segment:", id_segment)
 
+    fingerprints = _get_agg_fingerprints(
+        id_segment=id_segment, schema=user_context.schema
+    )
+
     result = refresh_outliers(id_segment=id_segment, user=user_context)
     print("RowCount", result.rowcount)
 
     # fix inconsistencies after outlier insert
     admin_drug_service.fix_inconsistency()
 
+    # all outliers were recreated: drugs are scored again by the folds
+    _save_watermark(
+        id_segment=id_segment,
+        watermark={"scored": {}, "pending": fingerprints},
+        user_context=user_context,
+    )
+
     totalCount = (
         db.session.query(func.count(distinct(Outlier.idDrug)))
         .select_from(Outlier)
@@ -424,6 +791,183 @@ def get_outliers_process_list(id_segment, user_context: User):
     return processesUrl
 
 
+@has_permission(Permission.WRITE_SEGMENT_SCORE)
+def get_outliers_incremental_process_list(id_segment, user_context: User):
+    """
+    Process list only for drugs whose prescricaoagg rows changed since they were
+    last scored: {"processes", "changed", "skipped"}
+    """
+    _validate_pending_frequencies()
+
+    print("Init Schema:", user_context.schema, "Segment:", id_segment)
+
+    fingerprints = _get_agg_fingerprints(
+        id_segment=id_segment, schema=user_context.schema
+    )
+    watermark = _get_watermark(id_segment=id_segment, lock=True)
+    scored = watermark["scored"]
+
+    unscored = (
+        db.session.query(Outlier.idDrug)
+        .filter(Outlier.idSegment == id_segment)
+        .filter(Outlier.score == None)
+        .distinct()
+        .all()
+    )
+
+    changed = set(
+        [
+            id_drug
+            for id_drug in fingerprints
+            if scored.get(id_drug) != fingerprints[id_drug]
+        ]
+    )
+    # drugs without history anymore
+    changed.update([id_drug for id_drug in scored if id_drug not in fingerprints])
+    # refreshed but not scored (ex: manual refresh)
+    changed.update([str(u.idDrug) for u in unscored])
+
+    id_drug_list = sorted([int(id_drug) for id_drug in changed])
+    skipped = len(fingerprints) - len([d for d in changed if d in fingerprints])
+
+    print("Incremental:", "Changed:", len(id_drug_list), "Skipped:", skipped)
+
+    if len(id_drug_list) > 0:
+        result = refresh_outliers(
+            id_segment=id_segment, user=user_context, id_drug_list=id_drug_list
+        )
+        print("RowCount", result.rowcount)
+
+        # fix inconsistencies after outlier insert
+        admin_drug_service.fix_inconsistency()
+
+    # changed drugs are moved to scored after their fold is updated (generate)
+    for id_drug in changed:
+        scored.pop(id_drug, None)
+        watermark["pending"].pop(id_drug, None)
+
+        if id_drug in fingerprints:
+            watermark["pending"][id_drug] = fingerprints[id_drug]
+
+    _save_watermark(
+        id_segment=id_segment, watermark=watermark, user_context=user_context
+    )
+
+    processesUrl = []
+    for fold, index in enumerate(range(0, len(id_drug_list), FOLD_SIZE), start=1):
+        processesUrl.append(
+            {
+                "url": f"/outliers/generate/fold/{str(int(id_segment))}/{str(fold)}",
+                "method": "POST",
+                "params": {"idDrugList": id_drug_list[index : index + FOLD_SIZE]},
+            }
+        )
+
+    return {
+        "processes": processesUrl,
+        "changed": len(id_drug_list),
+        "skipped": skipped,
+    }
+
+
+def _validate_pending_frequencies():
+    pending_frequencies = admin_integration_status_service._get_pending_frequencies()
+    if pending_frequencies > 0:
+        raise ValidationError(
+            "Existem frequências pendentes de conversão. Configure todas as frequências antes de gerar os escores.",
+            "errors.business",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+def _get_agg_fingerprints(id_segment, schema):
+    # state of prescricaoagg rows used to build outliers (same filters as refresh_outliers)
+    query = text(
+        f"""
+        select
+            fkmedicamento, md5(string_agg(item, ',' order by item)) as fingerprint
+        from (
+            select
+                fkmedicamento,
+                concat_ws(':', ROUND(doseconv::numeric,2), frequenciadia, contagem) as item
+            from
+                {schema}.prescricaoagg
+            where
+                idsegmento = :idSegment
+                and frequenciadia is not null and doseconv is not null and dose > 0
+        ) agg
+        group by
+            fkmedicamento
+    """
+    )
+
+    fingerprints = {}
+    for row in db.session.execute(query, {"idSegment": id_segment}).all():
+        fingerprints[str(row.fkmedicamento)] = row.fingerprint
+
+    return fingerprints
+
+
+def _get_watermark_kind(id_segment):
+    return f"{MemoryEnum.OUTLIER_WATERMARK.value}-{int(id_segment)}"
+
+
+def _get_watermark(id_segment, lock=False) -> dict:
+    """
+    scored: fingerprint of the drugs with updated scores
+    pending: fingerprint of the refreshed drugs, waiting for their fold
+    """
+    # lock: folds of the same segment update the watermark concurrently
+    query = db.session.query(Memory).filter(
+        Memory.kind == _get_watermark_kind(id_segment)
+    )
+    if lock:
+        query = query.with_for_update()
+
+    memory = query.first()
+    value = memory.value if memory != None else {}
+
+    return {
+        "scored": dict(value.get("scored", {})),
+        "pending": dict(value.get("pending", {})),
+    }
+
+
+def _save_watermark(id_segment, watermark: dict, user_context: User):
+    memory = memory_service.get_memory(_get_watermark_kind(id_segment))
+
+    if memory == None:
+        memory = Memory()
+        memory.kind = _get_watermark_kind(id_segment)
+        db.session.add(memory)
+
+    memory.value = {
+        "scored": dict(watermark["scored"]),
+        "pending": dict(watermark["pending"]),
+    }
+    memory.update = datetime.today()
+    memory.user = user_context.id
+
+    db.session.flush()
+
+
+def _commit_watermark(id_segment, id_drug_list: list, user_context: User):
+    # scores updated: pending fingerprints are now the scored ones
+    watermark = _get_watermark(id_segment=id_segment, lock=True)
+
+    changed = False
+    for id_drug in id_drug_list:
+        fingerprint = watermark["pending"].pop(str(id_drug), None)
+        if fingerprint != None:
+            watermark["scored"][str(id_drug)] = fingerprint
+            changed = True
+
+    if changed:
+        _save_watermark(
+            id_segment=id_segment, watermark=watermark, user_context=user_context
+        )
+
+
 @has_permission(Permission.WRITE_SEGMENT_SCORE)
 def remove_outlier(id_drug, id_segment):
     count = (
@@ -1,3 +1,4 @@
+import logging
 from sqlalchemy import desc, text, select, func, and_
 from flask_sqlalchemy.session import Session
 from datetime import date, datetime, timedelta
@@ -22,10 +23,15 @@ from services import (
     prescription_check_service,
     prescription_view_service,
     feature_service,
+    prescription_index_service,
 )
 from exception.validation_error import ValidationError
 from decorators.has_permission_decorator import has_permission, Permission
-from utils import status, prescriptionutils
+from utils import status, prescriptionutils, cacheutils
+from config import Config
+
+# max prescriptions per batch call
+PRESCALC_BATCH_LIMIT = 5000
 
 
 @has_permission(Permission.READ_STATIC)
@@ -33,7 +39,90 @@ def create_agg_prescription_by_prescription(
     schema, id_prescription, out_patient, user_context: User, force=False
 ):
     _set_schema(schema)
+    _validate_prescription_flow()
+
+    _create_agg_prescription_by_prescription(
+        schema=schema,
+        id_prescription=id_prescription,
+        out_patient=out_patient,
+        user_context=user_context,
+        force=force,
+    )
+
+
+@has_permission(Permission.READ_STATIC)
+def create_agg_prescription_by_prescription_list(
+    schema, id_prescription_list, out_patient, user_context: User, force=False
+):
+    """
+    Batch prescalc: schema, permissions and reference data (configs, segment exams)
+    are resolved once. Each prescription runs in a savepoint, so one failure does
+    not discard the others, and the transaction is committed in chunks.
+    """
+    if not id_prescription_list or len(id_prescription_list) > PRESCALC_BATCH_LIMIT:
+        raise ValidationError(
+            f"Lista de prescrições inválida (máximo {PRESCALC_BATCH_LIMIT})",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    _set_schema(schema)
+    _validate_prescription_flow()
+    cacheutils.enable_reference_cache()
+
+    chunk_size = max(Config.PRESCALC_BATCH_CHUNK_SIZE, 1)
+    results = []
+    for i in range(0, len(id_prescription_list), chunk_size):
+        for id_prescription in id_prescription_list[i : i + chunk_size]:
+            try:
+                with db.session.begin_nested():
+                    processed = _create_agg_prescription_by_prescription(
+                        schema=schema,
+                        id_prescription=id_prescription,
+                        out_patient=out_patient,
+                        user_context=user_context,
+                        force=force,
+                    )
 
+                results.append(
+                    {
+                        "idPrescription": id_prescription,
+                        "status": "success" if processed else "skipped",
+                    }
+                )
+            except ValidationError as e:
+                results.append(
+                    {
+                        "idPrescription": id_prescription,
+                        "status": "error",
+                        "message": str(e),
+                        "code": e.code,
+                    }
+                )
+            except Exception as e:
+                logging.basicConfig()
+                logger = logging.getLogger("noharm.backend")
+                logger.exception(
+                    f"prescalc error ({schema}:{id_prescription}): {str(e)}"
+                )
+
+                results.append(
+                    {
+                        "idPrescription": id_prescription,
+                        "status": "error",
+                        "message": "Ocorreu um erro inesperado.",
+                        "code": "errors.unexpectedError",
+                    }
+                )
+
+        db.session.commit()
+        dbSession.setSchema(schema)
+        cacheutils.clear_reference_cache()
+
+    return results
+
+
+def _validate_prescription_flow():
     if feature_service.is_cpoe():
         raise ValidationError(
             "CPOE deve acionar o fluxo por atendimento",
@@ -41,6 +130,10 @@ def create_agg_prescription_by_prescription(
             status.HTTP_400_BAD_REQUEST,
         )
 
+
+def _create_agg_prescription_by_prescription(
+    schema, id_prescription, out_patient, user_context: User, force=False
+):
     p = Prescription.query.get(id_prescription)
     if p is None:
         raise ValidationError(
@@ -50,25 +143,26 @@ def create_agg_prescription_by_prescription(
         )
 
     if p.idSegment is None:
-        return
+        return False
 
     processed_status = _get_processed_status(id_prescription=id_prescription)
 
     if not force and processed_status == "PROCESSED":
-        return
+        return False
 
-    prescription_data = prescription_view_service.static_get_prescription(
+    prescription_data = prescription_view_service.static_get_prescription_features(
         id_prescription=id_prescription, user_context=user_context
     )
     p.features = prescriptionutils.getFeatures(prescription_data)
     p.aggDrugs = p.features["drugIDs"]
     p.aggDeps = [p.idDepartment]
+    prescription_index_service.update_index(prescription=p)
 
     if p.concilia != None:
         db.session.flush()
         _update_patient_conciliation_status(prescription=p)
 
-        return
+        return True
 
     pdate = p.date
 
@@ -112,7 +206,7 @@ def create_agg_prescription_by_prescription(
     if is_new_prescription:
         _audit_create(prescription=pAgg)
 
-    agg_data = prescription_view_service.static_get_prescription(
+    agg_data = prescription_view_service.static_get_prescription_features(
         id_prescription=pAgg.id, user_context=user_context
     )
 
@@ -125,6 +219,7 @@ def create_agg_prescription_by_prescription(
     pAgg.features = features
     pAgg.aggDrugs = pAgg.features["drugIDs"]
     pAgg.aggDeps = pAgg.features["departmentList"]
+    prescription_index_service.update_index(prescription=pAgg)
 
     if p.concilia is None and (pAgg.status == "s" or p.status == "s"):
         prescalc_user = User()
@@ -167,6 +262,8 @@ def create_agg_prescription_by_prescription(
 
     _log_processed_date(id_prescription_array=[id_prescription], schema=schema)
 
+    return True
+
 
 @has_permission(Permission.READ_STATIC)
 def create_agg_prescription_by_date(
@@ -209,7 +306,7 @@ def create_agg_prescription_by_date(
 
         _audit_create(prescription=agg_p)
 
-    agg_data = prescription_view_service.static_get_prescription(
+    agg_data = prescription_view_service.static_get_prescription_features(
         id_prescription=agg_p.id, user_context=user_context
     )
 
@@ -223,6 +320,7 @@ def create_agg_prescription_by_date(
     agg_p.aggDrugs = agg_p.features["drugIDs"]
     agg_p.aggDeps = agg_p.features["departmentList"]
     agg_p.update = datetime.today()
+    prescription_index_service.update_index(prescription=agg_p)
 
     internal_prescription_ids = internal_prescription_ids = (
         prescriptionutils.get_internal_prescription_ids(result=agg_data)
@@ -0,0 +1,198 @@
+import json
+import time
+import logging
+from datetime import date
+from flask import current_app
+from sqlalchemy import text, event
+from sqlalchemy.orm import Session
+from redis.exceptions import RedisError
+
+from models.main import db, redis_client
+from services import relation_index_service
+
+# cached views expire even without changes (relative data like age and days)
+CACHE_EXPIRE_IN = 6 * 60 * 60
+
+# version stamps older than the day part of the version do not need to be kept
+VERSION_EXPIRE_IN = 2 * 24 * 60 * 60
+
+SESSION_INVALIDATE_KEY = "prescription_cache_invalidate"
+
+
+def get_version(
+    id_prescription: int, schema: str, extra: list = [], memory_kinds: list = []
+):
+    """
+    Version stamp of the prescription view: changes when the prescriptions of the
+    admission, its drugs, interventions, patient, exams, clinical notes, allergies,
+    drug attributes, outlier scores, relations or the memory_kinds configs change,
+    and on every invalidate (writes that do not touch update_at).
+    Returns (admission_number, version) or (None, None) for an invalid prescription.
+    """
+    # per admission stamps (max update_at, count): indexed by nratendimento/fkpessoa
+    query = text(
+        f"""
+        with prescription as (
+            select nratendimento, fkpessoa from {schema}.prescricao where fkprescricao = :idPrescription
+        ),
+        admission_drugs as (
+            select pm.fkmedicamento, pm.idoutlier, pp.idsegmento, pm.update_at
+            from {schema}.presmed pm inner join {schema}.prescricao pp on pm.fkprescricao = pp.fkprescricao
+            where pp.nratendimento = (select nratendimento from prescription)
+        )
+        select
+            p.nratendimento,
+            md5(concat_ws('|',
+                (
+                    select concat(max(update_at), ':', count(*))
+                    from {schema}.prescricao where nratendimento = p.nratendimento
+                ),
+                (select concat(max(update_at), ':', count(*)) from admission_drugs),
+                (
+                    select concat(max(update_at), ':', count(*))
+                    from {schema}.intervencao where nratendimento = p.nratendimento
+                ),
+                (
+                    select concat(max(update_at), ':', count(*))
+                    from {schema}.pessoa where nratendimento = p.nratendimento
+                ),
+                (select concat(max(dtexame), ':', count(*)) from {schema}.exame where fkpessoa = p.fkpessoa),
+                (select max(fkevolucao) from {schema}.evolucao where nratendimento = p.nratendimento),
+                (
+                    select concat(max(created_at), ':', count(*))
+                    from {schema}.alergia where fkpessoa = p.fkpessoa
+                ),
+                (
+                    select concat(max(ma.update_at), ':', count(*)) from {schema}.medatributos ma
+                    where (ma.fkmedicamento, ma.idsegmento) in (
+                        select fkmedicamento, idsegmento from admission_drugs
+                    )
+                ),
+                (
+                    select concat(max(o.update_at), ':', count(*)) from {schema}.outlier o
+                    where o.idoutlier in (select idoutlier from admission_drugs)
+                ),
+                (
+                    select concat(max(update_at), ':', count(*))
+                    from {schema}.memoria where tipo = any(:memoryKinds)
+                )
+            )) as version
+        from
+            prescription p
+    """
+    )
+
+    result = db.session.execute(
+        query, {"idPrescription": id_prescription, "memoryKinds": memory_kinds}
+    ).first()
+    if result == None:
+        return None, None
+
+    version = ":".join(
+        [
+            result.version,
+            _get_invalidate_version(schema, result.nratendimento),
+            # global table: in-process version (relation index)
+            str(relation_index_service.get_version()),
+            date.today().isoformat(),
+        ]
+        + extra
+    )
+
+    return result.nratendimento, version
+
+
+def get_view(schema: str, admission_number: int, id_prescription: int, version: str):
+    try:
+        cache_data = redis_client.hget(
+            _get_key(schema, admission_number), str(id_prescription)
+        )
+    except RedisError:
+        _log_error(schema, admission_number)
+        return None
+
+    if cache_data == None:
+        return None
+
+    # "<version>\n<json>": older versions are discarded without parsing the view
+    cache_version, data = cache_data.split("\n", 1)
+    if cache_version != version:
+        return None
+
+    return json.loads(data)
+
+
+def set_view(
+    schema: str, admission_number: int, id_prescription: int, version: str, data
+):
+    key = _get_key(schema, admission_number)
+
+    try:
+        # serialized the same way as the api response
+        redis_client.hset(
+            key, str(id_prescription), f"{version}\n{current_app.json.dumps(data)}"
+        )
+        redis_client.expire(key, CACHE_EXPIRE_IN)
+    except RedisError:
+        _log_error(schema, admission_number)
+
+
+def invalidate(schema: str, admission_number: int):
+    if admission_number == None:
+        return
+
+    _delete(schema, admission_number)
+
+    # delete again after commit: a view built before the commit could be cached meanwhile
+    db.session.info.setdefault(SESSION_INVALIDATE_KEY, set()).add(
+        (schema, admission_number)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    for schema, admission_number in session.info.pop(SESSION_INVALIDATE_KEY, set()):
+        _delete(schema, admission_number)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(SESSION_INVALIDATE_KEY, None)
+
+
+def _delete(schema: str, admission_number: int):
+    try:
+        redis_client.delete(_get_key(schema, admission_number))
+        # unique value: a version is never reused after the key expires
+        redis_client.set(
+            _get_version_key(schema, admission_number),
+            str(time.time_ns()),
+            ex=VERSION_EXPIRE_IN,
+        )
+    except RedisError:
+        _log_error(schema, admission_number)
+
+
+def _get_invalidate_version(schema: str, admission_number: int):
+    if admission_number == None:
+        return ""
+
+    try:
+        return redis_client.get(_get_version_key(schema, admission_number)) or ""
+    except RedisError:
+        _log_error(schema, admission_number)
+        return ""
+
+
+def _get_key(schema: str, admission_number: int):
+    return f"{schema}:{admission_number}:prescricao"
+
+
+def _get_version_key(schema: str, admission_number: int):
+    return f"{schema}:{admission_number}:prescricao:version"
+
+
+def _log_error(schema: str, admission_number: int):
+    logging.basicConfig()
+    logger = logging.getLogger("noharm.backend")
+    logger.error(f"redis error: {_get_key(schema, admission_number)}")
@@ -21,6 +21,7 @@ from services import (
     prescription_service,
     prescription_drug_service,
     feature_service,
+    prescription_cache_service,
 )
 from security.role import Role
 
@@ -128,6 +129,10 @@ def check_prescription(
         if single:
             results.append(single)
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=p.admissionNumber
+    )
+
     return results
 
 
@@ -386,6 +391,10 @@ def review_prescription(
 
     db.session.add(a)
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=prescription.admissionNumber
+    )
+
     db_user = db.session.query(User).filter(User.id == user_context.id).first()
 
     return {
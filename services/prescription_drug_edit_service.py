@@ -4,7 +4,7 @@ from datetime import datetime
 from models.main import db, User
 from models.prescription import Prescription, PrescriptionDrug, Drug
 from models.enums import FeatureEnum
-from services import memory_service
+from services import memory_service, prescription_cache_service
 from exception.validation_error import ValidationError
 from decorators.has_permission_decorator import has_permission, Permission
 from utils import status
@@ -69,6 +69,10 @@ def createPrescriptionDrug(data, user_context: User):
     db.session.add(pdCreate)
     db.session.flush()
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=prescription.admissionNumber
+    )
+
     return pdCreate.id
 
 
@@ -129,6 +133,10 @@ def updatePrescriptionDrug(idPrescriptionDrug, data, user_context: User):
 
     db.session.execute(query, {"id": idPrescriptionDrug})
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=prescription.admissionNumber
+    )
+
 
 @has_permission(Permission.WRITE_PRESCRIPTION)
 def togglePrescriptionDrugSuspension(idPrescriptionDrug, user_context: User, suspend):
@@ -159,6 +167,10 @@ def togglePrescriptionDrugSuspension(idPrescriptionDrug, user_context: User, sus
     db.session.add(pdUpdate)
     db.session.flush()
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=prescription.admissionNumber
+    )
+
     return pdUpdate
 
 
@@ -212,6 +224,10 @@ def copy_missing_drugs(idPrescription, user_context: User, idDrugs):
         db.session.add(pdCreate)
         db.session.flush()
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=prescription.admissionNumber
+    )
+
     return ids_list
 
 
@@ -0,0 +1,134 @@
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert
+
+from models.main import db
+from models.prescription import Prescription, PrescriptionIndex
+from models.enums import AppFeatureFlagEnum
+from services import feature_service
+from services.alert_interaction_service import RELATION_KINDS
+
+REBUILD_CHUNK_SIZE = 1000
+# rows per rebuild call: keeps each request within the api gateway timeout
+REBUILD_BATCH_SIZE = 10000
+
+
+# rollout: create prescricao_indice in every schema, turn on prioritizationIndexWrite,
+# rebuild the index (refresh-prioritization-index) and then turn on prioritizationIndex
+def is_enabled():
+    return feature_service.has_feature_flag(
+        flag=AppFeatureFlagEnum.PRIORITIZATION_INDEX
+    )
+
+
+def is_write_enabled():
+    return feature_service.has_feature_flag(
+        flag=AppFeatureFlagEnum.PRIORITIZATION_INDEX_WRITE
+    )
+
+
+def update_index(prescription: Prescription):
+    """
+    Update the prioritization index after prescription.features is computed.
+    Writes have their own flag: on only after the table exists in every schema
+    """
+    if not is_write_enabled() or prescription.features == None:
+        return
+
+    _upsert([get_index_values(prescription.id, prescription.features)])
+
+
+def rebuild_index(start_date: datetime, end_date: datetime, cursor: int = None):
+    """
+    Index the prescriptions of the period (features computed before the index).
+    Runs one batch per call (keyset on fkprescricao): call again with nextCursor
+    until it is None
+    """
+    q = (
+        db.session.query(Prescription.id, Prescription.features)
+        .filter(Prescription.date >= start_date)
+        .filter(Prescription.date <= end_date)
+        .filter(Prescription.features != None)
+    )
+
+    if cursor != None:
+        q = q.filter(Prescription.id > cursor)
+
+    prescriptions = q.order_by(Prescription.id).limit(REBUILD_BATCH_SIZE).all()
+
+    count = 0
+    for i in range(0, len(prescriptions), REBUILD_CHUNK_SIZE):
+        count += _upsert(
+            [
+                get_index_values(p.id, p.features)
+                for p in prescriptions[i : i + REBUILD_CHUNK_SIZE]
+            ]
+        )
+
+    return {
+        "count": count,
+        "nextCursor": (
+            prescriptions[-1].id if len(prescriptions) == REBUILD_BATCH_SIZE else None
+        ),
+    }
+
+
+def get_index_values(id_prescription: int, features: dict):
+    """
+    Index row with the values used by the prioritization filters
+    """
+    alert_stats = features.get("alertStats", None) or {}
+    interactions = alert_stats.get("interactions", None) or {}
+
+    alerts = [
+        k for k, v in alert_stats.items() if k not in RELATION_KINDS and _is_positive(v)
+    ]
+    alerts += [k for k, v in interactions.items() if _is_positive(v)]
+
+    return {
+        "id": id_prescription,
+        "globalScore": _to_int(features.get("globalScore", None)),
+        "alerts": alerts,
+        "drugAttributes": [
+            k
+            for k, v in (features.get("drugAttributes", None) or {}).items()
+            if _is_positive(v)
+        ],
+        "substances": [
+            int(s) for s in features.get("substanceIDs", None) or [] if s != None
+        ],
+        "substanceClasses": [
+            str(c) for c in features.get("substanceClassIDs", None) or []
+        ],
+        "frequencies": [str(f) for f in features.get("frequencies", None) or []],
+        "intervals": [str(i) for i in features.get("intervals", None) or []],
+        "diff": _to_int(features.get("diff", None)),
+        "interventions": _to_int(features.get("interventions", None)),
+        "alertLevel": features.get("alertLevel", None),
+        "update": datetime.today(),
+    }
+
+
+def _upsert(rows: list):
+    table = PrescriptionIndex.__table__
+
+    stmt = insert(PrescriptionIndex).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.fkprescricao],
+        set_={
+            c.name: stmt.excluded[c.name] for c in table.columns if not c.primary_key
+        },
+    )
+    db.session.execute(stmt)
+
+    return len(rows)
+
+
+def _is_positive(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def _to_int(value):
+    if value == None:
+        return None
+
+    return int(value)
@@ -24,10 +24,13 @@ from services import (
     exams_service,
     patient_service,
     clinical_notes_service,
+    prescription_cache_service,
 )
 from decorators.has_permission_decorator import has_permission, Permission
 from utils import status, prescriptionutils, dateutils
 
+MAX_EVALUATION_MINUTES = 5
+
 
 @has_permission(Permission.READ_PRESCRIPTION, Permission.READ_DISCHARGE_SUMMARY)
 def search(search_key):
@@ -162,8 +165,6 @@ def start_evaluation(id_prescription, user_context: User):
 
 
 def is_being_evaluated(features):
-    max_evaluation_minutes = 5
-
     if (
         features != None
         and "evaluation" in features
@@ -174,7 +175,7 @@ def is_being_evaluated(features):
             datetime.today() - datetime.fromisoformat(evaluation_date)
         ).total_seconds() / 60
 
-        return current_evaluation_minutes <= max_evaluation_minutes
+        return current_evaluation_minutes <= MAX_EVALUATION_MINUTES
 
     return False
 
@@ -198,6 +199,10 @@ def recalculate_prescription(id_prescription: int, user_context: User):
         admission_number=p.admissionNumber, user_context=user_context
     )
 
+    prescription_cache_service.invalidate(
+        schema=user_context.schema, admission_number=p.admissionNumber
+    )
+
     if p.agg:
         if feature_service.is_cpoe():
             prescription_results = get_query_prescriptions_by_agg(
@@ -1,17 +1,22 @@
 from datetime import datetime, date
-from sqlalchemy import desc, and_, func
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_request_context, copy_current_request_context
+from sqlalchemy import desc, and_, func, inspect
+from sqlalchemy.orm import InstanceState
 from sqlalchemy.dialects.postgresql import INTERVAL
 
 from decorators.has_permission_decorator import has_permission, Permission
 from decorators.timed_decorator import timed
 from exception.validation_error import ValidationError
-from models.main import db, User
+from config import Config
+from models.main import db, dbSession, User
 from models.prescription import (
     Prescription,
     Patient,
     PrescriptionDrug,
     PrescriptionAudit,
     Department,
+    Intervention,
 )
 from models.segment import Segment
 from models.enums import (
@@ -33,17 +38,80 @@ from services import (
     alert_service,
     feature_service,
     exams_service,
+    prescription_cache_service,
+    allergy_cache_service,
 )
 from repository import clinical_notes_repository
-from utils import prescriptionutils, dateutils, status
+from utils import prescriptionutils, dateutils, status, cacheutils
+
+SECTION_EXECUTOR = (
+    ThreadPoolExecutor(max_workers=Config.PRESCRIPTION_SECTION_WORKERS)
+    if Config.PRESCRIPTION_SECTION_WORKERS > 0
+    else None
+)
+
+# memory configs of the view (part of the cached view version)
+CONFIG_MEMORY_KINDS = [
+    MemoryEnum.MAP_SCHEDULES_FASTING.value,
+    MemoryEnum.PRESMED_FORM.value,
+    MemoryEnum.ADMISSION_REPORTS.value,
+    MemoryEnum.ADMISSION_REPORTS_INTERNAL.value,
+    MemoryEnum.FEATURES.value,
+]
 
 
 @has_permission(Permission.READ_PRESCRIPTION)
 def route_get_prescription(id_prescription: int, user_context: User = None):
-    return _internal_get_prescription(
+    if not feature_service.has_feature_flag(
+        flag=AppFeatureFlagEnum.REDIS_CACHE_PRESCRIPTION
+    ):
+        return _internal_get_prescription(
+            id_prescription=id_prescription,
+            is_complete=True,
+            user_context=user_context,
+        )
+
+    admission_number, version = prescription_cache_service.get_version(
+        id_prescription=id_prescription,
+        schema=user_context.schema,
+        extra=[str(feature_service.is_cpoe())],
+        memory_kinds=CONFIG_MEMORY_KINDS,
+    )
+    if admission_number != None:
+        cached_view = prescription_cache_service.get_view(
+            schema=user_context.schema,
+            admission_number=admission_number,
+            id_prescription=id_prescription,
+            version=version,
+        )
+        if cached_view != None:
+            return cached_view
+
+    result = _internal_get_prescription(
         id_prescription=id_prescription, is_complete=True, user_context=user_context
     )
 
+    prescription_cache_service.set_view(
+        schema=user_context.schema,
+        admission_number=admission_number,
+        id_prescription=id_prescription,
+        version=version,
+        data=result,
+    )
+
+    return result
+
+
+@has_permission(Permission.READ_PRESCRIPTION)
+def get_prescription_version(id_prescription: int, user_context: User = None):
+    _, version = prescription_cache_service.get_version(
+        id_prescription=id_prescription,
+        schema=user_context.schema,
+        memory_kinds=CONFIG_MEMORY_KINDS,
+    )
+
+    return version
+
 
 @has_permission(Permission.READ_STATIC)
 def static_get_prescription(id_prescription: int, user_context: User = None):
@@ -52,40 +120,155 @@ def static_get_prescription(id_prescription: int, user_context: User = None):
     )
 
 
-def _internal_get_prescription(
-    id_prescription: int,
-    user_context: User,
-    is_complete=False,
-):
-    prescription, patient, department, segment, prescription_user = (
-        _get_prescription_data(id_prescription=id_prescription)
+@has_permission(Permission.READ_STATIC)
+def static_get_prescription_features(id_prescription: int, user_context: User = None):
+    """
+    Minimal prescription data for prescriptionutils.getFeatures (prescalc).
+    Skips formatting, headers, notes and review data.
+    """
+    prescription, patient, _, _, _ = _get_prescription_data(
+        id_prescription=id_prescription
     )
 
     config_data = _get_configs(prescription=prescription, patient=patient)
 
-    interventions = _get_interventions(admission_number=prescription.admissionNumber)
+    sections = _run_sections(
+        sections={
+            "interventions": (
+                _get_interventions_status,
+                {"admission_number": prescription.admissionNumber},
+            ),
+            "cn_data": (
+                _get_clinical_notes_stats,
+                {
+                    "prescription": prescription,
+                    "patient": patient,
+                    "config_data": config_data,
+                    "user_context": user_context,
+                    "is_complete": False,
+                },
+            ),
+            "exam_data": (
+                _get_exams,
+                {
+                    "patient": patient,
+                    "prescription": prescription,
+                    "config_data": config_data,
+                    "is_complete": False,
+                    "user_context": user_context,
+                },
+            ),
+            "drug_list": (
+                _get_drug_list,
+                {
+                    "prescription": prescription,
+                    "patient": patient,
+                    "config_data": config_data,
+                },
+            ),
+        },
+        schema=user_context.schema,
+    )
+    exam_data = sections["exam_data"]
+    cn_data = sections["cn_data"]
 
-    cn_data = _get_clinical_notes_stats(
-        prescription=prescription,
+    alerts_data = _get_alerts(
+        drug_list=sections["drug_list"],
         patient=patient,
         config_data=config_data,
-        user_context=user_context,
-        is_complete=is_complete,
+        exam_data=exam_data,
     )
 
-    exam_data = _get_exams(
-        patient=patient,
-        prescription=prescription,
-        config_data=config_data,
-        is_complete=is_complete,
-        user_context=user_context,
+    drug_list = DrugList(
+        drugList=sections["drug_list"],
+        interventions=[],
+        relations=alerts_data["relations"],
+        exams=exam_data["exams"],
+        agg=prescription.agg,
+        dialysis=patient.dialysis,
+        alerts=alerts_data["alerts"],
+        is_cpoe=config_data["is_cpoe"],
     )
+    drug_list.sumAlerts()
+
+    return {
+        "prescription": drug_list.getFeatureDrugs(
+            ["Medicamentos", "Soluções", "Proced/Exames"]
+        ),
+        "solution": [],
+        "procedures": [],
+        "interventions": sections["interventions"],
+        "alertStats": drug_list.alertStats,
+        "alertExams": exam_data["alerts"],
+        "clinicalNotes": cn_data["cn_count"],
+        "clinicalNotesStats": cn_data["cn_stats"],
+        "complication": cn_data["cn_stats"].get("complication", 0),
+    }
 
-    last_dept = _get_last_dept(prescription=prescription, is_complete=is_complete)
 
-    drug_list = _get_drug_list(
-        prescription=prescription, patient=patient, config_data=config_data
+def _internal_get_prescription(
+    id_prescription: int,
+    user_context: User,
+    is_complete=False,
+):
+    prescription, patient, department, segment, prescription_user = (
+        _get_prescription_data(id_prescription=id_prescription)
+    )
+
+    config_data = _get_configs(prescription=prescription, patient=patient)
+
+    # sections that only depend on prescription, patient and configs
+    sections = _run_sections(
+        sections={
+            "interventions": (
+                _get_interventions,
+                {"admission_number": prescription.admissionNumber},
+            ),
+            "cn_data": (
+                _get_clinical_notes_stats,
+                {
+                    "prescription": prescription,
+                    "patient": patient,
+                    "config_data": config_data,
+                    "user_context": user_context,
+                    "is_complete": is_complete,
+                },
+            ),
+            "exam_data": (
+                _get_exams,
+                {
+                    "patient": patient,
+                    "prescription": prescription,
+                    "config_data": config_data,
+                    "is_complete": is_complete,
+                    "user_context": user_context,
+                },
+            ),
+            "last_dept": (
+                _get_last_dept,
+                {"prescription": prescription, "is_complete": is_complete},
+            ),
+            "drug_list": (
+                _get_drug_list,
+                {
+                    "prescription": prescription,
+                    "patient": patient,
+                    "config_data": config_data,
+                },
+            ),
+            "review_data": (
+                _get_review_data,
+                {"prescription": prescription, "is_complete": is_complete},
+            ),
+        },
+        schema=user_context.schema,
     )
+    interventions = sections["interventions"]
+    cn_data = sections["cn_data"]
+    exam_data = sections["exam_data"]
+    last_dept = sections["last_dept"]
+    drug_list = sections["drug_list"]
+    review_data = sections["review_data"]
 
     alerts_data = _get_alerts(
         drug_list=drug_list,
@@ -105,8 +288,6 @@ def _internal_get_prescription(
         is_complete=is_complete,
     )
 
-    review_data = _get_review_data(prescription=prescription, is_complete=is_complete)
-
     return _format(
         prescription=prescription,
         patient=patient,
@@ -123,6 +304,69 @@ def _internal_get_prescription(
     )
 
 
+def _run_sections(sections: dict, schema: str) -> dict:
+    """
+    Run independent sections ({name: (function, kwargs)}).
+    When PRESCRIPTION_SECTION_WORKERS is set, sections run concurrently, each one
+    with its own session (pooled connection with the tenant schema).
+    """
+    if (
+        SECTION_EXECUTOR == None
+        or not has_request_context()
+        or _has_pending_changes(sections)
+    ):
+        return {name: func(**kwargs) for name, (func, kwargs) in sections.items()}
+
+    # request globals (jwt, features, permission checks) are shared with the sections
+    g_data = dict(g.__dict__)
+
+    futures = {
+        name: SECTION_EXECUTOR.submit(
+            copy_current_request_context(_run_section), g_data, schema, func, kwargs
+        )
+        for name, (func, kwargs) in sections.items()
+    }
+
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _run_section(g_data: dict, schema: str, func, kwargs: dict):
+    # new app context: flask-sqlalchemy gives this thread its own session (removed on teardown)
+    g.__dict__.update(g_data)
+    dbSession.setSchema(schema)
+
+    return func(**_get_section_kwargs(kwargs))
+
+
+def _get_section_kwargs(kwargs: dict):
+    # sessions are not thread-safe: orm instances of the request session are copied
+    # into the section session (no query, lazy loads go through the section session)
+    return {
+        k: db.session.merge(v, load=False) if _get_instance_state(v) != None else v
+        for k, v in kwargs.items()
+    }
+
+
+def _has_pending_changes(sections: dict):
+    # merge without load only accepts unchanged instances (ex: prescalc before flush)
+    for _, kwargs in sections.values():
+        for v in kwargs.values():
+            state = inspect(v, raiseerr=False)
+            if isinstance(state, InstanceState) and (state.modified or state.pending):
+                return True
+
+    return False
+
+
+def _get_instance_state(value):
+    state = inspect(value, raiseerr=False)
+
+    if isinstance(state, InstanceState) and state.key != None:
+        return state
+
+    return None
+
+
 @timed()
 def _get_last_dept(prescription: Prescription, is_complete: bool):
     if is_complete:
@@ -178,18 +422,31 @@ def _build_headers(
         is_cpoe=config_data["is_cpoe"],
     )
 
+    return _add_header_features(
+        headers=headers, pDrugs=pDrugs, pSolution=pSolution, pProcedures=pProcedures
+    )
+
+
+def _add_header_features(
+    headers: dict, pDrugs: list, pSolution: list, pProcedures: list
+):
+    # group items by prescription once (aggregates can have many source prescriptions)
+    drugs_by_prescription = _group_by_prescription(pDrugs)
+    solutions_by_prescription = _group_by_prescription(pSolution)
+    procedures_by_prescription = _group_by_prescription(pProcedures)
+
     for pid in headers.keys():
-        drugs = [d for d in pDrugs if int(d["idPrescription"]) == pid]
+        drugs = drugs_by_prescription.get(pid, [])
         drugsInterv = [
             d["prevIntervention"] for d in drugs if d["prevIntervention"] != {}
         ]
 
-        solutions = [s for s in pSolution if int(s["idPrescription"]) == pid]
+        solutions = solutions_by_prescription.get(pid, [])
         solutionsInterv = [
             s["prevIntervention"] for s in solutions if s["prevIntervention"] != {}
         ]
 
-        procedures = [p for p in pProcedures if int(p["idPrescription"]) == pid]
+        procedures = procedures_by_prescription.get(pid, [])
         proceduresInterv = [
             p["prevIntervention"] for p in procedures if p["prevIntervention"] != {}
         ]
@@ -228,6 +485,14 @@ def _build_headers(
     return headers
 
 
+def _group_by_prescription(items: list) -> dict:
+    groups = {}
+    for item in items:
+        groups.setdefault(int(item["idPrescription"]), []).append(item)
+
+    return groups
+
+
 def _get_prev_intervention(interventions, dtPrescription):
     result = False
     for i in interventions:
@@ -305,14 +570,9 @@ def _get_configs(prescription: Prescription, patient: Patient):
     data = {}
 
     # memory
-    memory_itens = memory_service.get_by_kind(
-        [
-            MemoryEnum.MAP_SCHEDULES_FASTING.value,
-            MemoryEnum.PRESMED_FORM.value,
-            MemoryEnum.ADMISSION_REPORTS.value,
-            MemoryEnum.ADMISSION_REPORTS_INTERNAL.value,
-            MemoryEnum.FEATURES.value,
-        ]
+    memory_itens = cacheutils.get_reference(
+        "prescription_configs",
+        lambda: memory_service.get_by_kind(CONFIG_MEMORY_KINDS),
     )
     data["schedules_fasting"] = memory_itens.get(
         MemoryEnum.MAP_SCHEDULES_FASTING.value, []
@@ -333,6 +593,9 @@ def _get_configs(prescription: Prescription, patient: Patient):
     )
 
     data["is_cpoe"] = feature_service.is_cpoe()
+    data["decorrelated_drug_list"] = not feature_service.has_feature_flag(
+        flag=AppFeatureFlagEnum.LEGACY_DRUG_LIST_QUERY
+    )
 
     # patient data
     data["weight"] = patient.weight if patient.weight else None
@@ -366,6 +629,21 @@ def _get_interventions(admission_number: int):
     return intervention_service.get_interventions(admissionNumber=admission_number)
 
 
+@timed()
+def _get_interventions_status(admission_number: int):
+    # features only count interventions by status (same filters as get_interventions)
+    interventions = (
+        db.session.query(Intervention.status)
+        .filter(Intervention.admissionNumber == admission_number)
+        .filter(Intervention.status.in_(["s", "a", "n", "x", "j"]))
+        .order_by(desc(Intervention.date))
+        .limit(1500)
+        .all()
+    )
+
+    return [{"status": i.status} for i in interventions]
+
+
 @timed()
 def _get_clinical_notes_stats(
     prescription: Prescription,
@@ -416,15 +694,15 @@ def _get_clinical_notes_stats(
             user_context=user_context,
             cache=is_cache_active,
         )
-        db_allergies = patient_service.get_patient_allergies(patient.idPatient)
+        # same rows as the interaction allergies (loaded once per request)
+        db_allergies = allergy_cache_service.get_names(
+            allergy_cache_service.get_patient_allergies(id_patient=patient.idPatient)
+        )
 
         allergies_data += allergies
 
         for a in db_allergies:
-            if a[1] and a[1].strip():
-                allergies_data.append(
-                    {"date": dateutils.to_iso(a[0]), "text": a[1], "source": "pep"}
-                )
+            allergies_data.append(dict(a, source="pep"))
 
         dialysis_data = clinical_notes_repository.get_dialysis(
             admission_number=prescription.admissionNumber,
@@ -493,6 +771,7 @@ def _get_drug_list(prescription: Prescription, patient: Patient, config_data: di
         idSegment=prescription.idSegment,
         is_cpoe=config_data.get("is_cpoe"),
         is_pmc=config_data.get("is_pmc"),
+        decorrelated=config_data.get("decorrelated_drug_list"),
     )
 
 
@@ -579,6 +858,7 @@ def _get_drug_data(
                 last_agg_prescription.date,
                 idSegment=None,
                 is_cpoe=config_data["is_cpoe"],
+                decorrelated=config_data["decorrelated_drug_list"],
             )
             concilia_list = drug_list.conciliaList(concilia_drugs, [])
 
@@ -1,20 +1,28 @@
 import re
-from datetime import date, timedelta
-from sqlalchemy import func, Integer, and_, cast, BigInteger, or_, desc
+import json
+import base64
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, Integer, and_, cast, BigInteger, or_, desc, tuple_
 from sqlalchemy.orm import undefer
+from sqlalchemy import text
 from sqlalchemy.dialects import postgresql
 
-from models.main import db
+from models.main import db, User
 from models.enums import PrescriptionReviewTypeEnum, PatientConciliationStatusEnum
-from models.prescription import Prescription, Patient, Department
+from models.prescription import Prescription, PrescriptionIndex, Patient, Department
 from decorators.has_permission_decorator import has_permission, Permission
 from utils import dateutils, numberutils, prescriptionutils, status
-from services import prescription_service, feature_service
+from services import (
+    prescription_service,
+    feature_service,
+    prescription_index_service,
+)
 from exception.validation_error import ValidationError
 
+MAX_PAGE_SIZE = 500
 
-@has_permission(Permission.READ_PRESCRIPTION)
-def get_prioritization_list(
+
+def _get_prioritization_query(
     idSegment=None,
     idSegmentList=[],
     idDept=[],
@@ -45,16 +53,19 @@ def get_prioritization_list(
     alert_level=None,
 ):
     is_cpoe = feature_service.is_cpoe()
+    use_index = prescription_index_service.is_enabled()
+
+    if use_index:
+        global_score = PrescriptionIndex.globalScore
+    else:
+        global_score = Prescription.features["globalScore"].astext.cast(Integer)
 
     q = (
         db.session.query(
             Prescription,
             Patient,
             Department.name.label("department"),
-            func.count().over(),
-            (Prescription.features["globalScore"].astext.cast(Integer)).label(
-                "globalScore"
-            ),
+            global_score.label("globalScore"),
         )
         .outerjoin(Patient, Patient.admissionNumber == Prescription.admissionNumber)
         .outerjoin(
@@ -66,6 +77,10 @@ def get_prioritization_list(
         )
     )
 
+    if use_index:
+        # prescriptions without features have no index row (same as null features)
+        q = q.outerjoin(PrescriptionIndex, PrescriptionIndex.id == Prescription.id)
+
     currentDepartment = bool(int(numberutils.none2zero(currentDepartment))) and (
         len(idDept) > 0
     )
@@ -146,6 +161,419 @@ def get_prioritization_list(
     if insurance != None and len(insurance.strip()) > 0:
         q = q.filter(Prescription.insurance.ilike("%" + str(insurance) + "%"))
 
+    if len(idPatient) > 0:
+        try:
+            q = q.filter(Prescription.idPatient.in_([int(i) for i in idPatient]))
+        except ValueError:
+            q = q.filter(Prescription.idPatient == None)
+
+    if has_conciliation != None:
+        if bool(int(has_conciliation)):
+            q = q.filter(
+                Patient.st_conciliation == PatientConciliationStatusEnum.CREATED.value
+            )
+        else:
+            q = q.filter(
+                Patient.st_conciliation == PatientConciliationStatusEnum.PENDING.value
+            )
+
+    features_filters = {
+        "indicators": indicators,
+        "drugAttributes": drugAttributes,
+        "frequencies": frequencies,
+        "substances": substances,
+        "substanceClasses": substanceClasses,
+        "intervals": intervals,
+        "diff": diff,
+        "alert_level": alert_level,
+        "pending_interventions": pending_interventions,
+        "global_score_min": global_score_min,
+        "global_score_max": global_score_max,
+    }
+    if use_index:
+        q = _filter_features_index(q=q, **features_filters)
+    else:
+        q = _filter_features_json(q=q, **features_filters)
+
+    if prescriber != None:
+        q = q.filter(Prescription.prescriber.ilike(f"%{prescriber}%"))
+
+    start, end = get_date_range(startDate=startDate, endDate=endDate)
+
+    q = q.filter(Prescription.date >= start)
+    q = q.filter(Prescription.date <= end)
+
+    q = q.options(undefer(Patient.observation))
+
+    # agg lists are sorted by score
+    sort_column = global_score if agg else Prescription.date
+
+    return q, sort_column
+
+
+@has_permission(Permission.READ_PRESCRIPTION)
+def get_prioritization_list(page_size=None, cursor=None, count_mode=None, **filters):
+    """
+    Without page_size/cursor: first 500 rows with totalRecords (full count).
+    With page_size/cursor: keyset page {"items", "nextCursor", "count", "countEstimated"}
+    """
+    q, sort_column = _get_prioritization_query(**filters)
+
+    if page_size == None and cursor == None:
+        q = q.add_columns(func.count().over().label("totalRecords"))
+        q = q.order_by(desc(sort_column))
+
+        return [
+            _format_item(p=p, total_records=p.totalRecords) for p in q.limit(500).all()
+        ]
+
+    page_size = _get_page_size(page_size)
+
+    count = None
+    if count_mode == "exact":
+        count = q.order_by(None).count()
+    elif count_mode == "estimate":
+        count = _get_count_estimate(q)
+
+    q = _filter_after_cursor(q=q, sort_column=sort_column, cursor=cursor)
+    q = q.order_by(desc(sort_column).nulls_first(), desc(Prescription.id))
+
+    # one more row: is there a next page?
+    rows = q.limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _get_next_cursor(last=rows[-1], sort_column=sort_column)
+
+    return {
+        "items": [_format_item(p=p) for p in rows],
+        "nextCursor": next_cursor,
+        "count": count,
+        "countEstimated": count_mode == "estimate",
+    }
+
+
+def _get_next_cursor(last, sort_column):
+    return _encode_cursor(
+        value=(
+            last[0].date.isoformat()
+            if sort_column is Prescription.date
+            else last.globalScore
+        ),
+        id=last[0].id,
+    )
+
+
+def _format_item(p, total_records=None):
+    patient = p[1]
+    if patient is None:
+        patient = Patient()
+        patient.idPatient = p[0].idPatient
+        patient.admissionNumber = p[0].admissionNumber
+
+    featuresNames = [
+        "alerts",
+        "prescriptionScore",
+        "scoreOne",
+        "scoreTwo",
+        "scoreThree",
+        "am",
+        "av",
+        "controlled",
+        "np",
+        "tube",
+        "diff",
+        "alertExams",
+        "interventions",
+        "complication",
+        "alertLevel",
+    ]
+
+    features = {"processed": True}
+    if p[0].features:
+        for f in featuresNames:
+            features[f] = p[0].features[f] if f in p[0].features else 0
+
+        features["globalScore"] = numberutils.none2zero(p.globalScore)
+
+        if features["globalScore"] > 90:
+            features["class"] = "red"
+        elif features["globalScore"] > 60:
+            features["class"] = "orange"
+        elif features["globalScore"] > 10:
+            features["class"] = "yellow"
+        else:
+            features["class"] = "green"
+
+        features["alertStats"] = (
+            p[0].features["alertStats"] if "alertStats" in p[0].features else None
+        )
+
+        if "scoreVariation" in p[0].features:
+            features["scoreVariation"] = (
+                p[0].features.get("scoreVariation").get("variation")
+            )
+        else:
+            features["scoreVariation"] = 0
+
+    else:
+        features["processed"] = False
+        features["globalScore"] = 0
+        features["scoreVariation"] = 0
+        features["class"] = "blue"
+
+    observation = None
+    if p[1] and p[1].observation != None and p[1].observation != "":
+        observation = (
+            p[1].observation[:300] + "..."
+            if len(p[1].observation) > 300
+            else p[1].observation
+        )
+
+    return dict(
+        features,
+        **{
+            "idPrescription": str(p[0].id),
+            "idPatient": str(p[0].idPatient),
+            "name": patient.admissionNumber,
+            "admissionNumber": patient.admissionNumber,
+            "idSegment": p[0].idSegment,
+            "birthdate": (patient.birthdate.isoformat() if patient.birthdate else None),
+            "gender": patient.gender,
+            "weight": patient.weight,
+            "skinColor": patient.skinColor,
+            "lengthStay": prescriptionutils.lenghStay(patient.admissionDate),
+            "dischargeDate": (
+                patient.dischargeDate.isoformat() if patient.dischargeDate else None
+            ),
+            "dischargeReason": patient.dischargeReason,
+            "date": p[0].date.isoformat(),
+            "department": str(p[2]),
+            "insurance": p[0].insurance,
+            "bed": p[0].bed,
+            "status": p[0].status,
+            "isBeingEvaluated": prescription_service.is_being_evaluated(p[0].features),
+            "reviewType": p[0].reviewType,
+            "observation": observation,
+            "totalRecords": total_records,
+            "agg": p[0].agg,
+            "prescriptionAggId": prescriptionutils.gen_agg_id(
+                admission_number=p[0].admissionNumber,
+                id_segment=p[0].idSegment,
+                pdate=p[0].date,
+            ),
+        },
+    )
+
+
+def _get_page_size(page_size):
+    if page_size == None:
+        return MAX_PAGE_SIZE
+
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        page_size = 0
+
+    if page_size < 1:
+        raise ValidationError(
+            "Tamanho de página inválido",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def _encode_cursor(value, id: int):
+    data = json.dumps({"v": value, "id": id}, separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = data["v"]
+        id = int(data["id"])
+
+        if value != None and not isinstance(value, (int, str)):
+            raise ValueError("cursor value")
+    except Exception:
+        raise ValidationError(
+            "Cursor inválido",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    return value, id
+
+
+def _filter_after_cursor(q, sort_column, cursor: str):
+    """
+    Rows after the cursor in (sort_column desc nulls first, id desc) order
+    """
+    if cursor == None or cursor == "":
+        return q
+
+    value, id = _decode_cursor(cursor)
+
+    if sort_column is Prescription.date:
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValidationError(
+                "Cursor inválido",
+                "errors.invalidParams",
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        return q.filter(tuple_(Prescription.date, Prescription.id) < (value, id))
+
+    if value == None:
+        return q.filter(
+            or_(
+                and_(sort_column == None, Prescription.id < id),
+                sort_column != None,
+            )
+        )
+
+    if not isinstance(value, int):
+        raise ValidationError(
+            "Cursor inválido",
+            "errors.invalidParams",
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    return q.filter(
+        or_(
+            sort_column < value,
+            and_(sort_column == value, Prescription.id < id),
+        )
+    )
+
+
+def _get_count_estimate(q):
+    """
+    Planner row estimate (explain) instead of counting the full filtered set
+    """
+    connection = db.session.connection()
+    compiled = q.statement.compile(
+        dialect=connection.dialect,
+        schema_translate_map=connection.get_execution_options().get(
+            "schema_translate_map", None
+        ),
+        render_schema_translate=True,
+        compile_kwargs={"render_postcompile": True},
+    )
+
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _filter_features_index(
+    q,
+    indicators: list,
+    drugAttributes: list,
+    frequencies: list,
+    substances: list,
+    substanceClasses: list,
+    intervals: list,
+    diff,
+    alert_level,
+    pending_interventions,
+    global_score_min,
+    global_score_max,
+):
+    """
+    Same filters as _filter_features_json over the typed index (gin/btree)
+    """
+    if len(indicators) > 0:
+        q = q.filter(
+            PrescriptionIndex.alerts.overlap(
+                cast(indicators, postgresql.ARRAY(db.String))
+            )
+        )
+
+    if len(drugAttributes) > 0:
+        q = q.filter(
+            PrescriptionIndex.drugAttributes.overlap(
+                cast(drugAttributes, postgresql.ARRAY(db.String))
+            )
+        )
+
+    if len(frequencies) > 0:
+        q = q.filter(
+            PrescriptionIndex.frequencies.overlap(
+                cast(frequencies, postgresql.ARRAY(db.String))
+            )
+        )
+
+    if len(substances) > 0:
+        q = q.filter(
+            PrescriptionIndex.substances.overlap(
+                cast(substances, postgresql.ARRAY(BigInteger))
+            )
+        )
+
+    if len(substanceClasses) > 0:
+        q = q.filter(
+            PrescriptionIndex.substanceClasses.overlap(
+                cast(substanceClasses, postgresql.ARRAY(db.String))
+            )
+        )
+
+    if len(intervals) > 0:
+        q = q.filter(
+            PrescriptionIndex.intervals.overlap(
+                cast(intervals, postgresql.ARRAY(db.String))
+            )
+        )
+
+    if diff != None:
+        if bool(int(diff)):
+            q = q.filter(PrescriptionIndex.diff > 0)
+        else:
+            q = q.filter(PrescriptionIndex.diff == 0)
+
+    if alert_level != None:
+        q = q.filter(PrescriptionIndex.alertLevel == alert_level)
+
+    if pending_interventions != None:
+        if bool(int(pending_interventions)):
+            q = q.filter(PrescriptionIndex.interventions > 0)
+        else:
+            q = q.filter(PrescriptionIndex.interventions == 0)
+
+    if global_score_min != None:
+        q = q.filter(PrescriptionIndex.globalScore >= global_score_min)
+
+    if global_score_max != None:
+        q = q.filter(PrescriptionIndex.globalScore <= global_score_max)
+
+    return q
+
+
+def _filter_features_json(
+    q,
+    indicators: list,
+    drugAttributes: list,
+    frequencies: list,
+    substances: list,
+    substanceClasses: list,
+    intervals: list,
+    diff,
+    alert_level,
+    pending_interventions,
+    global_score_min,
+    global_score_max,
+):
     if len(indicators) > 0:
         ind_filters = []
         for i in indicators:
@@ -214,12 +642,6 @@ def get_prioritization_list(
             )
         )
 
-    if len(idPatient) > 0:
-        try:
-            q = q.filter(Prescription.idPatient.in_([int(i) for i in idPatient]))
-        except ValueError:
-            q = q.filter(Prescription.idPatient == None)
-
     if len(intervals) > 0:
         q = q.filter(
             cast(Prescription.features["intervals"], db.String).op("~*")(
@@ -236,16 +658,6 @@ def get_prioritization_list(
     if alert_level != None:
         q = q.filter(Prescription.features["alertLevel"].astext == alert_level)
 
-    if has_conciliation != None:
-        if bool(int(has_conciliation)):
-            q = q.filter(
-                Patient.st_conciliation == PatientConciliationStatusEnum.CREATED.value
-            )
-        else:
-            q = q.filter(
-                Patient.st_conciliation == PatientConciliationStatusEnum.PENDING.value
-            )
-
     if pending_interventions != None:
         if bool(int(pending_interventions)):
             q = q.filter(
@@ -268,9 +680,89 @@ def get_prioritization_list(
             <= global_score_max
         )
 
-    if prescriber != None:
-        q = q.filter(Prescription.prescriber.ilike(f"%{prescriber}%"))
+    return q
+
+
+@has_permission(Permission.READ_PRESCRIPTION)
+def get_prioritization_version(
+    startDate=date.today(),
+    endDate=None,
+    idSegment=None,
+    idSegmentList=[],
+    idDept=[],
+    user_context: User = None,
+):
+    """
+    Version of the prescriptions (and patients) listed with the same date, segment
+    and department filters, used as etag. Other filters are part of the etag
+    (query params).
+    """
+    start, end = get_date_range(startDate=startDate, endDate=endDate)
+
+    params = {"start": start, "end": end}
+    filters = ""
+
+    segments = [int(s) for s in idSegmentList if s != None and s != "null"]
+    if idSegment != None:
+        segments.append(int(idSegment))
+    if len(segments) > 0:
+        params["idSegmentList"] = segments
+        filters += " and p.idsegmento = any(:idSegmentList) "
+
+    if len(idDept) > 0:
+        # department or aggregate departments (same as the list)
+        params["idDeptList"] = list(map(int, idDept))
+        filters += " and (p.fksetor = any(:idDeptList) or p.aggsetor && cast(:idDeptList as bigint[])) "
+
+    # check and review update update_at (and audit). Prescalc and evaluation start
+    # only change the features: processed date and evaluations in progress (changes
+    # when an evaluation starts or expires)
+    params["evaluationLimit"] = (
+        datetime.today()
+        - timedelta(minutes=prescription_service.MAX_EVALUATION_MINUTES)
+    ).isoformat()
+
+    query = text(
+        f"""
+        select
+            count(*) as total,
+            max(p.update_at) as last_update,
+            max(p.fkprescricao) as last_id,
+            max(p.indicadores->>'processedDate') as last_processed,
+            max(p.indicadores->'evaluation'->>'startDate') as last_evaluation,
+            count(*) filter (
+                where p.indicadores->'evaluation'->>'startDate' > :evaluationLimit
+            ) as evaluations,
+            max(ps.update_at) as patient_update,
+            (select max(idprescricao_audit) from {user_context.schema}.prescricao_audit) as last_audit
+        from
+            {user_context.schema}.prescricao p
+            left join {user_context.schema}.pessoa ps on ps.nratendimento = p.nratendimento
+        where
+            p.dtprescricao >= :start
+            and p.dtprescricao <= :end
+            {filters}
+    """
+    )
+
+    result = db.session.execute(query, params).first()
+
+    version = [
+        str(result.total),
+        dateutils.to_iso(result.last_update),
+        str(result.last_id),
+        str(result.last_processed),
+        str(result.last_evaluation),
+        str(result.evaluations),
+        dateutils.to_iso(result.patient_update),
+        str(result.last_audit),
+        date.today().isoformat(),
+    ]
+
+    return ":".join([str(v) for v in version])
+
 
+def get_date_range(startDate, endDate):
     if endDate is None:
         endDate = startDate
 
@@ -286,126 +778,4 @@ def get_prioritization_list(
             status.HTTP_400_BAD_REQUEST,
         )
 
-    q = q.filter(Prescription.date >= start)
-    q = q.filter(Prescription.date <= end)
-
-    if agg:
-        q = q.order_by(desc("globalScore"))
-    else:
-        q = q.order_by(desc(Prescription.date))
-
-    q = q.options(undefer(Patient.observation))
-
-    prioritization_results = q.limit(500).all()
-
-    results = []
-    for p in prioritization_results:
-        patient = p[1]
-        if patient is None:
-            patient = Patient()
-            patient.idPatient = p[0].idPatient
-            patient.admissionNumber = p[0].admissionNumber
-
-        featuresNames = [
-            "alerts",
-            "prescriptionScore",
-            "scoreOne",
-            "scoreTwo",
-            "scoreThree",
-            "am",
-            "av",
-            "controlled",
-            "np",
-            "tube",
-            "diff",
-            "alertExams",
-            "interventions",
-            "complication",
-            "alertLevel",
-        ]
-
-        features = {"processed": True}
-        if p[0].features:
-            for f in featuresNames:
-                features[f] = p[0].features[f] if f in p[0].features else 0
-
-            features["globalScore"] = numberutils.none2zero(p.globalScore)
-
-            if features["globalScore"] > 90:
-                features["class"] = "red"
-            elif features["globalScore"] > 60:
-                features["class"] = "orange"
-            elif features["globalScore"] > 10:
-                features["class"] = "yellow"
-            else:
-                features["class"] = "green"
-
-            features["alertStats"] = (
-                p[0].features["alertStats"] if "alertStats" in p[0].features else None
-            )
-
-            if "scoreVariation" in p[0].features:
-                features["scoreVariation"] = (
-                    p[0].features.get("scoreVariation").get("variation")
-                )
-            else:
-                features["scoreVariation"] = 0
-
-        else:
-            features["processed"] = False
-            features["globalScore"] = 0
-            features["scoreVariation"] = 0
-            features["class"] = "blue"
-
-        observation = None
-        if p[1] and p[1].observation != None and p[1].observation != "":
-            observation = (
-                p[1].observation[:300] + "..."
-                if len(p[1].observation) > 300
-                else p[1].observation
-            )
-
-        results.append(
-            dict(
-                features,
-                **{
-                    "idPrescription": str(p[0].id),
-                    "idPatient": str(p[0].idPatient),
-                    "name": patient.admissionNumber,
-                    "admissionNumber": patient.admissionNumber,
-                    "idSegment": p[0].idSegment,
-                    "birthdate": (
-                        patient.birthdate.isoformat() if patient.birthdate else None
-                    ),
-                    "gender": patient.gender,
-                    "weight": patient.weight,
-                    "skinColor": patient.skinColor,
-                    "lengthStay": prescriptionutils.lenghStay(patient.admissionDate),
-                    "dischargeDate": (
-                        patient.dischargeDate.isoformat()
-                        if patient.dischargeDate
-                        else None
-                    ),
-                    "dischargeReason": patient.dischargeReason,
-                    "date": p[0].date.isoformat(),
-                    "department": str(p[2]),
-                    "insurance": p[0].insurance,
-                    "bed": p[0].bed,
-                    "status": p[0].status,
-                    "isBeingEvaluated": prescription_service.is_being_evaluated(
-                        p[0].features
-                    ),
-                    "reviewType": p[0].reviewType,
-                    "observation": observation,
-                    "totalRecords": p[3],
-                    "agg": p[0].agg,
-                    "prescriptionAggId": prescriptionutils.gen_agg_id(
-                        admission_number=p[0].admissionNumber,
-                        id_segment=p[0].idSegment,
-                        pdate=p[0].date,
-                    ),
-                },
-            )
-        )
-
-    return results
+    return start, end
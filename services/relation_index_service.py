@@ -0,0 +1,132 @@
+import time
+import threading
+from sqlalchemy import text, event
+from sqlalchemy.orm import Session
+
+from models.main import db
+from config import Config
+
+SESSION_INVALIDATE_KEY = "relation_index_invalidate"
+
+# public.relacao is global (shared by all schemas) and rarely updated
+_index = {"version": None, "checked_at": None, "relations": {}}
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return Config.RELATION_INDEX_TTL > 0
+
+
+def get_relations(pairs: list, kinds: list) -> dict:
+    """
+    Active relations for (sctida, sctidb) pairs, same format as the relacao query:
+    {"<sctida>-<sctidb>-<kind>": {"sctida", "sctidb", "kind", "text", "level"}}
+    """
+    relations = _get_index()
+
+    active_relations = {}
+    for sctida, sctidb in pairs:
+        for kind in kinds:
+            relation = relations.get((int(sctida), int(sctidb), kind), None)
+            if relation == None:
+                continue
+
+            active_relations[f"{sctida}-{sctidb}-{kind}"] = {
+                "sctida": int(sctida),
+                "sctidb": int(sctidb),
+                "kind": kind,
+                "text": relation[0],
+                "level": relation[1],
+            }
+
+    return active_relations
+
+
+def get_version():
+    """
+    Version of public.relacao (count, last update). With the index enabled it is
+    the in-process version, checked at most once per RELATION_INDEX_TTL
+    """
+    if not is_enabled():
+        return _get_version()
+
+    _get_index()
+
+    return _index["version"]
+
+
+def invalidate():
+    _reset()
+
+    # reset again after commit: the index could be reloaded before the commit
+    db.session.info[SESSION_INVALIDATE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    if session.info.pop(SESSION_INVALIDATE_KEY, False):
+        _reset()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(SESSION_INVALIDATE_KEY, None)
+
+
+def _reset():
+    with _lock:
+        _index["version"] = None
+        _index["checked_at"] = None
+
+
+def _get_index() -> dict:
+    with _lock:
+        if (
+            _index["checked_at"] != None
+            and time.monotonic() - _index["checked_at"] < Config.RELATION_INDEX_TTL
+        ):
+            return _index["relations"]
+
+        # other instances (upsert_relation) are detected by the version check
+        version = _get_version()
+        if version != _index["version"]:
+            _index["relations"] = _load_relations()
+            _index["version"] = version
+
+        _index["checked_at"] = time.monotonic()
+
+        return _index["relations"]
+
+
+def _get_version():
+    query = text(
+        """
+        select count(*) as total, max(update_at) as last_update from public.relacao
+    """
+    )
+    result = db.session.execute(query).first()
+
+    return (result.total, result.last_update)
+
+
+def _load_relations():
+    query = text(
+        """
+        select
+            r.sctida,
+            r.sctidb,
+            r.tprelacao as "kind",
+            r.texto as "text",
+            r.nivel as "level"
+        from
+            public.relacao r
+        where
+            r.ativo = true
+    """
+    )
+
+    relations = {}
+    for item in db.session.execute(query).all():
+        relations[(item.sctida, item.sctidb, item.kind)] = (item.text, item.level)
+
+    return relations
@@ -845,3 +845,40 @@ def test_fasting():
     assert alert1[0].get("level", None) == "medium"
 
     assert stats.get("fasting", 0) == 1
+
+
+def test_alert_order_and_text():
+    """Alertas: Testa a ordem dos alertas de um medicamento e a limpeza do texto"""
+
+    drugs = []
+
+    drugs.append(
+        utils_test_prescription.get_prescription_drug_mock_row(
+            id_prescription_drug=61,
+            dose=100,
+            frequency=1,
+            max_dose=10,
+            kidney=60,
+            tube=True,
+            allergy="S",
+        )
+    )
+
+    drugs[0].prescription_drug.route = "SNE"
+
+    exams = {"age": 50, "weight": 80, "ckd": {"value": 30}}
+
+    alerts = alert_service.find_alerts(
+        drug_list=drugs,
+        exams=exams,
+        dialisys=None,
+        pregnant=None,
+        lactating=None,
+        schedules_fasting=None,
+    )
+
+    alert1 = alerts.get("alerts").get("61", [])
+
+    assert [a["type"] for a in alert1] == ["kidney", "tube", "allergy", "maxDose"]
+    assert all("\n" not in a["text"] and "  " not in a["text"] for a in alert1)
+    assert alert1[1]["text"] == "Medicamento contraindicado via sonda (SNE)"
@@ -1,4 +1,5 @@
 from typing import List
+from datetime import datetime, timedelta
 
 from services.alert_interaction_service import find_relations
 from tests.utils import utils_test_prescription
@@ -478,3 +479,44 @@ def test_find_relations_drug_interaction_kind_dm_freq_now(monkeypatch):
     assert results["stats"]["iy"] == 0
     assert results["stats"]["sl"] == 0
     assert results["stats"]["rx"] == 0
+
+
+def test_find_relations_cpoe_period_overlap(monkeypatch):
+    """Alertas interação: Testa interação medicamentosa CPOE somente com períodos sobrepostos"""
+
+    today = datetime.today()
+    drug_a = utils_test_prescription.get_prescription_drug_mock_row(
+        id_prescription_drug=1, dose=10, drug_name="Drug A"
+    )
+    drug_b = utils_test_prescription.get_prescription_drug_mock_row(
+        id_prescription_drug=2, dose=20, drug_name="Drug B"
+    )
+    drug_b_previous = utils_test_prescription.get_prescription_drug_mock_row(
+        id_prescription_drug=3,
+        dose=20,
+        drug_name="Drug B",
+        expire_date=today - timedelta(days=3),
+    )._replace(prescription_date=today - timedelta(days=5))
+    drug_b_previous[1].sctid = "211111"
+
+    monkeypatch.setattr(
+        "services.alert_interaction_service._get_allergies",
+        _mock_get_allergies(data=[]),
+    )
+    monkeypatch.setattr(
+        "services.alert_interaction_service._get_active_relations",
+        _mock_get_active_relations(kind="it"),
+    )
+
+    results = find_relations([drug_a, drug_b_previous], id_patient=1, is_cpoe=True)
+
+    assert 0 == len(results["alerts"])
+    assert results["stats"].get("it", 0) == 0
+
+    results = find_relations(
+        [drug_a, drug_b_previous, drug_b], id_patient=1, is_cpoe=True
+    )
+
+    assert list(results["alerts"].keys()) == ["2", "1"]
+    assert results["alerts"]["1"][0]["relation"] == "1"
+    assert results["stats"]["it"] == 1
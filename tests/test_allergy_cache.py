@@ -0,0 +1,66 @@
+from flask import Flask
+
+from services import allergy_cache_service, alert_interaction_service
+
+
+def _mock_allergies(monkeypatch):
+    loads = []
+
+    def load(id_patient):
+        loads.append(id_patient)
+        return [
+            {"date": None, "sctid": None, "substance": None, "drug": " "},
+            {"date": "2024-01-02", "sctid": 111111, "substance": "Drug A", "drug": "A"},
+            {"date": "2024-01-01", "sctid": 111111, "substance": "Drug A", "drug": "B"},
+            {"date": None, "sctid": None, "substance": None, "drug": "Other"},
+        ]
+
+    monkeypatch.setattr(allergy_cache_service, "_load_allergies", load)
+
+    return loads
+
+
+def test_allergy_cache(monkeypatch):
+    """Alergias: Testa o compartilhamento das alergias na mesma requisição"""
+
+    loads = _mock_allergies(monkeypatch)
+
+    with Flask(__name__).app_context():
+        for _ in range(2):
+            allergies = alert_interaction_service._get_allergies(id_patient=1)
+
+        names = allergy_cache_service.get_names(
+            allergy_cache_service.get_patient_allergies(id_patient=1)
+        )
+
+        assert len(loads) == 1
+
+        alert_interaction_service._get_allergies(id_patient=2)
+        assert len(loads) == 2
+
+    assert allergies == [
+        {
+            "id": None,
+            "drug": "Drug A",
+            "sctid": 111111,
+            "intravenous": False,
+            "group": None,
+            "frequency": None,
+            "rx": True,
+        }
+    ]
+
+    # query order, distinct names
+    assert names == [
+        {"date": "2024-01-02", "text": "Drug A"},
+        {"date": None, "text": "Other"},
+    ]
+    assert allergy_cache_service.get_names(
+        allergy_cache_service._load_allergies(1), limit=1
+    ) == [{"date": "2024-01-02", "text": "Drug A"}]
+
+    # new request: loaded again
+    with Flask(__name__).app_context():
+        alert_interaction_service._get_allergies(id_patient=1)
+
+    assert len(loads) == 4
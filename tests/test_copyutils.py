@@ -0,0 +1,86 @@
+import struct
+import pytest
+import numpy as np
+
+from utils.copyutils import BinaryCopyReader, COPY_SIGNATURE, COPY_TRAILER
+
+COLUMNS = [
+    ("medication", "int64"),
+    ("dose", "float64"),
+    ("frequency", "float64"),
+    ("count", "int64"),
+]
+
+
+def _get_binary_copy(rows: list, extension: bytes = b""):
+    # same format as postgres COPY ... TO STDOUT WITH BINARY
+    data = COPY_SIGNATURE + struct.pack(">ii", 0, len(extension)) + extension
+
+    for medication, dose, frequency, count in rows:
+        data += struct.pack(
+            ">hiqididiq", 4, 8, medication, 8, dose, 8, frequency, 8, count
+        )
+
+    return data + COPY_TRAILER
+
+
+def _get_rows(size: int):
+    rng = np.random.default_rng(0)
+    return [
+        (
+            int(rng.integers(1, 1000)),
+            float(rng.choice([0.1, 0.5, 2.5, 10])),
+            float(rng.choice([1, 2, 24, np.nan])),
+            int(rng.integers(1, 500)),
+        )
+        for _ in range(size)
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 50, 4096])
+def test_binary_copy_reader(chunk_size):
+    """Copy utils: Testa a leitura do COPY binário em blocos"""
+
+    rows = _get_rows(300)
+    data = _get_binary_copy(rows, extension=b"ext")
+
+    reader = BinaryCopyReader(COLUMNS, decode_size=100)
+    for i in range(0, len(data), chunk_size):
+        reader.write(data[i : i + chunk_size])
+
+    arrays = reader.arrays()
+
+    assert arrays["medication"].dtype == np.int64
+    assert arrays["dose"].dtype == np.float64
+    assert arrays["medication"].tolist() == [r[0] for r in rows]
+    assert arrays["dose"].tolist() == [r[1] for r in rows]
+    assert np.array_equal(
+        arrays["frequency"], np.array([r[2] for r in rows]), equal_nan=True
+    )
+    assert arrays["count"].tolist() == [r[3] for r in rows]
+
+
+def test_binary_copy_reader_empty():
+    """Copy utils: Testa a leitura do COPY binário sem registros"""
+
+    reader = BinaryCopyReader(COLUMNS)
+    reader.write(_get_binary_copy([]))
+
+    arrays = reader.arrays()
+
+    assert list(arrays.keys()) == [c[0] for c in COLUMNS]
+    assert len(arrays["medication"]) == 0
+
+
+def test_binary_copy_reader_null():
+    """Copy utils: Testa erro em valores nulos no COPY binário"""
+
+    data = COPY_SIGNATURE + struct.pack(">ii", 0, 0)
+    data += struct.pack(">hiqiidiq", 4, 8, 1, -1, 8, 1.0, 8, 10)
+    data += COPY_TRAILER
+
+    reader = BinaryCopyReader(COLUMNS)
+    reader.write(data)
+
+    with pytest.raises(ValueError):
+        reader.arrays()
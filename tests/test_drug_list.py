@@ -0,0 +1,213 @@
+from collections import namedtuple
+
+from models.prescription import Frequency
+from utils.drug_list import DrugList
+from utils import prescriptionutils
+from tests.utils import utils_test_prescription
+
+
+def _get_drug_rows():
+    rows = [
+        utils_test_prescription.get_prescription_drug_mock_row(
+            id_prescription_drug=1, dose=10, max_dose=5, interval="08:00 20:00"
+        ),
+        utils_test_prescription.get_prescription_drug_mock_row(
+            id_prescription_drug=2, dose=10, tube=True, allergy="S"
+        ),
+        utils_test_prescription.get_prescription_drug_mock_row(
+            id_prescription_drug=3, dose=10, freq_obj=Frequency(id="12/12")
+        ),
+    ]
+
+    # findByPrescription columns not included in the mock row
+    Row = namedtuple("Row", rows[0]._fields + ("idDepartment", "prescription_expire"))
+
+    result = []
+    for i, r in enumerate(rows):
+        r[0].idPrescription = 10 + i
+        r[0].source = ["Medicamentos", "Soluções", "Proced/Exames"][i]
+        result.append(Row(*r._replace(score=i + 1), i, None))
+
+    return result
+
+
+def _get_drug_list(drugs):
+    return DrugList(
+        drugList=drugs,
+        interventions=[],
+        relations={
+            "alerts": {"1": [{"text": "it", "level": "high"}]},
+            "stats": {"it": 1},
+        },
+        exams={"age": 50, "weight": 80, "height": 180},
+        agg=None,
+        dialysis=None,
+        alerts={
+            "alerts": {"2": [{"text": "tube", "level": "medium"}]},
+            "stats": {"tube": 1},
+        },
+    )
+
+
+def test_feature_drugs():
+    """Drug list: Testa se as features calculadas pelo fluxo simplificado são iguais às da prescrição completa"""
+
+    drugs = _get_drug_rows()
+
+    drug_list = _get_drug_list(drugs)
+    drug_list.sumAlerts()
+    complete = {
+        "prescription": drug_list.getDrugType([], ["Medicamentos"]),
+        "solution": drug_list.getDrugType([], ["Soluções"]),
+        "procedures": drug_list.getDrugType([], ["Proced/Exames"]),
+        "interventions": [{"status": "s"}],
+        "alertStats": drug_list.alertStats,
+        "alertExams": 1,
+        "complication": 0,
+    }
+
+    drug_list = _get_drug_list(drugs)
+    drug_list.sumAlerts()
+    simplified = {
+        "prescription": drug_list.getFeatureDrugs(
+            ["Medicamentos", "Soluções", "Proced/Exames"]
+        ),
+        "solution": [],
+        "procedures": [],
+        "interventions": [{"status": "s"}],
+        "alertStats": drug_list.alertStats,
+        "alertExams": 1,
+        "complication": 0,
+    }
+
+    features = prescriptionutils.getFeatures(complete)
+    simplified_features = prescriptionutils.getFeatures(simplified)
+
+    features.pop("processedDate")
+    simplified_features.pop("processedDate")
+
+    assert features["tube"] == 1
+    assert features["allergy"] == 1
+    assert features["prescriptionScore"] == 6
+    assert sorted(simplified_features.pop("departmentList")) == sorted(
+        features.pop("departmentList")
+    )
+    assert simplified_features == features
+    assert sorted(
+        prescriptionutils.get_internal_prescription_ids(simplified)
+    ) == sorted(prescriptionutils.get_internal_prescription_ids(complete))
+
+
+def _get_header_item(id_prescription: int, id_drug: int):
+    return {
+        "idPrescription": str(id_prescription),
+        "idDrug": id_drug,
+        "idDepartment": 1,
+        "idSubstance": id_drug,
+        "idSubstanceClass": None,
+        "drugAttributes": None,
+        "whiteList": False,
+        "suspended": id_drug % 7 == 0,
+        "allergy": False,
+        "alertsComplete": [],
+        "score": str(id_drug % 4),
+        "am": id_drug % 3 == 0,
+        "av": False,
+        "np": None,
+        "c": False,
+        "checked": id_drug % 2 == 0,
+        "tubeAlert": False,
+        "interval": "08:00 20:00",
+        "frequency": {"value": "12/12"},
+        "prescriptionDate": None,
+        "prevIntervention": {"status": "s"} if id_drug % 5 == 0 else {},
+    }
+
+
+def test_header_features():
+    """Drug list: Testa os cabeçalhos da prescrição agregada agrupados por prescrição"""
+
+    from services import prescription_view_service
+
+    p_drugs = [_get_header_item(pid, i) for pid in range(1, 6) for i in range(8)]
+    p_solution = [
+        _get_header_item(pid, 100 + i) for pid in range(1, 4) for i in range(2)
+    ]
+
+    headers = prescription_view_service._add_header_features(
+        headers={pid: {} for pid in range(1, 7)},
+        pDrugs=p_drugs,
+        pSolution=p_solution,
+        pProcedures=[],
+    )
+
+    # each header has only the items of its prescription
+    drugs = [d for d in p_drugs if d["idPrescription"] == "2"]
+    expected = prescriptionutils.getFeatures(
+        {
+            "prescription": drugs,
+            "solution": [],
+            "procedures": [],
+            "interventions": [
+                d["prevIntervention"] for d in drugs if d["prevIntervention"] != {}
+            ],
+            "alertExams": 0,
+            "complication": 0,
+        }
+    )
+    headers[2]["drugs"].pop("processedDate")
+    expected.pop("processedDate")
+
+    assert headers[2]["drugs"] == expected
+    assert headers[1]["drugs"]["totalItens"] == 8
+    assert headers[1]["solutions"]["totalItens"] == 2
+    assert headers[4]["solutions"]["totalItens"] == 0
+    assert headers[6]["drugs"]["totalItens"] == 0
+
+
+def test_merge_drug_list_data(monkeypatch):
+    """Drug list: Testa a inclusão das observações anteriores e tipos de manejo nos itens da prescrição"""
+
+    from models import prescription as prescription_model
+    from models.main import Substance
+
+    PrevNote = namedtuple("PrevNote", "idDrug idPrescriptionDrug notes")
+
+    # most recent first
+    monkeypatch.setattr(
+        prescription_model,
+        "_get_prev_notes_by_drug",
+        lambda admission_number, id_drugs: {
+            1: [
+                PrevNote(1, 30, "newer ##@user@##"),
+                PrevNote(1, 5, "older ##@user@##"),
+            ]
+        },
+    )
+    monkeypatch.setattr(
+        prescription_model,
+        "_get_handling_types_by_substance",
+        lambda id_substances: {10: ["light", "fridge"]},
+    )
+
+    rows = []
+    for id_prescription_drug in [20, 40, 3]:
+        row = utils_test_prescription.get_prescription_drug_mock_row(
+            id_prescription_drug=id_prescription_drug, dose=10
+        )
+        substance = None
+        if id_prescription_drug == 20:
+            substance = Substance()
+            substance.id = 10
+
+        rows.append(row._replace(substance=substance, substance_handling_types=None))
+
+    merged = prescription_model._merge_drug_list_data(rows, admissionNumber=1)
+
+    assert [r[0].id for r in merged] == [20, 40, 3]
+    assert merged[0].prevnotes == "older ##@user@##"
+    assert merged[1].prevnotes == "newer ##@user@##"
+    assert merged[2].prevnotes == None
+    assert merged[0].substance_handling_types == ["light", "fridge"]
+    assert merged[1].substance_handling_types == []
+    assert merged[0].prescription_date == rows[0].prescription_date
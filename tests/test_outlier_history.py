@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from mobile import app
+from models.main import db, dbSession, User, PrescriptionAgg
+from models.prescription import Prescription, PrescriptionDrug
+from services import outlier_service
+
+ID_SEGMENT = 1
+ID_DRUG = 99999901
+
+
+def _add_prescription_drug(id, date, frequency):
+    p = Prescription()
+    p.id = id
+    p.idPatient = 99999901
+    p.idHospital = 1
+    p.idDepartment = 1
+    p.idSegment = ID_SEGMENT
+    p.date = date
+    p.status = "0"
+    db.session.add(p)
+
+    pd = PrescriptionDrug()
+    pd.id = id
+    pd.idOutlier = 0
+    pd.idPrescription = id
+    pd.idDrug = ID_DRUG
+    pd.idMeasureUnit = "mg"
+    pd.idFrequency = None
+    pd.idSegment = ID_SEGMENT
+    pd.dose = 10
+    pd.frequency = frequency
+    pd.status = "0"
+    db.session.add(pd)
+
+
+def _get_history():
+    return sorted(
+        [
+            (a.idFrequency, a.dose, a.frequency, a.countNum)
+            for a in db.session.query(PrescriptionAgg)
+            .filter(PrescriptionAgg.idDrug == ID_DRUG)
+            .filter(PrescriptionAgg.idSegment == ID_SEGMENT)
+            .all()
+        ]
+    )
+
+
+def _clear_history():
+    db.session.query(PrescriptionAgg).filter(PrescriptionAgg.idDrug == ID_DRUG).filter(
+        PrescriptionAgg.idSegment == ID_SEGMENT
+    ).delete(synchronize_session=False)
+
+
+def test_prescription_history_incremental(monkeypatch):
+    """Escores: Testa se o histórico incremental é igual ao completo (sem fkfrequencia)"""
+
+    user = User()
+    user.id = 0
+    user.schema = "demo"
+
+    first_window = (datetime(2020, 1, 1), datetime(2020, 4, 1))
+    window = (datetime(2020, 2, 1), datetime(2020, 6, 1))
+
+    with app.app_context():
+        dbSession.setSchema(user.schema)
+
+        try:
+            # same drug and dose, daily frequency without fkfrequencia
+            _add_prescription_drug(99999901, datetime(2020, 1, 10), 1)
+            _add_prescription_drug(99999902, datetime(2020, 3, 10), 1)
+            _add_prescription_drug(99999903, datetime(2020, 3, 10), 2)
+            _add_prescription_drug(99999904, datetime(2020, 5, 10), 2)
+            db.session.flush()
+
+            _clear_history()
+            outlier_service._insert_prescription_history(
+                schema=user.schema,
+                id_segment=ID_SEGMENT,
+                id_drug_list=[ID_DRUG],
+                start_date=window[0],
+                end_date=window[1],
+            )
+            full = _get_history()
+
+            _clear_history()
+            outlier_service._insert_prescription_history(
+                schema=user.schema,
+                id_segment=ID_SEGMENT,
+                id_drug_list=[ID_DRUG],
+                start_date=first_window[0],
+                end_date=first_window[1],
+            )
+
+            monkeypatch.setattr(outlier_service, "_get_history_window", lambda: window)
+            monkeypatch.setattr(
+                outlier_service, "_save_history_watermark", lambda **kwargs: None
+            )
+            outlier_service._update_prescription_history(
+                id_segment=ID_SEGMENT,
+                id_drug_list=[ID_DRUG],
+                watermark={
+                    str(ID_DRUG): {
+                        "start": first_window[0].isoformat(),
+                        "end": first_window[1].isoformat(),
+                    }
+                },
+                user_context=user,
+            )
+
+            assert len(full) == 2
+            assert _get_history() == full
+        finally:
+            db.session.rollback()
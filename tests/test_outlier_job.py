@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+from models.enums import OutlierJobStatusEnum
+from services import outlier_job_service, outlier_service
+
+
+def _mock_job(monkeypatch, generate):
+    jobs = {}
+    users = []
+
+    def get_job(id_segment, lock=False):
+        job = jobs.get(id_segment, None)
+        if job == None:
+            return None
+
+        return {**job, "folds": [dict(f) for f in job["folds"]]}
+
+    def save_job(id_segment, job, id_user):
+        jobs[id_segment] = {**job, "folds": [dict(f) for f in job["folds"]]}
+
+    def process_list(id_segment, user_context):
+        users.append(user_context)
+        return [
+            {"params": {"idDrugList": [1, 2]}},
+            {"params": {"idDrugList": [3]}},
+        ]
+
+    def generate_fold(id_drug, id_segment, fold, id_drug_list, user_context):
+        users.append(user_context)
+        generate(fold)
+
+    monkeypatch.setattr(outlier_job_service, "_get_job", get_job)
+    monkeypatch.setattr(outlier_job_service, "_save_job", save_job)
+    monkeypatch.setattr(outlier_service, "get_outliers_process_list", process_list)
+    monkeypatch.setattr(outlier_service, "generate", generate_fold)
+
+    save_job(
+        1,
+        {
+            "idSegment": 1,
+            "incremental": False,
+            "status": OutlierJobStatusEnum.QUEUED.value,
+            "updatedAt": datetime.now().isoformat(),
+            "heartbeatAt": datetime.now().isoformat(),
+            "folds": [],
+        },
+        0,
+    )
+
+    return jobs, users
+
+
+def test_outlier_job_run(monkeypatch):
+    """Escores: Testa a execução síncrona da geração de escores (sem jwt)"""
+
+    jobs, users = _mock_job(monkeypatch, generate=lambda fold: None)
+
+    outlier_job_service.run_job(1, 10, "demo", ["admin"])
+
+    assert jobs[1]["status"] == OutlierJobStatusEnum.DONE.value
+    assert [f["status"] for f in jobs[1]["folds"]] == [
+        OutlierJobStatusEnum.DONE.value,
+        OutlierJobStatusEnum.DONE.value,
+    ]
+    assert len(users) == 3
+    assert all(
+        u.id == 10 and u.schema == "demo" and u.config == {"roles": ["admin"]}
+        for u in users
+    )
+
+
+def test_outlier_job_run_error(monkeypatch):
+    """Escores: Testa a execução síncrona com erro em um fold"""
+
+    def generate(fold):
+        if fold == 2:
+            raise Exception("fold error")
+
+    jobs, _ = _mock_job(monkeypatch, generate=generate)
+
+    outlier_job_service.run_job(1, 10, "demo", ["admin"])
+
+    assert jobs[1]["status"] == OutlierJobStatusEnum.FAILED.value
+    assert jobs[1]["folds"][1]["error"] == "fold error"
+
+
+def test_outlier_job_stale():
+    """Escores: Testa a expiração do job pelo heartbeat"""
+
+    now = datetime.now()
+    job = {
+        "status": OutlierJobStatusEnum.RUNNING.value,
+        "updatedAt": now.isoformat(),
+        "heartbeatAt": (now - timedelta(minutes=10)).isoformat(),
+    }
+    assert outlier_job_service._is_active(job)
+
+    job["heartbeatAt"] = (
+        now - timedelta(minutes=outlier_job_service.JOB_STALE_MINUTES + 1)
+    ).isoformat()
+    assert not outlier_job_service._is_active(job)
@@ -0,0 +1,165 @@
+import io
+import pytest
+import numpy as np
+import pandas as pd
+
+from utils import outlier_lib
+
+
+def _get_drug_history(size: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame(
+        {
+            "medication": 1,
+            "dose": rng.choice([0.5, 1, 2, 5, 10, 20, 40], size).astype(float),
+            "frequency": rng.choice([1, 2, 3, 4, 6, 24], size).astype(float),
+            "count": rng.integers(1, 100, size),
+        }
+    )
+
+
+@pytest.mark.parametrize("metric", ["jaccard", "similarity", "euclidean"])
+@pytest.mark.parametrize("size", [1, 5, 40])
+def test_sparse_engine_same_scores(metric, size):
+    """Outlier lib: Testa se o motor esparso gera os mesmos escores do networkx"""
+
+    X = _get_drug_history(size).reset_index()
+
+    dense = outlier_lib.ddc_outlier(alpha=1, metric=metric)
+    dense.fit(X)
+
+    sparse = outlier_lib.ddc_outlier(
+        alpha=1, metric=metric, engine=outlier_lib.ENGINE_SPARSE
+    )
+    sparse.fit(X)
+
+    dense_pr = np.array(list(dense.pr.values()))
+    sparse_pr = np.array(list(sparse.pr.values()))
+
+    assert np.allclose(dense_pr, sparse_pr)
+    assert (
+        outlier_lib.minMaxScale(dense_pr) == outlier_lib.minMaxScale(sparse_pr)
+    ).all()
+
+
+def test_sparse_graph_neighbors():
+    """Outlier lib: Testa limite de vizinhos no grafo esparso"""
+
+    X = _get_drug_history(200)[["dose", "frequency"]].values
+
+    graph = outlier_lib.sparse_similarity_graph(X, metric="euclidean", n_neighbors=5)
+
+    assert graph.shape == (200, 200)
+    assert (graph != graph.T).nnz == 0
+    assert graph.nnz < 200 * 200
+
+
+def _legacy_build_model(selected, metric="jaccard"):
+    # implementation before the vectorized (dose, frequency) lookup
+    X = selected[["dose", "frequency", "count"]].reset_index()
+
+    ddc_j = outlier_lib.ddc_outlier(alpha=1, metric=metric)
+    ddc_j.fit(X)
+
+    medication = X
+    medication["pr"] = 0
+    for idx_frequency in ddc_j.frequency.index:
+        med_frequency = ddc_j.frequency.iloc[idx_frequency]
+        medication_index = medication[
+            (medication["dose"] == med_frequency["dose"])
+            & (medication["frequency"] == med_frequency["frequency"])
+        ].index
+        if len(medication_index) > 0:
+            medication.loc[medication_index, "pr"] = ddc_j.pr[idx_frequency]
+
+    pr_threshold = np.mean(np.array(list(ddc_j.pr.values())))
+    y_pred = medication["pr"].values
+    y_pred[y_pred < pr_threshold] = -1
+    y_pred[y_pred >= pr_threshold] = 1
+    selected["outlier_jaccard"] = y_pred
+
+    scores_mean_j = outlier_lib.minMaxScale(list(ddc_j.pr.values()))
+    for i, f in enumerate(ddc_j.frequency.values):
+        med_indexes = selected[
+            (selected["dose"] == f[1]) & (selected["frequency"] == f[2])
+        ].index
+        selected.loc[med_indexes, "score"] = scores_mean_j[i]
+
+    return selected
+
+
+def _get_fold_csv(drugs: int, seed: int = 0):
+    # fold training data (medication, dose, frequency, count) as csv
+    rng = np.random.default_rng(seed)
+    lines = ["medication,dose,frequency,count"]
+
+    for id_drug in range(1, drugs + 1):
+        pairs = set()
+        for _ in range(int(rng.integers(1, 60))):
+            pairs.add(
+                (
+                    round(float(rng.choice([0.5, 1, 2.5, 5, 10, 20, 40, 80])), 2),
+                    float(rng.choice([1, 2, 3, 4, 6, 12, 24])),
+                )
+            )
+
+        for dose, frequency in sorted(pairs):
+            lines.append(f"{id_drug},{dose},{frequency},{int(rng.integers(1, 500))}")
+
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_vectorized_build_model(seed):
+    """Outlier lib: Testa se o build_model vetorizado mantém os escores do fold"""
+
+    drugs = pd.read_csv(_get_fold_csv(drugs=10, seed=seed))
+
+    for id_drug in drugs["medication"].unique():
+        drugs_item = drugs[drugs["medication"] == id_drug]
+
+        expected = _legacy_build_model(drugs_item.copy())
+        result = outlier_lib.build_model(drugs_item.copy())
+
+        assert (result.index == expected.index).all()
+        assert (result["score"].values == expected["score"].values).all()
+        assert (
+            result["outlier_jaccard"].values == expected["outlier_jaccard"].values
+        ).all()
+
+
+def test_predict_repeated_dose_frequency():
+    """Outlier lib: Testa predict com dose e frequência repetidas"""
+
+    X = pd.DataFrame(
+        {"dose": [1.0, 1.0, 2.0], "frequency": [1.0, 1.0, 2.0], "count": [1, 2, 3]}
+    ).reset_index()
+
+    ddc = outlier_lib.ddc_outlier(alpha=1)
+    ddc.pr = {0: 0.1, 1: 0.2, 2: 0.7}
+    ddc.frequency = X
+
+    # last occurrence wins, as in the previous implementation
+    assert list(ddc.predict(X)) == [-1, -1, 1]
+
+
+def test_concat_scores():
+    """Outlier lib: Testa concatenação colunar dos escores do fold"""
+
+    drugs = pd.read_csv(_get_fold_csv(drugs=5))
+
+    results = []
+    expected = []
+    for _, drugs_item in drugs.groupby("medication", sort=False):
+        scores = outlier_lib.add_score(drugs_item.copy())
+        expected.append(scores)
+        results.append(outlier_lib.score_columns(scores))
+
+    new_os = outlier_lib.concat_scores(results)
+    expected_os = pd.concat(expected, ignore_index=True)
+
+    assert list(new_os.columns) == outlier_lib.SCORE_COLUMNS
+    assert len(new_os) == len(expected_os)
+    assert (new_os.values == expected_os.values).all()
+    assert len(outlier_lib.concat_scores([])) == 0
@@ -0,0 +1,62 @@
+from collections import namedtuple
+
+from config import Config
+from models.main import db
+from services import prescription_cache_service, relation_index_service
+
+
+class _MockRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key, None)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class _MockSession:
+    def __init__(self):
+        self.info = {}
+        self.queries = 0
+
+    def execute(self, query, params=None):
+        self.queries += 1
+        Result = namedtuple("Result", ["nratendimento", "version"])
+
+        return namedtuple("Rows", ["first"])(lambda: Result(10, "stamp"))
+
+
+def test_prescription_version(monkeypatch):
+    """Prescrição: Testa a versão da prescrição (carimbo do atendimento e relações)"""
+
+    session = _MockSession()
+    redis = _MockRedis()
+    versions = [(1, None)]
+    monkeypatch.setattr(Config, "RELATION_INDEX_TTL", 300)
+    monkeypatch.setattr(relation_index_service, "_get_version", lambda: versions[0])
+    monkeypatch.setattr(relation_index_service, "_load_relations", lambda: {})
+    relation_index_service._reset()
+    monkeypatch.setattr(db, "session", session)
+    monkeypatch.setattr(prescription_cache_service, "redis_client", redis)
+
+    admission_number, version = prescription_cache_service.get_version(
+        id_prescription=1, schema="demo"
+    )
+    assert admission_number == 10
+    assert prescription_cache_service.get_version(1, "demo")[1] == version
+
+    # relations: in-process version (no query per request)
+    assert session.queries == 2
+    relation_index_service._reset()
+    versions[0] = (2, None)
+    assert prescription_cache_service.get_version(1, "demo")[1] != version
+
+    # writes that do not touch update_at
+    version = prescription_cache_service.get_version(1, "demo")[1]
+    prescription_cache_service.invalidate(schema="demo", admission_number=10)
+    assert prescription_cache_service.get_version(1, "demo")[1] != version
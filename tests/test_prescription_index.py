@@ -0,0 +1,82 @@
+from models.prescription import Prescription
+from services import prescription_index_service
+
+
+def test_prescription_index_values():
+    """Priorização: Testa os valores do índice a partir dos indicadores"""
+
+    features = {
+        "globalScore": 12,
+        "alertStats": {
+            "total": 3,
+            "kidney": 1,
+            "liver": 0,
+            "level": "high",
+            "it": 2,
+            "interactions": {"it": 2, "dm": 0},
+        },
+        "drugAttributes": {"am": 1, "av": 0},
+        "substanceIDs": [111, 222],
+        "substanceClassIDs": ["J01"],
+        "frequencies": ["12/12"],
+        "intervals": ["08", "20"],
+        "diff": 0,
+        "interventions": 1,
+        "alertLevel": "high",
+    }
+
+    values = prescription_index_service.get_index_values(1, features)
+
+    assert values["globalScore"] == 12
+    assert sorted(values["alerts"]) == ["it", "kidney", "total"]
+    assert values["drugAttributes"] == ["am"]
+    assert values["substances"] == [111, 222]
+    assert values["substanceClasses"] == ["J01"]
+    assert values["frequencies"] == ["12/12"]
+    assert values["intervals"] == ["08", "20"]
+    assert values["diff"] == 0
+    assert values["interventions"] == 1
+    assert values["alertLevel"] == "high"
+
+
+def test_prescription_index_values_empty():
+    """Priorização: Testa os valores do índice sem indicadores calculados"""
+
+    values = prescription_index_service.get_index_values(1, {"alertStats": None})
+
+    assert values["globalScore"] == None
+    assert values["alerts"] == []
+    assert values["substances"] == []
+    assert values["diff"] == None
+
+
+def test_prescription_index_values_null_substance():
+    """Priorização: Testa o índice com substância sem identificador"""
+
+    values = prescription_index_service.get_index_values(
+        1, {"substanceIDs": [111, None, 222]}
+    )
+
+    assert values["substances"] == [111, 222]
+
+
+def test_prescription_index_write_flag(monkeypatch):
+    """Priorização: Testa a atualização do índice somente com a flag de escrita"""
+
+    rows = []
+    flags = {"enabled": False}
+    monkeypatch.setattr(prescription_index_service, "_upsert", rows.extend)
+    monkeypatch.setattr(
+        prescription_index_service, "is_write_enabled", lambda: flags["enabled"]
+    )
+
+    prescription = Prescription()
+    prescription.id = 1
+    prescription.features = {"globalScore": 3}
+
+    prescription_index_service.update_index(prescription=prescription)
+    assert rows == []
+
+    flags["enabled"] = True
+    prescription_index_service.update_index(prescription=prescription)
+    assert [r["globalScore"] for r in rows] == [3]
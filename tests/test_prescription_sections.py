@@ -0,0 +1,49 @@
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from mobile import app
+from models.main import db
+from models.prescription import Prescription
+from services import prescription_view_service
+
+
+def _get_request_prescription():
+    # persistent instance of another session (request session), no query
+    prescription = Prescription()
+    prescription.id = 1
+    prescription.admissionNumber = 10
+    make_transient_to_detached(prescription)
+
+    session = Session()
+    session.add(prescription)
+
+    return prescription
+
+
+def test_section_kwargs():
+    """Prescrição: Testa a cópia das instâncias do ORM para a sessão da seção"""
+
+    prescription = _get_request_prescription()
+    config_data = {"is_cpoe": False}
+
+    with app.app_context():
+        kwargs = prescription_view_service._get_section_kwargs(
+            {"prescription": prescription, "config_data": config_data}
+        )
+
+        assert kwargs["config_data"] is config_data
+        assert kwargs["prescription"] is not prescription
+        assert kwargs["prescription"] in db.session
+        assert kwargs["prescription"].id == 1
+        assert kwargs["prescription"].admissionNumber == 10
+
+
+def test_section_pending_changes():
+    """Prescrição: Testa a execução sequencial com alterações pendentes"""
+
+    prescription = _get_request_prescription()
+    sections = {"last_dept": (None, {"prescription": prescription})}
+
+    assert not prescription_view_service._has_pending_changes(sections)
+
+    prescription.admissionNumber = 11
+    assert prescription_view_service._has_pending_changes(sections)
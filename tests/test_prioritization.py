@@ -0,0 +1,137 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    column,
+    create_engine,
+    desc,
+    insert,
+    literal_column,
+    select,
+    table,
+    text,
+)
+
+from mobile import app
+from models.prescription import Prescription
+from services import prioritization_service
+from exception.validation_error import ValidationError
+
+
+def test_prioritization_cursor():
+    """Priorização: Testa a codificação do cursor da paginação"""
+
+    cursor = prioritization_service._encode_cursor(value=25, id=1020)
+    assert prioritization_service._decode_cursor(cursor) == (25, 1020)
+
+    cursor = prioritization_service._encode_cursor(value=None, id=3)
+    assert prioritization_service._decode_cursor(cursor) == (None, 3)
+
+    for invalid in ["abc", prioritization_service._encode_cursor([1], 1)]:
+        with pytest.raises(ValidationError) as e:
+            prioritization_service._decode_cursor(invalid)
+
+        assert e.value.code == "errors.invalidParams"
+
+
+def test_prioritization_page_size():
+    """Priorização: Testa o tamanho de página da paginação"""
+
+    assert prioritization_service._get_page_size(None) == 500
+    assert prioritization_service._get_page_size("50") == 50
+    assert prioritization_service._get_page_size(10000) == 500
+
+    for invalid in ["0", "abc"]:
+        with pytest.raises(ValidationError):
+            prioritization_service._get_page_size(invalid)
+
+
+def _keyset_fixture():
+    engine = create_engine("sqlite://")
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "create table prescricao "
+                "(fkprescricao integer, dtprescricao timestamp, escore integer)"
+            )
+        )
+        conn.execute(
+            insert(
+                table(
+                    "prescricao",
+                    column("fkprescricao"),
+                    column("dtprescricao", DateTime),
+                    column("escore"),
+                )
+            ),
+            [
+                {
+                    "fkprescricao": id,
+                    "dtprescricao": datetime(2024, 1, day, 10),
+                    "escore": score,
+                }
+                for id, day, score in [
+                    (1, 1, 5),
+                    (2, 2, None),
+                    (3, 2, 10),
+                    (4, 3, 5),
+                    (5, 1, None),
+                    (6, 2, 5),
+                    (7, 4, 0),
+                ]
+            ],
+        )
+
+    return engine
+
+
+def _read_pages(engine, sort_column, cursor_value, page_size=2):
+    q = select(Prescription.id, Prescription.date, sort_column.label("escore"))
+    q = q.order_by(desc(sort_column).nulls_first(), desc(Prescription.id))
+
+    ids = []
+    cursor = None
+    with engine.connect() as conn:
+        for _ in range(10):
+            rows = conn.execute(
+                prioritization_service._filter_after_cursor(
+                    q=q, sort_column=sort_column, cursor=cursor
+                ).limit(page_size)
+            ).all()
+            ids += [r.fkprescricao for r in rows]
+
+            if len(rows) < page_size:
+                return ids
+
+            cursor = prioritization_service._encode_cursor(
+                value=cursor_value(rows[-1]), id=rows[-1].fkprescricao
+            )
+
+
+def test_prioritization_keyset_filter():
+    """Priorização: Testa a paginação após o cursor (escore e data)"""
+
+    engine = _keyset_fixture()
+    score = literal_column("prescricao.escore", Integer)
+
+    # null scores first, ties by id
+    assert _read_pages(engine, score, lambda r: r.escore) == [5, 2, 3, 6, 4, 1, 7]
+
+    assert _read_pages(
+        engine, Prescription.date, lambda r: r.dtprescricao.isoformat()
+    ) == [7, 4, 6, 3, 2, 5, 1]
+
+    q = select(Prescription.id)
+    with pytest.raises(ValidationError):
+        prioritization_service._filter_after_cursor(
+            q=q,
+            sort_column=Prescription.date,
+            cursor=prioritization_service._encode_cursor(value=10, id=5),
+        )
+
+    assert (
+        prioritization_service._filter_after_cursor(q=q, sort_column=score, cursor=None)
+        is q
+    )
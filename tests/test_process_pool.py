@@ -0,0 +1,78 @@
+import os
+import pytest
+
+from utils.process_pool import ProcessPool
+
+
+def _square(value):
+    return value * value
+
+
+def _fail(value):
+    if value == 3:
+        raise ValueError("invalid value")
+
+    return value
+
+
+def test_map_keeps_order():
+    """Process pool: Testa se os resultados mantêm a ordem dos itens"""
+
+    pool = ProcessPool(workers=2)
+
+    try:
+        assert pool.map(_square, [(i,) for i in range(25)], chunk_size=3) == [
+            i * i for i in range(25)
+        ]
+        assert pool.map(_square, []) == []
+    finally:
+        pool.terminate()
+
+
+def test_map_reuses_workers_after_error():
+    """Process pool: Testa propagação de erro e reaproveitamento dos workers"""
+
+    pool = ProcessPool(workers=2)
+
+    try:
+        with pytest.raises(ValueError):
+            pool.map(_fail, [(i,) for i in range(6)], chunk_size=1)
+
+        pids = [process.pid for process, _ in pool.workers]
+
+        assert pool.map(_square, [(2,), (3,)]) == [4, 9]
+        assert [process.pid for process, _ in pool.workers] == pids
+    finally:
+        pool.terminate()
+
+
+def _exit(value):
+    os._exit(1)
+
+
+def test_map_restarts_dead_workers(monkeypatch):
+    """Process pool: Testa a recuperação do pool após a morte de um worker"""
+
+    pool = ProcessPool(workers=2)
+
+    try:
+        with pytest.raises(ChildProcessError):
+            pool.map(_exit, [(1,)])
+
+        assert pool.workers == []
+        assert pool.map(_square, [(2,), (3,)]) == [4, 9]
+
+        # worker killed while idle: send fails on the broken pipe
+        for process, _ in pool.workers:
+            process.kill()
+            process.join()
+
+        with monkeypatch.context() as m:
+            m.setattr(pool, "_start_workers", lambda: None)
+
+            with pytest.raises(ChildProcessError):
+                pool.map(_square, [(2,), (3,)])
+
+        assert pool.map(_square, [(2,), (3,)]) == [4, 9]
+    finally:
+        pool.terminate()
@@ -0,0 +1,45 @@
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from decorators.timed_decorator import timed
+from utils import profilerutils
+
+
+@timed()
+def _stage(engine):
+    with engine.connect() as connection:
+        connection.execute(text("select 1"))
+        connection.execute(text("select 2"))
+
+
+def test_request_profiler():
+    """Profiler: Testa o registro de etapas e comandos sql da requisição"""
+
+    engine = create_engine("sqlite://")
+
+    with Flask(__name__).app_context():
+        profiler = profilerutils.start()
+
+        _stage(engine)
+        _stage(engine)
+
+        data = profiler.to_dict()
+        server_timing = profiler.server_timing()
+
+    assert data["sql"]["count"] == 4
+    assert data["stages"]["_stage"]["count"] == 2
+    assert server_timing.startswith("sql;dur=")
+    assert 'desc="4 queries"' in server_timing
+    assert "_stage;dur=" in server_timing
+    assert "total;dur=" in server_timing
+
+
+def test_request_profiler_disabled():
+    """Profiler: Testa se nada é registrado sem profiler na requisição"""
+
+    engine = create_engine("sqlite://")
+
+    with Flask(__name__).app_context():
+        _stage(engine)
+
+        assert profilerutils.get_profiler() == None
@@ -0,0 +1,77 @@
+from config import Config
+from services import relation_index_service
+
+
+def _mock_index(monkeypatch, versions: list):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {(211111, 111111, "it"): ("Drug A interacts with Drug B", "high")}
+
+    monkeypatch.setattr(Config, "RELATION_INDEX_TTL", 300)
+    monkeypatch.setattr(relation_index_service, "_get_version", lambda: versions[0])
+    monkeypatch.setattr(relation_index_service, "_load_relations", load)
+    relation_index_service._reset()
+
+    return loads
+
+
+def test_relation_index(monkeypatch):
+    """Relações: Testa a busca de relações ativas no índice em memória"""
+
+    loads = _mock_index(monkeypatch, versions=[(1, None)])
+
+    relations = relation_index_service.get_relations(
+        pairs=[(211111, 111111), (111111, 211111)], kinds=["it", "dt"]
+    )
+
+    assert relations == {
+        "211111-111111-it": {
+            "sctida": 211111,
+            "sctidb": 111111,
+            "kind": "it",
+            "text": "Drug A interacts with Drug B",
+            "level": "high",
+        }
+    }
+
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+
+    assert len(loads) == 1
+
+
+def test_relation_index_version(monkeypatch):
+    """Relações: Testa a recarga do índice de relações após alteração de versão"""
+
+    versions = [(1, None)]
+    loads = _mock_index(monkeypatch, versions=versions)
+
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+
+    # new version: checked only after ttl
+    versions[0] = (2, None)
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+    assert len(loads) == 1
+
+    monkeypatch.setattr(
+        relation_index_service,
+        "_index",
+        dict(relation_index_service._index, checked_at=None),
+    )
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+    assert len(loads) == 2
+
+    # same version after ttl: no reload
+    monkeypatch.setattr(
+        relation_index_service,
+        "_index",
+        dict(relation_index_service._index, checked_at=None),
+    )
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+    assert len(loads) == 2
+
+    # invalidated (upsert_relation)
+    relation_index_service._reset()
+    relation_index_service.get_relations(pairs=[(1, 2)], kinds=["it"])
+    assert len(loads) == 3
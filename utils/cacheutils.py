@@ -0,0 +1,28 @@
+from flask import g, has_app_context
+
+REFERENCE_CACHE_KEY = "reference_cache"
+
+
+def enable_reference_cache():
+    """
+    Share reference data (memory configs, segment exams) between the
+    prescriptions processed in the same request (ex: prescalc batch)
+    """
+    setattr(g, REFERENCE_CACHE_KEY, {})
+
+
+def clear_reference_cache():
+    # orm objects are expired on commit
+    if g.get(REFERENCE_CACHE_KEY, None) != None:
+        setattr(g, REFERENCE_CACHE_KEY, {})
+
+
+def get_reference(key, loader):
+    if not has_app_context() or g.get(REFERENCE_CACHE_KEY, None) == None:
+        return loader()
+
+    cache = g.get(REFERENCE_CACHE_KEY)
+    if key not in cache:
+        cache[key] = loader()
+
+    return cache[key]
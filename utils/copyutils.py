@@ -0,0 +1,93 @@
+import numpy as np
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_TRAILER = b"\xff\xff"
+
+# bytes kept in the buffer before decoding (psycopg2 writes one row per call)
+DECODE_SIZE = 2**20
+
+
+class BinaryCopyReader:
+    """
+    File-like target for cursor.copy_expert("COPY (...) TO STDOUT WITH BINARY", reader).
+    Rows are decoded in blocks straight into typed numpy arrays, so the raw output
+    is never held in memory as a whole.
+    Only fixed size, not null columns are supported (ex: int8, float8).
+    """
+
+    def __init__(self, columns: list, decode_size: int = DECODE_SIZE):
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.row_dtype = np.dtype(
+            [("fields", ">i2")]
+            + [
+                field
+                for name, dtype in self.columns
+                for field in [
+                    (f"{name}_size", ">i4"),
+                    (name, dtype.newbyteorder(">")),
+                ]
+            ]
+        )
+        self.decode_size = max(decode_size, self.row_dtype.itemsize)
+        self.buffer = bytearray()
+        self.header = False
+        self.blocks = []
+
+    def write(self, data):
+        self.buffer += data
+
+        if len(self.buffer) >= self.decode_size:
+            self._decode()
+
+        return len(data)
+
+    def arrays(self) -> dict:
+        self._decode()
+
+        if self.header and bytes(self.buffer) != COPY_TRAILER:
+            raise ValueError("invalid binary copy trailer")
+
+        return {
+            name: (
+                np.concatenate([block[name] for block in self.blocks])
+                if len(self.blocks) > 0
+                else np.array([], dtype=dtype)
+            )
+            for name, dtype in self.columns
+        }
+
+    def _decode(self):
+        if not self.header:
+            # signature + flags + header extension length (+ extension)
+            if len(self.buffer) < len(COPY_SIGNATURE) + 8:
+                return
+
+            if bytes(self.buffer[: len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+                raise ValueError("invalid binary copy signature")
+
+            start = len(COPY_SIGNATURE) + 4
+            extension = int.from_bytes(self.buffer[start : start + 4], "big")
+            if len(self.buffer) < start + 4 + extension:
+                return
+
+            del self.buffer[: start + 4 + extension]
+            self.header = True
+
+        rows = len(self.buffer) // self.row_dtype.itemsize
+        if rows == 0:
+            return
+
+        size = rows * self.row_dtype.itemsize
+        block = np.frombuffer(bytes(self.buffer[:size]), dtype=self.row_dtype)
+        del self.buffer[:size]
+
+        if (block["fields"] != len(self.columns)).any():
+            raise ValueError("unexpected number of columns in binary copy")
+
+        for name, dtype in self.columns:
+            if (block[f"{name}_size"] != dtype.itemsize).any():
+                raise ValueError(f"null or variable size value in column {name}")
+
+        self.blocks.append(
+            {name: block[name].astype(dtype) for name, dtype in self.columns}
+        )
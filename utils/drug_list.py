@@ -341,6 +341,68 @@ class DrugList:
 
         return pDrugs
 
+    def getFeatureDrugs(self, source):
+        """
+        Same items as getDrugType, restricted to the attributes used by
+        prescriptionutils.getFeatures (no labels, doses, notes or interventions)
+        """
+        pDrugs = []
+        for pd in self.drugList:
+            if pd[0].source is None:
+                pd[0].source = "Medicamentos"
+            if pd[0].source not in source:
+                continue
+
+            pdWhiteList = bool(pd[6].whiteList) if pd[6] is not None else False
+
+            alerts_complete = []
+            if self.relations["alerts"] and str(pd[0].id) in self.relations["alerts"]:
+                alerts_complete.extend(self.relations["alerts"][str(pd[0].id)])
+
+            if self.alerts["alerts"] and str(pd[0].id) in self.alerts["alerts"]:
+                alerts_complete.extend(self.alerts["alerts"][str(pd[0].id)])
+
+            tubeAlert = bool(
+                self.exams
+                and pd[6]
+                and not bool(pd[0].suspendedDate)
+                and pd[6].tube
+                and pd[0].tube
+            )
+
+            pDrugs.append(
+                {
+                    "idPrescription": str(pd[0].idPrescription),
+                    "idDrug": pd[0].idDrug,
+                    "idDepartment": pd.idDepartment,
+                    "np": pd[6].notdefault if pd[6] is not None else False,
+                    "am": pd[6].antimicro if pd[6] is not None else False,
+                    "av": pd[6].mav if pd[6] is not None else False,
+                    "c": pd[6].controlled if pd[6] is not None else False,
+                    "allergy": bool(pd[0].allergy == "S"),
+                    "whiteList": pdWhiteList,
+                    "frequency": {
+                        "value": (
+                            pd[3].id
+                            if pd[3]
+                            else stringutils.strNone(pd[0].idFrequency)
+                        )
+                    },
+                    "interval": pd[0].interval,
+                    "score": str(pd[5]) if not pdWhiteList else "0",
+                    "checked": bool(pd[0].checked or pd[9] == "s"),
+                    "suspended": bool(pd[0].suspendedDate),
+                    "alertsComplete": alerts_complete,
+                    "tubeAlert": tubeAlert,
+                    "idSubstance": pd[11].id if pd[11] != None else None,
+                    "idSubstanceClass": pd[11].idclass if pd[11] != None else None,
+                    "drugAttributes": drug_service.to_dict(pd[6]),
+                    "prescriptionDate": to_iso(pd.prescription_date),
+                }
+            )
+
+        return pDrugs
+
     def getInfusionKey(self, pd):
         if self.is_cpoe:
             return pd[0].cpoe_group if pd[0].cpoe_group else pd[0].solutionGroup
@@ -1,33 +1,52 @@
 import numpy as np
 import pandas as pd
 import networkx as nx
+from scipy import sparse
 from sklearn.metrics.pairwise import pairwise_distances, cosine_similarity
 from sklearn.preprocessing import minmax_scale
 import warnings
 warnings.filterwarnings('ignore')
 
+ENGINE_NETWORKX = 'networkx'
+ENGINE_SPARSE = 'sparse'
+
+SCORE_COLUMNS = ['medication', 'frequency', 'dose', 'count', 'score']
+
+# max number of similarity values held in memory while building the sparse graph
+BLOCK_SIZE = 2**22
+
 class ddc_outlier():
     y_pred = []
     pr = {}
     frequency = pd.DataFrame([])
     alpha = 0.5
     metric = 'similarity'
+    engine = ENGINE_NETWORKX
+    n_neighbors = 50
+    threshold = None
     sim_matrix = np.zeros((1,1))
 
-    def __init__(self, alpha=0.5, metric='similarity'):
+    def __init__(self, alpha=0.5, metric='similarity', engine=ENGINE_NETWORKX, n_neighbors=50, threshold=None):
         self.alpha = alpha
         self.metric = metric
+        self.engine = engine
+        self.n_neighbors = n_neighbors
+        self.threshold = threshold
     
     def fit(self, X):
         self.frequency = X
         X = self.frequency[['dose','frequency']].values.astype(float)
         try:
-            if self.metric == 'similarity':
-                self.sim_matrix = cosine_similarity(X,X)
+            if self.engine == ENGINE_SPARSE:
+                self.sim_matrix = sparse_similarity_graph(X, metric=self.metric, n_neighbors=self.n_neighbors, threshold=self.threshold)
+                self.pr = sparse_pagerank(self.sim_matrix, alpha=0.9, max_iter=1000, personalization=self.frequency['count'].values)
             else:
-                self.sim_matrix = pairwise_distances(X,X,self.metric)
-            medication_graph = nx.from_numpy_array(self.sim_matrix)
-            self.pr = nx.pagerank(medication_graph, alpha=0.9, max_iter=1000, personalization=dict(self.frequency['count']))
+                if self.metric == 'similarity':
+                    self.sim_matrix = cosine_similarity(X,X)
+                else:
+                    self.sim_matrix = pairwise_distances(X,X,self.metric)
+                medication_graph = nx.from_numpy_array(self.sim_matrix)
+                self.pr = nx.pagerank(medication_graph, alpha=0.9, max_iter=1000, personalization=dict(self.frequency['count']))
         except:
             self.pr = dict(enumerate(np.zeros((len(X),1)).flatten()))
     
@@ -38,14 +57,8 @@ class ddc_outlier():
         medication = X
         medication['pr'] = 0
 
-        for idx_frequency in self.frequency.index:
-            med_frequency = self.frequency.iloc[idx_frequency]
-            medication_index = medication[
-                                        (medication['dose'] == med_frequency['dose']) &
-                                        (medication['frequency'] == med_frequency['frequency'])
-                                        ].index
-            if len(medication_index) > 0:
-                medication.loc[medication_index,'pr'] = self.pr[idx_frequency]
+        pr = map_by_dose_frequency(self.frequency, self.frequency.index.map(self.pr), medication)
+        medication['pr'] = np.where(np.isnan(pr), medication['pr'], pr)
         
         pr_threshold = np.mean(np.array(list(self.pr.values())))
 
@@ -60,7 +73,81 @@ def minMaxScale(scores):
     b = np.where(a < 1, a, 1)
     return np.abs(np.round(minmax_scale(b, feature_range=(0,3)) - 3))
 
-def build_model(selected, metric='jaccard'):
+def map_by_dose_frequency(source, values, target):
+    # value of the last source row with the same (dose, frequency) of each target row (nan if none)
+    lookup = pd.Series(
+        np.asarray(values, dtype=float),
+        index=pd.MultiIndex.from_arrays([source['dose'].values, source['frequency'].values])
+    )
+    lookup = lookup[source[['dose','frequency']].notna().all(axis=1).values]
+    lookup = lookup[~lookup.index.duplicated(keep='last')]
+
+    return lookup.reindex(
+        pd.MultiIndex.from_arrays([target['dose'].values, target['frequency'].values])
+    ).values
+
+def sparse_similarity_graph(X, metric='similarity', n_neighbors=50, threshold=None, block_size=BLOCK_SIZE):
+    # same edges as nx.from_numpy_array(dense matrix), keeping only the n_neighbors
+    # strongest edges of each node (and the ones above threshold, if informed)
+    n = len(X)
+    step = max(1, block_size // max(n, 1))
+    rows, cols, data = [], [], []
+
+    for start in range(0, n, step):
+        block = X[start:start + step]
+        if metric == 'similarity':
+            weights = cosine_similarity(block, X)
+        else:
+            weights = pairwise_distances(block, X, metric)
+
+        if threshold is not None:
+            weights[weights < threshold] = 0
+
+        if n_neighbors is not None and n_neighbors < n:
+            neighbors = np.argpartition(-weights, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        else:
+            neighbors = np.tile(np.arange(n), (len(block), 1))
+
+        rows.append(np.repeat(np.arange(start, start + len(block)), neighbors.shape[1]))
+        cols.append(neighbors.ravel())
+        data.append(np.take_along_axis(weights, neighbors, axis=1).ravel())
+
+    graph = sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)
+    )
+    graph.eliminate_zeros()
+
+    # undirected graph: keep the edge if any of the nodes selected it
+    return graph.maximum(graph.T).tocsr()
+
+def sparse_pagerank(graph, personalization, alpha=0.85, max_iter=100, tol=1.0e-6):
+    # power iteration equivalent to nx.pagerank (dangling nodes follow personalization)
+    n = graph.shape[0]
+    if n == 0:
+        return {}
+
+    out_weight = np.asarray(graph.sum(axis=1)).flatten()
+    inverse = np.zeros(n)
+    inverse[out_weight != 0] = 1.0 / out_weight[out_weight != 0]
+    transition = (sparse.diags(inverse) @ graph).T.tocsr()
+
+    p = np.asarray(personalization, dtype=float)
+    if p.sum() == 0:
+        raise ZeroDivisionError
+    p = p / p.sum()
+
+    is_dangling = np.where(out_weight == 0)[0]
+    x = np.repeat(1.0 / n, n)
+
+    for _ in range(max_iter):
+        xlast = x
+        x = alpha * (transition @ x + x[is_dangling].sum() * p) + (1 - alpha) * p
+        if np.absolute(x - xlast).sum() < n * tol:
+            return dict(zip(range(n), map(float, x)))
+
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+def build_model(selected, metric='jaccard', engine=ENGINE_NETWORKX, n_neighbors=50):
     if len(selected) == 0: 
         print('No prescriptions')
         return 0
@@ -68,25 +155,31 @@ def build_model(selected, metric='jaccard'):
     X = selected[['dose','frequency','count']].reset_index()
 
     # compute scores
-    ddc_j = ddc_outlier(alpha=1, metric=metric)
+    ddc_j = ddc_outlier(alpha=1, metric=metric, engine=engine, n_neighbors=n_neighbors)
     ddc_j.fit(X)
     selected['outlier_jaccard'] = ddc_j.predict(X)
     scores_mean_j = minMaxScale(list(ddc_j.pr.values()))
 
     # propagate scores
-    for i, f in enumerate(ddc_j.frequency.values):
-        med_indexes = selected[(selected['dose']==f[1]) & (selected['frequency']==f[2])].index
-        selected.loc[med_indexes, 'score'] = scores_mean_j[i]
+    selected['score'] = map_by_dose_frequency(ddc_j.frequency, scores_mean_j, selected)
 
     return selected
 
-def add_score(drugsItem):
-   
-    columns = ['medication', 'frequency', 'dose', 'count', 'score']
-    models = pd.DataFrame(columns=columns)
+def add_score(drugsItem, engine=ENGINE_NETWORKX, n_neighbors=50):
+    result = build_model(drugsItem, engine=engine, n_neighbors=n_neighbors)
+
+    return result[SCORE_COLUMNS].groupby(SCORE_COLUMNS).count().reset_index()
+
+def score_columns(scores):
+    # columnar representation of add_score results (cheap to pickle and to concatenate)
+    return {column: scores[column].values for column in SCORE_COLUMNS}
 
-    result = build_model(drugsItem)
-    selected = result[columns].groupby(columns).count().reset_index()
-    models = models.append(selected)
+def concat_scores(columns_list):
+    # single concatenation for all the drugs in a fold
+    if len(columns_list) == 0:
+        return pd.DataFrame(columns=SCORE_COLUMNS)
 
-    return models
\ No newline at end of file
+    return pd.DataFrame({
+        column: np.concatenate([columns[column] for columns in columns_list])
+        for column in SCORE_COLUMNS
+    })
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import threading
+from math import ceil
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+
+
+# Pool built on Process + Pipe only: multiprocessing.Pool and concurrent.futures
+# depend on semaphores (/dev/shm), which are not available on AWS Lambda.
+class ProcessPool:
+    def __init__(self, workers: int = None):
+        self.size = workers if workers else (os.cpu_count() or 1)
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def map(self, func, items: list, chunk_size: int = None):
+        """
+        Run func(*item) for every item using the pool workers.
+        Items are sent in chunks and results are returned in the same order.
+        """
+        if len(items) == 0:
+            return []
+
+        if chunk_size is None:
+            chunk_size = max(1, ceil(len(items) / (self.size * 4)))
+
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        with self.lock:
+            self._start_workers()
+
+            results = [None] * len(chunks)
+            pending = list(enumerate(chunks))
+            idle = [conn for _, conn in self.workers]
+            busy = {}
+            error = None
+
+            while busy or (pending and error is None):
+                while pending and idle and error is None:
+                    conn = idle.pop()
+                    index, chunk = pending.pop(0)
+                    try:
+                        conn.send((func, chunk))
+                    except (BrokenPipeError, ConnectionResetError):
+                        self._worker_exited()
+
+                    busy[conn] = index
+
+                for conn in wait(list(busy.keys())):
+                    index = busy.pop(conn)
+
+                    try:
+                        success, value = conn.recv()
+                    except (EOFError, ConnectionResetError):
+                        self._worker_exited()
+
+                    idle.append(conn)
+
+                    if success:
+                        results[index] = value
+                    elif error is None:
+                        # wait for busy workers before raising, so no results are left in the pipes
+                        error = value
+
+            if error is not None:
+                raise error
+
+        return [result for chunk in results for result in chunk]
+
+    def terminate(self):
+        for process, conn in self.workers:
+            conn.close()
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+        self.workers = []
+
+    def _worker_exited(self):
+        # worker died (oom, killed): discard all workers, the next map starts new ones
+        self.terminate()
+        raise ChildProcessError("outlier worker exited unexpectedly")
+
+    def _start_workers(self):
+        alive = []
+        for process, conn in self.workers:
+            if process.is_alive():
+                alive.append((process, conn))
+            else:
+                conn.close()
+                process.join()
+
+        while len(alive) < self.size:
+            parent_conn, child_conn = Pipe()
+            process = Process(target=_worker, args=(child_conn,), daemon=True)
+            process.start()
+            child_conn.close()
+            alive.append((process, parent_conn))
+
+        self.workers = alive
+
+
+def _worker(conn):
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+
+        func, chunk = task
+        try:
+            conn.send((True, [func(*item) for item in chunk]))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # exception could not be pickled
+                conn.send((False, RuntimeError(repr(e))))
+
+    conn.close()
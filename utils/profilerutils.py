@@ -0,0 +1,89 @@
+import time
+import threading
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILER_KEY = "profiler"
+
+
+class RequestProfiler:
+    """
+    Stages (@timed) and sql statements of the current request
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.sql = {"count": 0, "duration": 0}
+        self.lock = threading.Lock()
+
+    def add_stage(self, name: str, duration: float):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"count": 0, "duration": 0})
+            stage["count"] += 1
+            stage["duration"] += duration
+
+    def add_sql(self, duration: float):
+        with self.lock:
+            self.sql["count"] += 1
+            self.sql["duration"] += duration
+
+    def server_timing(self):
+        # durations in ms (https://www.w3.org/TR/server-timing/)
+        metrics = [
+            f'sql;dur={self.sql["duration"] * 1000:.1f};desc="{self.sql["count"]} queries"'
+        ]
+        for name, stage in self.stages.items():
+            metrics.append(f"{name};dur={stage['duration'] * 1000:.1f}")
+
+        metrics.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+
+        return ", ".join(metrics)
+
+    def to_dict(self):
+        return {
+            "total": round(time.perf_counter() - self.start, 4),
+            "sql": {
+                "count": self.sql["count"],
+                "duration": round(self.sql["duration"], 4),
+            },
+            "stages": {
+                name: {"count": s["count"], "duration": round(s["duration"], 4)}
+                for name, s in self.stages.items()
+            },
+        }
+
+
+def start() -> RequestProfiler:
+    profiler = RequestProfiler()
+    setattr(g, PROFILER_KEY, profiler)
+
+    return profiler
+
+
+def get_profiler() -> RequestProfiler:
+    if not has_app_context():
+        return None
+
+    return g.get(PROFILER_KEY, None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if get_profiler() != None:
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiler = get_profiler()
+    if profiler != None and conn.info.get("profiler_start"):
+        profiler.add_sql(time.perf_counter() - conn.info["profiler_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection != None and connection.info.get("profiler_start"):
+        connection.info["profiler_start"].pop()